@@ -1,23 +1,60 @@
-import io
 import struct
 
+import numpy as np
+
+# A-block: b'#A', a big-endian 16-bit byte count, then the data.
+_HEADER = struct.Struct(">ccH")
+HEADER_SIZE = _HEADER.size
+U16 = np.dtype(">u2")
+
+
+def ablock_size(n):
+    """Returns the size in bytes of an A-block holding n 16-bit values."""
+    return HEADER_SIZE + n * U16.itemsize
+
+
+def _check_header(data):
+    n = len(data)
+    if n < HEADER_SIZE:
+        raise ValueError(f"A-block too short ({n} bytes)")
+    (pound, cap_a, blen) = _HEADER.unpack_from(data)
+    if pound != b'#' or cap_a != b'A':
+        raise ValueError(f"Not an A-block (header {bytes(data[:2])!r})")
+    if blen != n - HEADER_SIZE:
+        raise ValueError(f"A-block length {blen} does not match "
+                         f"{n - HEADER_SIZE} data bytes")
+    if blen % U16.itemsize != 0:
+        raise ValueError(f"A-block length {blen} is not a multiple of 2")
+    return blen // U16.itemsize
+
+
 def to_ablock_u16(values):
-    with io.BytesIO() as b:
-        n = len(values)
-        b.write(struct.pack(">cch", b'#', b'A', n * 2))
-        for value in values:
-            b.write(value.to_bytes(2, 'big'))
-        return b.getvalue()
-
-@staticmethod
-def from_ablock_u16(bytes):
-    n = len(bytes)
-    assert n >= 4
-    (pound, cap_a, blen) = struct.unpack(">cch", bytes[0:4])
-    assert pound == b'#'
-    assert cap_a == b'A'
-    assert blen == n - 4
-    assert blen % 2 == 0
-    return [int.from_bytes(bytes[i:i+2], byteorder='big')
-            for i in range(4, n, 2)]
+    """Encodes values as an A-block of big-endian unsigned 16-bit ints."""
+    values = np.asarray(values)
+    if values.size and (values.min() < 0 or values.max() > 0xffff):
+        raise ValueError("A-block values must fit in 16 bits")
+    data = values.astype(U16, copy=False).tobytes()
+    return _HEADER.pack(b'#', b'A', len(data)) + data
+
+
+def from_ablock_u16(data):
+    """Decodes an A-block into a read-only big-endian uint16 array.
+
+    The array is a view onto data; nothing is copied.
+    """
+    n = _check_header(data)
+    return np.frombuffer(data, dtype=U16, count=n, offset=HEADER_SIZE)
+
+
+def from_ablock_u16_into(data, out):
+    """Decodes an A-block into the preallocated array out and returns it.
 
+    out must have exactly as many elements as the A-block.  Use this
+    to reuse one buffer across many transfers.
+    """
+    n = _check_header(data)
+    if out.shape != (n,):
+        raise ValueError(f"Output buffer has shape {out.shape}, "
+                         f"A-block holds {n} values")
+    out[:] = np.frombuffer(data, dtype=U16, count=n, offset=HEADER_SIZE)
+    return out
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""One entry point for the align scripts.
+
+    align.py SUBCOMMAND [ARGS...]
+
+runs SUBCOMMAND's script with ARGS, as if it had been run directly.
+Only that script is imported, so a subcommand pays only for what it
+uses: the plotting scripts do not load VISA, and nothing loads
+matplotlib, seaborn or pandas until it draws or writes a CSV.
+importtime.py checks that this stays so.
+"""
+
+import importlib
+import sys
+
+# Subcommand: (module, description).
+SUBCOMMANDS = {
+    "cal-thru": ("cal_thru", "capture thru calibrations"),
+    "band": ("align_band", "measure a band"),
+    "precal": ("align_band_precal",
+               "measure bands against stored calibrations"),
+    "stations": ("stations", "measure bands on several stations"),
+    "dump-cal": ("dump_cal", "print and plot stored calibrations"),
+    "plot": ("plot_csv", "plot measured CSVs"),
+    "fleet": ("fleet", "rank rigs by deviation from the fleet"),
+    "trace-test": ("trace_test", "read and write a trace"),
+}
+
+
+def load(name):
+    """Imports and returns the module of subcommand name."""
+    module, _ = SUBCOMMANDS[name]
+    return importlib.import_module(module)
+
+
+def usage(stream):
+    print(f"usage: {sys.argv[0]} SUBCOMMAND [ARGS...]\n", file=stream)
+    for name, (_, description) in SUBCOMMANDS.items():
+        print(f"  {name:12s} {description}", file=stream)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        usage(sys.stdout if len(argv) >= 2 else sys.stderr)
+        return 0 if len(argv) >= 2 else 2
+    name = argv[1]
+    if name not in SUBCOMMANDS:
+        print(f"{argv[0]}: unknown subcommand {name!r}\n", file=sys.stderr)
+        usage(sys.stderr)
+        return 2
+    # argparse takes the program name in its usage from sys.argv.
+    sys.argv = [f"{argv[0]} {name}", *argv[2:]]
+    return load(name).main(sys.argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
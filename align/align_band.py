@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import argparse
 import datetime
 import logging
 import sys
@@ -10,32 +11,28 @@ import numpy as np
 import pymeasure
 import pymeasure.adapters
 
+import archive
 import bands
 import hp8560e
+import latency
+import live
+import segmented
 
+ARCHIVE_PATH = "archive"
 
-def main(argv):
-    #logging.basicConfig(level=logging.DEBUG)
-    resource = "tcpip::e5810a::gpib0,11"
-    adapter = pymeasure.adapters.VISAAdapter(resource, visa_library="@py",
-                                             timeout=20 * 1000)
-    sa = hp8560e.HP8560E(adapter)
 
-    band_name = argv[1]
-    logarithmic_scale = int(argv[2]) if len(argv) >= 3 else 2
-    band = bands.BAND_BY_NAME[band_name]
-    print(f"{band_name} {band.start_frequency:.3f}  {band.stop_frequency:.3f}")
+def configure_band(sa, band, logarithmic_scale):
+    with sa.batch(check_errors=True):
+        sa.preset()
+        sa.set_single_sweep_mode()
+        sa.start_frequency = band.start_frequency
+        sa.stop_frequency = band.stop_frequency
+        sa.logarithmic_scale = logarithmic_scale
+        sa.sweep_couple = "SR"
+        sa.source_power = True
 
-    sa.preset()
-    sa.set_single_sweep_mode()
-    sa.start_frequency = band.start_frequency
-    sa.stop_frequency = band.stop_frequency
-    sa.logarithmic_scale = logarithmic_scale
-    sa.sweep_coupling = "SR"
-    sa.source_power = True
-
-    input("Attach thru.  Press return to continue. -> ")
 
+def store_thru(sa):
     sa.write("SRCTKPK;")
     sa.wait_for_done()
     sa.take_sweep()
@@ -43,23 +40,104 @@ def main(argv):
     sa.take_sweep()
     sa.normalize = True
 
-    sa.set_continuous_sweep_mode()
-    print("Attach radio/filter and adjust if necessary.")
-    input("Press return to continue to anaylize and record sweep. -> ")
 
+def measure(sa):
     sa.set_single_sweep_mode()
-    sa.take_sweep()
-    trace = sa.read_trace()
+    with sa.phase("sweep"):
+        sa.take_sweep()
+    with sa.phase("read"):
+        return sa.read_trace()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Measure a band's insertion loss against a stored thru.")
+    parser.add_argument("band", choices=bands.BAND_BY_NAME)
+    parser.add_argument("logarithmic_scale", type=int, nargs="?", default=2)
+    parser.add_argument("rig", nargs="?", default="unknown")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="sweep the band in this many 601-point "
+                        "segments and stitch them, for finer resolution")
+    parser.add_argument("--overlap", type=int,
+                        default=segmented.DEFAULT_OVERLAP,
+                        help="points shared by adjacent segments")
+    parser.add_argument("--live", type=int, nargs="?", const=8, default=0,
+                        metavar="DEPTH",
+                        help="while adjusting, show live statistics over "
+                        "the last DEPTH sweeps (default 8); Ctrl-C records")
+    parser.add_argument("--stats", metavar="JSON",
+                        help="time every command and phase, and save the "
+                        "statistics here on exit")
+    args = parser.parse_args(argv[1:])
+
+    stats = None
+    if args.stats:
+        stats = latency.LatencyStats()
+        stats.dump_at_exit(args.stats)
 
-    data = np.array(list(trace.to_parameter_units()))
+    #logging.basicConfig(level=logging.DEBUG)
+    resource = "tcpip::e5810a::gpib0,11"
+    adapter = pymeasure.adapters.VISAAdapter(resource, visa_library="@py",
+                                             timeout=20 * 1000)
+    sa = hp8560e.HP8560E(adapter, stats=stats)
+
+    band_name = args.band
+    band = bands.BAND_BY_NAME[band_name]
+    print(f"{band_name} {band.start_frequency:.3f}  {band.stop_frequency:.3f}")
+    if args.segments > 1:
+        segments = segmented.plan(band.start_frequency, band.stop_frequency,
+                                  args.segments, args.overlap)
+        spacing = segmented.resolution(
+            band.start_frequency, band.stop_frequency, args.segments,
+            args.overlap)
+        print(f"{args.segments} segments, "
+              f"{segmented.n_points(args.segments, args.overlap)} points, "
+              f"{spacing:.1f} Hz per point")
+
+    with sa.phase("configure"):
+        configure_band(sa, band, args.logarithmic_scale)
+
+    input("Attach thru.  Press return to continue. -> ")
+
+    with sa.phase("thru"):
+        if args.segments > 1:
+            thrus = segmented.store_thrus(sa, segments)
+            sa.normalize = True
+        else:
+            store_thru(sa)
+
+    if args.live:
+        print("Attach radio/filter and adjust if necessary.")
+        input("Press return to start the live readout. -> ")
+        print("Press Ctrl-C to analyze and record sweep.")
+        live.run(sa, depth=args.live)
+    else:
+        sa.set_continuous_sweep_mode()
+        print("Attach radio/filter and adjust if necessary.")
+        input("Press return to continue to anaylize and record sweep. -> ")
+
+    if args.segments > 1:
+        with sa.phase("sweep"):
+            traces = segmented.measure(sa, segments, thrus)
+        trace = segmented.stitch(traces, args.overlap)
+    else:
+        trace = measure(sa)
+
+    data = trace.to_parameter_units()
     mean = np.mean(data)
     std = np.std(data)
     print(f"band={band_name} mean={mean:.3f} sd={std:.3f} dB")
 
-    yymmdd = datetime.datetime.now().strftime("%y%m%d")
-    with open(f"align_{band_name}_{yymmdd}.csv", "w") as f:
-        trace.to_dataframe().to_csv(f, index=False)
-    
+    now = datetime.datetime.now()
+    yymmdd = now.strftime("%y%m%d")
+    with sa.phase("persist"):
+        with open(f"align_{band_name}_{yymmdd}.csv", "w") as f:
+            trace.to_dataframe().to_csv(f, index=False)
+
+        archive.TraceArchive(ARCHIVE_PATH).append([{
+            "rig": args.rig, "band": band_name, "date": now.date(),
+            "frequencies": trace.frequencies, "amplitudes": data}])
+
 
     return 0
 
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
+import argparse
 import logging
-import pickle
+import math
 import sys
 import time
 
@@ -11,38 +12,84 @@ import pymeasure
 import pymeasure.adapters
 
 import bands
+import calstore
 import hp8560e
 
+RESOURCE = "tcpip::e5810a::gpib0,11"
 
-def load_thru_calibrations():
-    with open("thru_calibration.pkl", "rb") as f:
-        return pickle.load(f)
+
+def is_set_up(sa):
+    """Returns whether the analyzer is already set up for a normalized
+    tracking generator sweep, so that a band change needs no preset.
+    Source power and normalization are only known once this program has
+    set them, so the first call says no and the analyzer is preset.
+    """
+    return bool(sa.normalize and sa.source_power and
+                sa.sweep_couple == "SR")
+
+
+def load_calibration(sa, band, calibration, set_up):
+    """Sets the analyzer up to measure band against calibration,
+    skipping the preset if set_up and the upload if trace B already
+    holds calibration.  Returns what was sent: "nothing", "span",
+    "calibration" or "preset".
+    """
+    # A preset clears everything, so only check what is loaded if
+    # there will be no preset.
+    holds = set_up and sa.holds_trace(calibration, which='B')
+    span = set_up and (
+        math.isclose(sa.start_frequency, band.start_frequency) and
+        math.isclose(sa.stop_frequency, band.stop_frequency))
+    if holds and span:
+        return "nothing"
+    with sa.batch(check_errors=True):
+        if not set_up:
+            sa.preset()
+            sa.sweep_couple = "SR"
+            sa.source_power = True
+        sa.set_single_sweep_mode()
+        if not span:
+            sa.start_frequency = band.start_frequency
+            sa.stop_frequency = band.stop_frequency
+        if not holds:
+            sa.write_trace(calibration, which='B')
+        sa.normalize = True
+    if not set_up:
+        return "preset"
+    return "span" if holds else "calibration"
 
 
 def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Measure bands against cal_thru.py calibrations.")
+    parser.add_argument("bands", nargs="+", choices=bands.BAND_BY_NAME)
+    parser.add_argument("--calibrations", default=calstore.DEFAULT_PATH)
+    parser.add_argument("--instrument", default=RESOURCE,
+                        help="name the calibrations are filed under")
+    args = parser.parse_args(argv[1:])
+
     #logging.basicConfig(level=logging.DEBUG)
-    resource = "tcpip::e5810a::gpib0,11"
-    adapter = pymeasure.adapters.VISAAdapter(resource, visa_library="@py",
+    adapter = pymeasure.adapters.VISAAdapter(RESOURCE, visa_library="@py",
                                              timeout=20 * 1000)
-    sa = hp8560e.HP8560E(adapter)
-
-    band_name = argv[1]
-    band = bands.BAND_BY_NAME[band_name]
-    thru_calibrations = load_thru_calibrations()
-    
-    print(f"{band_name} {band.start_frequency:.3f}  {band.stop_frequency:.3f}")
-    calibration = thru_calibrations[band_name]
-    #print(calibration)
-
-    sa.preset()
-    sa.start_frequency = band.start_frequency
-    sa.stop_frequency = band.stop_frequency
-    sa.write_trace(calibration, which='B')
-    sa.normalize = True
-    sa.sweep_coupling = "SR"
-    sa.source_power = True
-    sa.take_sweep()
-    
+    sa = hp8560e.HP8560E(adapter, cache_state=True)
+    store = calstore.CalibrationStore(args.calibrations)
+
+    set_up = is_set_up(sa)
+    for i, band_name in enumerate(args.bands):
+        if i:
+            input(f"Press return to continue to {band_name}. -> ")
+        band = bands.BAND_BY_NAME[band_name]
+        print(f"{band_name} {band.start_frequency:.3f}  "
+              f"{band.stop_frequency:.3f}")
+        calibration = store.latest(band_name, args.instrument)
+        sent = load_calibration(sa, band, calibration, set_up)
+        set_up = True
+        print(f"sent {sent}")
+        sa.take_sweep()
+        data = sa.read_trace().to_parameter_units()
+        print(f"band={band_name} mean={np.mean(data):.3f} "
+              f"sd={np.std(data):.3f} dB")
+
     return 0
 
 
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""Append-only archive of alignment traces.
+
+An archive is a directory of NPZ shards plus summary.json.  Each shard
+is columnar: one row per trace with rig, band, date, start and stop
+frequency, point count, mean, std, min and max, and all of the shard's
+amplitudes concatenated into one array (row i is
+amplitudes[offsets[i]:offsets[i + 1]]), and a digest of its
+frequencies and amplitudes.  Shards are never modified; each append
+writes a new one, skipping traces the archive already holds, so
+importing the same CSVs twice adds nothing.  Appends hold a lock file,
+and a shard only appears under its name once it is complete.
+
+summary.json holds, per rig and band, the number of traces, the
+running point sums needed for the pooled mean and std, and the newest
+trace's statistics.  It is updated on every append, so summaries never
+need the raw traces.  std is the population standard deviation, as in
+align_band.py.
+"""
+
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import json
+import math
+import os
+import pathlib
+import re
+import sys
+import tempfile
+
+import numpy as np
+
+import bands
+
+SUMMARY = "summary.json"
+LOCK = "lock"
+_CSV_NAME = re.compile(r"align_(?P<band>\w+?)_(?P<yymmdd>\d{6})\.csv$")
+
+
+def _write_temporary(directory, write):
+    """Writes a new temporary file in directory and returns its path."""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
+def _replace_atomically(path, write):
+    os.replace(_write_temporary(path.parent, write), path)
+
+
+def _digest(start_frequency, stop_frequency, amplitudes):
+    """Identifies a trace by its content."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.array([start_frequency, stop_frequency]).tobytes())
+    h.update(np.ascontiguousarray(amplitudes, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+class TraceArchive:
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+    def _shards(self):
+        return sorted(self.path.glob("shard_*.npz"))
+
+    def _read_summary(self):
+        try:
+            with open(self.path / SUMMARY) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.path / LOCK, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _keys(self):
+        """Returns the (rig, band, date, digest) of every archived
+        trace.  Shards written before digests were kept get theirs
+        computed.
+        """
+        keys = set()
+        for shard in self._shards():
+            with np.load(shard) as columns:
+                if "digest" in columns.files:
+                    digests = columns["digest"]
+                else:
+                    offsets = columns["offsets"]
+                    amplitudes = columns["amplitudes"]
+                    digests = [_digest(start, stop,
+                                       amplitudes[offsets[i]:offsets[i + 1]])
+                               for i, (start, stop) in enumerate(zip(
+                                   columns["start_frequency"],
+                                   columns["stop_frequency"]))]
+                keys.update(zip(map(str, columns["rig"]),
+                                map(str, columns["band"]),
+                                map(str, columns["date"]),
+                                map(str, digests)))
+        return keys
+
+    def append(self, rows):
+        """Appends traces as a new shard.  rows is an iterable of dicts
+        with rig, band, date (a datetime.date), frequencies and
+        amplitudes.  Traces already archived, with the same rig, band,
+        date and content, are skipped.  Returns how many were added.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._locked():
+            return self._append(rows)
+
+    def _append(self, rows):
+        known = self._keys()
+        new_rows = []
+        for row in rows:
+            amplitudes = np.asarray(row["amplitudes"], dtype=np.float64)
+            digest = _digest(row["frequencies"][0], row["frequencies"][-1],
+                             amplitudes)
+            key = (row["rig"], row["band"],
+                   str(np.datetime64(row["date"], "D")), digest)
+            if key not in known:
+                known.add(key)
+                new_rows.append(dict(row, amplitudes=amplitudes,
+                                     digest=digest))
+        rows = new_rows
+        if not rows:
+            return 0
+        amplitudes = [row["amplitudes"] for row in rows]
+        lengths = np.array([len(a) for a in amplitudes])
+        columns = {
+            "rig": np.array([row["rig"] for row in rows]),
+            "band": np.array([row["band"] for row in rows]),
+            "date": np.array([row["date"] for row in rows],
+                             dtype="datetime64[D]"),
+            "start_frequency": np.array([row["frequencies"][0]
+                                         for row in rows]),
+            "stop_frequency": np.array([row["frequencies"][-1]
+                                        for row in rows]),
+            "n_points": lengths,
+            "mean": np.array([a.mean() for a in amplitudes]),
+            "std": np.array([a.std() for a in amplitudes]),
+            "min": np.array([a.min() for a in amplitudes]),
+            "max": np.array([a.max() for a in amplitudes]),
+            "offsets": np.concatenate([[0], np.cumsum(lengths)]),
+            "amplitudes": np.concatenate(amplitudes),
+            "digest": np.array([row["digest"] for row in rows]),
+        }
+        self._write_shard(columns)
+        self._update_summary(columns)
+        return len(rows)
+
+    def _write_shard(self, columns):
+        """Writes columns as the next shard.  The name is claimed with
+        a hard link, which fails if it exists, so a shard is never
+        overwritten or seen half written.
+        """
+        tmp_path = _write_temporary(self.path,
+                                    lambda f: np.savez(f, **columns))
+        try:
+            shards = self._shards()
+            n = int(shards[-1].stem.split("_")[1]) + 1 if shards else 0
+            while True:
+                try:
+                    os.link(tmp_path, self.path / f"shard_{n:06d}.npz")
+                    return
+                except FileExistsError:
+                    n += 1
+        finally:
+            os.unlink(tmp_path)
+
+    def _update_summary(self, columns):
+        summary = self._read_summary()
+        order = np.argsort(columns["date"], kind="stable")
+        for i in order:
+            rig = str(columns["rig"][i])
+            band = str(columns["band"][i])
+            n = int(columns["n_points"][i])
+            mean = float(columns["mean"][i])
+            std = float(columns["std"][i])
+            date = str(columns["date"][i])
+            entry = summary.setdefault(rig, {}).setdefault(band, {
+                "traces": 0, "points": 0, "sum": 0., "sum_squares": 0.,
+                "date": date})
+            entry["traces"] += 1
+            entry["points"] += n
+            entry["sum"] += mean * n
+            entry["sum_squares"] += n * (std * std + mean * mean)
+            if date >= entry["date"]:
+                entry.update(date=date, mean=mean, std=std,
+                             min=float(columns["min"][i]),
+                             max=float(columns["max"][i]))
+        _replace_atomically(
+            self.path / SUMMARY,
+            lambda f: f.write(json.dumps(summary, indent=1).encode()))
+
+    def rebuild_summary(self):
+        """Recomputes summary.json from the shards' statistics columns."""
+        with self._locked():
+            self._rebuild_summary()
+
+    def _rebuild_summary(self):
+        (self.path / SUMMARY).unlink(missing_ok=True)
+        for shard in self._shards():
+            with np.load(shard) as columns:
+                self._update_summary(
+                    {k: columns[k] for k in columns.files
+                     if k != "amplitudes"})
+
+    def summary(self, rig=None, band=None):
+        """Returns summary rows, by rig and then in the same band order
+        as plot_csv.py's summary (6m first).  Each row has the newest
+        trace's date, mean and std, and the pooled mean and std over
+        every archived trace.
+        """
+        rows = []
+        for rig_name, by_band in sorted(self._read_summary().items()):
+            if rig is not None and rig_name != rig:
+                continue
+            for band_name, entry in by_band.items():
+                if band is not None and band_name != band:
+                    continue
+                pooled_mean = entry["sum"] / entry["points"]
+                pooled_var = entry["sum_squares"] / entry["points"] - \
+                    pooled_mean * pooled_mean
+                rows.append(dict(entry, rig=rig_name, band=band_name,
+                                 pooled_mean=pooled_mean,
+                                 pooled_std=math.sqrt(max(pooled_var, 0.))))
+        rows.sort(key=lambda row: (row["rig"],
+                                   -bands.BAND_INDEX.get(row["band"], -1)))
+        return rows
+
+    def traces(self, rig=None, band=None):
+        """Yields the archived traces, optionally for one rig or band,
+        as dicts of their columns plus frequencies and amplitudes.
+        """
+        for shard in self._shards():
+            with np.load(shard) as columns:
+                columns = {k: columns[k] for k in columns.files}
+            keep = np.ones(len(columns["rig"]), dtype=bool)
+            if rig is not None:
+                keep &= columns["rig"] == rig
+            if band is not None:
+                keep &= columns["band"] == band
+            offsets = columns["offsets"]
+            for i in np.flatnonzero(keep):
+                yield {
+                    "rig": str(columns["rig"][i]),
+                    "band": str(columns["band"][i]),
+                    "date": columns["date"][i].astype(datetime.date),
+                    "mean": float(columns["mean"][i]),
+                    "std": float(columns["std"][i]),
+                    "frequencies": np.linspace(columns["start_frequency"][i],
+                                               columns["stop_frequency"][i],
+                                               columns["n_points"][i]),
+                    "amplitudes": columns["amplitudes"][
+                        offsets[i]:offsets[i + 1]],
+                }
+
+
+def read_csv_trace(path):
+    """Reads an align_<band>_<yymmdd>.csv into an archive row (without
+    rig).  The date comes from the name, or the file time otherwise.
+    Raises ValueError if neither the frequencies nor the name give the
+    band.
+    """
+    path = pathlib.Path(path)
+    data = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    frequencies, amplitudes = data[:, 0], data[:, 1]
+    match = _CSV_NAME.search(path.name)
+    if match:
+        date = datetime.datetime.strptime(match["yymmdd"], "%y%m%d").date()
+    else:
+        date = datetime.date.fromtimestamp(path.stat().st_mtime)
+    band = bands.which_band(frequencies[0])
+    if band:
+        band_name = band.name
+    elif match:
+        band_name = match["band"]
+    else:
+        raise ValueError(f"{path}: no band at {frequencies[0]:.0f} Hz and "
+                         "none in the file name")
+    return {"band": band_name, "date": date,
+            "frequencies": frequencies, "amplitudes": amplitudes}
+
+
+def import_csv_directory(archive, directory, rig=None):
+    """Imports every align_*.csv in directory as one shard, skipping
+    with a warning those whose band is unknown.  The rig defaults to
+    the directory name.
+    """
+    directory = pathlib.Path(directory)
+    rig = rig or directory.resolve().name
+    rows = []
+    for path in sorted(directory.glob("align_*.csv")):
+        try:
+            rows.append(dict(read_csv_trace(path), rig=rig))
+        except ValueError as e:
+            print(f"skipping {e}", file=sys.stderr)
+    return archive.append(rows)
+
+
+def main(argv):
+    if len(argv) >= 4 and argv[1] == "import":
+        archive = TraceArchive(argv[2])
+        for directory in argv[3:]:
+            n = import_csv_directory(archive, directory)
+            print(f"{directory}: imported {n} traces")
+    elif len(argv) >= 3 and argv[1] == "summary":
+        rig = argv[3] if len(argv) >= 4 else None
+        for row in TraceArchive(argv[2]).summary(rig=rig):
+            print(f"{row['rig']:12s} {row['band']:6s} {row['date']} "
+                  f"mean={row['mean']:6.2f}, std={row['std']:6.2f} dB  "
+                  f"({row['traces']} traces, pooled "
+                  f"mean={row['pooled_mean']:6.2f}, "
+                  f"std={row['pooled_std']:6.2f})")
+    elif len(argv) >= 3 and argv[1] == "rebuild":
+        TraceArchive(argv[2]).rebuild_summary()
+    else:
+        print(f"usage: {argv[0]} import ARCHIVE CSV_DIR...\n"
+              f"       {argv[0]} summary ARCHIVE [RIG]\n"
+              f"       {argv[0]} rebuild ARCHIVE", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
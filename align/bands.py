@@ -1,32 +1,16 @@
-import dataclasses
+import bandplan
 
-@dataclasses.dataclass
-class Band:
-    name: str
-    start_frequency: float
-    stop_frequency: float
+# 60m is channelized in the US, but sweeping the whole segment is fine
+# for what we are doing.
+_SWEEP_SPANS = {"60m": (5.250e6, 5.450e6)}
 
+BANDS = [bandplan.Band(band.name,
+                       *_SWEEP_SPANS.get(band.name, (band.start_frequency,
+                                                     band.stop_frequency)))
+         for band in bandplan.BANDS]
 
-BANDS=[
-    Band(name="160m", start_frequency=1.800e6, stop_frequency=2.000e6),
-    Band(name="80m", start_frequency=3.500e6, stop_frequency=4.000e6),
-    # 60m is channelized in the US, but this is fine for what we are doing.
-    Band(name="60m", start_frequency=5.250e6, stop_frequency=5.450e6),
-    Band(name="40m", start_frequency=7.000e6, stop_frequency=7.300e6),
-    Band(name="30m", start_frequency=10.100e6, stop_frequency=10.150e6),
-    Band(name="20m", start_frequency=14.000e6, stop_frequency=14.350e6),
-    Band(name="17m", start_frequency=18.068e6, stop_frequency=18.168e6),
-    Band(name="15m", start_frequency=21.000e6, stop_frequency=21.450e6),
-    Band(name="12m", start_frequency=24.890e6, stop_frequency=24.990e6),
-    Band(name="10m", start_frequency=28.000e6, stop_frequency=29.700e6),
-    Band(name="6m", start_frequency=50.000e6, stop_frequency=54.000e6)
-]
-
-BAND_BY_NAME={band.name: band for band in BANDS}
-
-
-def which_band(freq):
-    for band in BANDS:
-        if band.start_frequency <= freq <= band.stop_frequency:
-            return band
-    return None
+_PLAN = bandplan.BandPlan(BANDS)
+BAND_BY_NAME = {band.name: band for band in BANDS}
+BAND_INDEX = _PLAN.index
+which_band = _PLAN.find
+classify = _PLAN.classify
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import io
+import struct
+import sys
+import timeit
+
+import numpy as np
+
+import ablock
+import hp8560e
+
+
+def legacy_to_ablock_u16(values):
+    with io.BytesIO() as b:
+        n = len(values)
+        b.write(struct.pack(">cch", b'#', b'A', n * 2))
+        for value in values:
+            b.write(value.to_bytes(2, 'big'))
+        return b.getvalue()
+
+
+def legacy_from_ablock_u16(bytes):
+    n = len(bytes)
+    assert n >= 4
+    (pound, cap_a, blen) = struct.unpack(">cch", bytes[0:4])
+    assert pound == b'#'
+    assert cap_a == b'A'
+    assert blen == n - 4
+    assert blen % 2 == 0
+    return [int.from_bytes(bytes[i:i+2], byteorder='big')
+            for i in range(4, n, 2)]
+
+
+def bench(label, fn, number):
+    t = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"{label:32s} {t * 1e6:9.2f} us")
+    return t
+
+
+def main(argv):
+    number = int(argv[1]) if len(argv) >= 2 else 2000
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 610, hp8560e.HP8560E.N_POINTS, dtype=np.uint16)
+    values_list = [int(v) for v in values]
+    data = ablock.to_ablock_u16(values)
+    out = np.empty(hp8560e.HP8560E.N_POINTS, dtype=np.uint16)
+
+    assert data == legacy_to_ablock_u16(values_list)
+    assert list(ablock.from_ablock_u16(data)) == legacy_from_ablock_u16(data)
+
+    old = bench("legacy decode", lambda: legacy_from_ablock_u16(data), number)
+    new = bench("decode (view)", lambda: ablock.from_ablock_u16(data), number)
+    bench("decode (into buffer)",
+          lambda: ablock.from_ablock_u16_into(data, out), number)
+    print(f"decode speedup {old / new:.1f}x")
+
+    old = bench("legacy encode", lambda: legacy_to_ablock_u16(values_list),
+                number)
+    new = bench("encode", lambda: ablock.to_ablock_u16(values), number)
+    print(f"encode speedup {old / new:.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
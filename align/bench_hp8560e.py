@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Throughput benchmarks for the HP8560E driver against the emulator.
+
+For each flow, reports the sweeps taken, the VISA transactions (writes
+plus reads), the bytes each way and the wall time.  --json saves the
+results and --baseline compares against a saved run, to catch
+regressions.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pymeasure.adapters
+
+import align_band
+import bands
+import cal_thru
+import calstore
+import hp8560e
+import hp8560e_async
+import hp8560e_emulator
+import segmented
+import tdf
+
+
+class CountingAdapter:
+    """Wraps an adapter, counting transactions and bytes."""
+
+    def __init__(self, adapter):
+        self._adapter = adapter
+        self.reset()
+
+    def reset(self):
+        self.writes = 0
+        self.reads = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def __getattr__(self, name):
+        return getattr(self._adapter, name)
+
+    def write(self, command, **kwargs):
+        self.writes += 1
+        self.bytes_out += len(command) + 1
+        self._adapter.write(command, **kwargs)
+
+    def write_bytes(self, content, **kwargs):
+        self.writes += 1
+        self.bytes_out += len(content)
+        self._adapter.write_bytes(content, **kwargs)
+
+    def read(self, **kwargs):
+        self.reads += 1
+        response = self._adapter.read(**kwargs)
+        self.bytes_in += len(response) + 1
+        return response
+
+    def read_bytes(self, count, **kwargs):
+        self.reads += 1
+        response = self._adapter.read_bytes(count, **kwargs)
+        self.bytes_in += len(response)
+        return response
+
+
+def connect(server, cache_state=False):
+    adapter = CountingAdapter(pymeasure.adapters.VISAAdapter(
+        server.resource, visa_library="@py", timeout=20 * 1000,
+        read_termination="\n", write_termination="\n"))
+    return hp8560e.HP8560E(adapter, cache_state=cache_state)
+
+
+def flow_read_trace(server, sweeps, cache_state, trace_format="A"):
+    sa = connect(server, cache_state)
+    sa.trace_format = trace_format
+    align_band.configure_band(sa, bands.BAND_BY_NAME["20m"], 2)
+    sa.adapter.reset()
+    for _ in range(sweeps):
+        sa.take_sweep()
+        sa.read_trace()
+    return sa.adapter
+
+
+def flow_write_trace(server, sweeps):
+    sa = connect(server)
+    align_band.configure_band(sa, bands.BAND_BY_NAME["20m"], 2)
+    trace = sa.read_trace()
+    sa.adapter.reset()
+    for _ in range(sweeps):
+        sa.write_trace(trace, which='B')
+    sa.check_errors()
+    return sa.adapter
+
+
+def flow_align_band(server, sweeps):
+    sa = connect(server)
+    for _ in range(sweeps):
+        align_band.configure_band(sa, bands.BAND_BY_NAME["20m"], 2)
+        align_band.store_thru(sa)
+        align_band.measure(sa)
+    return sa.adapter
+
+
+def flow_segmented(server, sweeps, segments):
+    sa = connect(server, cache_state=True)
+    band = bands.BAND_BY_NAME["10m"]
+    plan = segmented.plan(band.start_frequency, band.stop_frequency,
+                          segments)
+    for _ in range(sweeps):
+        align_band.configure_band(sa, band, 2)
+        thrus = segmented.store_thrus(sa, plan)
+        segmented.stitch(segmented.measure(sa, plan, thrus))
+    return sa.adapter
+
+
+def flow_cal_thru(server, sweeps):
+    sa = connect(server)
+    with tempfile.TemporaryDirectory() as directory:
+        store = calstore.CalibrationStore(os.path.join(directory, "cal"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(cal_thru.calibrate(
+                hp8560e_async.AsyncHP8560E(sa), bands.BANDS, store,
+                "bench", 0., cal_thru.StageTimer()))
+    return sa.adapter
+
+
+def run(server, sweeps):
+    flows = [
+        ("read_trace", sweeps,
+         lambda: flow_read_trace(server, sweeps, False)),
+        ("read_trace cached", sweeps,
+         lambda: flow_read_trace(server, sweeps, True)),
+        *((f"read_trace TDF {f}", sweeps,
+           lambda f=f: flow_read_trace(server, sweeps, True, f))
+          for f in tdf.FORMATS if f != "A"),
+        ("write_trace", sweeps, lambda: flow_write_trace(server, sweeps)),
+        # Three sweeps per band: track, thru, measure.
+        ("align_band", 3 * sweeps, lambda: flow_align_band(server, sweeps)),
+        # Three sweeps per segment, four segments.
+        ("segmented", 12 * sweeps,
+         lambda: flow_segmented(server, sweeps, 4)),
+        ("cal_thru", 3 * len(bands.BANDS),
+         lambda: flow_cal_thru(server, sweeps)),
+    ]
+    results = {}
+    for name, n, flow in flows:
+        start = time.perf_counter()
+        counts = flow()
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "sweeps": n,
+            "transactions": counts.writes + counts.reads,
+            "bytes_out": counts.bytes_out,
+            "bytes_in": counts.bytes_in,
+            "seconds": elapsed,
+        }
+    return results
+
+
+def report(results, baseline=None):
+    print(f"{'flow':20s} {'xact/sweep':>10s} {'out/sweep':>10s} "
+          f"{'in/sweep':>10s} {'ms/sweep':>10s}")
+    for name, r in results.items():
+        n = r["sweeps"]
+        line = (f"{name:20s} {r['transactions'] / n:10.1f} "
+                f"{r['bytes_out'] / n:10.0f} {r['bytes_in'] / n:10.0f} "
+                f"{1e3 * r['seconds'] / n:10.2f}")
+        if baseline and name in baseline:
+            b = baseline[name]
+            line += (f"   was {b['transactions'] / b['sweeps']:.1f} xact, "
+                     f"{1e3 * b['seconds'] / b['sweeps']:.2f} ms")
+        print(line)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sweeps", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.,
+                        help="emulated seconds per query reply")
+    parser.add_argument("--sweep-time", type=float, default=0.)
+    parser.add_argument("--json", help="save results to this file")
+    parser.add_argument("--baseline", help="compare with saved results")
+    args = parser.parse_args(argv[1:])
+
+    server = hp8560e_emulator.EmulatorServer(
+        latency=args.latency, sweep_time=args.sweep_time).start()
+    results = run(server, args.sweeps)
+    server.shutdown()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"latency": args.latency,
+                       "sweep_time": args.sweep_time,
+                       "results": results}, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,55 +1,153 @@
 #!/usr/bin/env python3
 
+import argparse
+import asyncio
+import collections
+import contextlib
+import datetime
 import logging
-import pickle
 import sys
 import time
 
-import numpy as np
-
 import pymeasure
 import pymeasure.adapters
 
 import bands
+import calstore
 import hp8560e
+import hp8560e_async
+import latency
 
+RESOURCE = "tcpip::e5810a::gpib0,11"
+STAGES = ("configure", "track", "thru", "read", "persist")
 
-def main(argv):
-    #logging.basicConfig(level=logging.DEBUG)
-    resource = "tcpip::e5810a::gpib0,11"
-    adapter = pymeasure.adapters.VISAAdapter(resource, visa_library="@py",
-                                             timeout=20 * 1000)
-    sa = hp8560e.HP8560E(adapter)
-    
-    print("Calibrating thru for all bands.")
-    print("Setup thru calibration.")
-    input("Press return to continue. -> ")
 
-    band_thru_calibrations = dict()
+class StageTimer:
+    def __init__(self, stats=None):
+        self.timings = collections.defaultdict(dict)
+        self.stats = stats
+
+    @contextlib.contextmanager
+    def stage(self, band_name, stage):
+        phase = (self.stats.phase(f"{band_name}/{stage}") if self.stats
+                 else contextlib.nullcontext())
+        start = time.perf_counter()
+        try:
+            with phase:
+                yield
+        finally:
+            self.timings[band_name][stage] = time.perf_counter() - start
+
+    def report(self):
+        print(f"{'band':6s}" + "".join(f"{s:>10s}" for s in STAGES) +
+              f"{'total':>10s}")
+        for band_name, stages in self.timings.items():
+            times = [stages.get(s, 0.) for s in STAGES]
+            print(f"{band_name:6s}" + "".join(f"{t:10.2f}" for t in times) +
+                  f"{sum(times):10.2f}")
+
+
+async def calibrate_band(sa, band, timer):
+    with timer.stage(band.name, "configure"):
+        await sa.configure(preset=True,
+                           start_frequency=band.start_frequency,
+                           stop_frequency=band.stop_frequency,
+                           source_power=True,
+                           sweep_couple="SR",
+                           commands=["SRCTKPK;"],
+                           check_errors=True)
+    with timer.stage(band.name, "track"):
+        await sa.wait_for_done()
+        await sa.take_sweep()
+    with timer.stage(band.name, "thru"):
+        await sa.write("STORETHRU;")
+        await sa.take_sweep()
+        await sa.set("normalize", True)
+    with timer.stage(band.name, "read"):
+        return await sa.read_trace(which='B')
+
 
-    for band in bands.BANDS:
-        print(f"Band {band.name}")
+async def calibrate(sa, todo, store, instrument, view_time, timer):
+    """Calibrates the bands in todo.  Each band is appended to the
+    store as soon as it is read, in the background while the analyzer
+    moves on to the next band, so a failure keeps everything captured
+    before it.
+    """
+    persist = None
 
-        sa.preset()
-        sa.set_single_sweep_mode()
-        sa.start_frequency = band.start_frequency
-        sa.stop_frequency = band.stop_frequency
-        sa.source_power = True
-        sa.sweep_coupling = "SR"
-        sa.write("SRCTKPK;")
-        sa.wait_for_done()
-        sa.take_sweep()
-        sa.write("STORETHRU;")
-        sa.take_sweep()
-        sa.normalize = True
+    async def save(band_name, trace):
+        with timer.stage(band_name, "persist"):
+            await asyncio.to_thread(store.append, band_name, trace,
+                                    instrument)
 
-        band_thru_calibrations[band.name] = sa.read_trace(which='B')
+    try:
+        for band in todo:
+            print(f"Band {band.name}")
+            trace = await calibrate_band(sa, band, timer)
+            if persist is not None:
+                await persist
+            persist = asyncio.create_task(save(band.name, trace))
+            if view_time:
+                await sa.write("VIEW TRB;")
+                await asyncio.sleep(view_time)
+    finally:
+        if persist is not None:
+            await persist
 
-        sa.write("VIEW TRB;")
-        time.sleep(5)
 
-    with open("thru_calibration.pkl", "wb") as f:
-        pickle.dump(band_thru_calibrations, f)
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Calibrate the thru path for each band.")
+    parser.add_argument("bands", nargs="*",
+                        help="bands to calibrate (default: all)")
+    parser.add_argument("--view", type=float, default=0., metavar="SECONDS",
+                        help="show each band's trace for this long")
+    parser.add_argument("--restart", action="store_true",
+                        help="recalibrate bands already calibrated today")
+    parser.add_argument("--output", default=calstore.DEFAULT_PATH)
+    parser.add_argument("--instrument", default=RESOURCE,
+                        help="name to file the calibration under")
+    parser.add_argument("--stats", metavar="JSON",
+                        help="time every command and stage, and save the "
+                        "statistics here on exit")
+    args = parser.parse_args(argv[1:])
+
+    stats = None
+    if args.stats:
+        stats = latency.LatencyStats()
+        stats.dump_at_exit(args.stats)
+
+    #logging.basicConfig(level=logging.DEBUG)
+    adapter = pymeasure.adapters.VISAAdapter(RESOURCE, visa_library="@py",
+                                             timeout=20 * 1000)
+    sa = hp8560e_async.AsyncHP8560E(hp8560e.HP8560E(adapter, stats=stats))
+
+    selected = ([bands.BAND_BY_NAME[name] for name in args.bands]
+                if args.bands else bands.BANDS)
+    store = calstore.CalibrationStore(args.output)
+    today = datetime.datetime.combine(datetime.date.today(),
+                                      datetime.time())
+    done = (set() if args.restart
+            else store.calibrated_since(today, args.instrument))
+    todo = [band for band in selected if band.name not in done]
+    skipped = [band.name for band in selected if band.name in done]
+    if skipped:
+        print(f"Already calibrated: {' '.join(skipped)}")
+    if not todo:
+        return 0
+
+    print("Calibrating thru for " + " ".join(band.name for band in todo))
+    print("Setup thru calibration.")
+    input("Press return to continue. -> ")
+
+    timer = StageTimer(stats)
+    start = time.perf_counter()
+    try:
+        asyncio.run(calibrate(sa, todo, store, args.instrument,
+                              args.view, timer))
+    finally:
+        timer.report()
+        print(f"elapsed {time.perf_counter() - start:.2f} s")
 
     return 0
 
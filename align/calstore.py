@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""Thru calibration store.
+
+A calibration file is a small header followed by fixed-size records,
+one per captured trace, appended as they are taken.  Each record holds
+the band, the instrument, the time it was taken, the state needed to
+interpret the trace and the raw trace in measurement units.  Nothing is
+pickled, so the file does not depend on the Trace class.
+
+Readers memory-map the records.  Looking up a band reads only the
+band/instrument/time columns and then the one record wanted; the other
+traces are never touched.  Older calibrations stay in the file, so
+successive calibrations of the same band can be compared for drift.
+"""
+
+import datetime
+import os
+import pickle
+import struct
+import sys
+
+import numpy as np
+
+import traces
+
+DEFAULT_PATH = "thru_calibration.cal"
+MAGIC = b"HPCALSTR"
+VERSION = 1
+_HEADER = struct.Struct("<8sII")
+HEADER_SIZE = 64
+
+RECORD_DTYPES = {
+    1: np.dtype([
+        ("band", "S8"),
+        ("instrument", "S48"),
+        ("timestamp", "<f8"),
+        ("amplitude_units", "S8"),
+        ("reference_level", "<f8"),
+        ("log_scale", "<i4"),
+        ("n_points", "<u4"),
+        ("start_frequency", "<f8"),
+        ("stop_frequency", "<f8"),
+        ("trace_mu", ">u2", (traces.N_POINTS,)),
+    ]),
+}
+
+
+def _encode(dtype, field, value):
+    """Encodes value for a fixed-size string field, refusing to
+    truncate it.
+    """
+    data = value.encode()
+    if len(data) > dtype[field].itemsize:
+        raise ValueError(f"{field} {value!r} is longer than "
+                         f"{dtype[field].itemsize} bytes")
+    return data
+
+
+class CalibrationStore:
+    def __init__(self, path):
+        self.path = path
+        self._records = None
+        self._index = None
+
+    def _read_header(self, f):
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"{self.path}: truncated header")
+        magic, version, record_size = _HEADER.unpack_from(header)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path}: not a calibration store")
+        if version not in RECORD_DTYPES:
+            raise ValueError(f"{self.path}: unsupported version {version}")
+        dtype = RECORD_DTYPES[version]
+        if record_size != dtype.itemsize:
+            raise ValueError(f"{self.path}: record size {record_size}, "
+                             f"expected {dtype.itemsize}")
+        return dtype
+
+    @property
+    def records(self):
+        """The records as a read-only memory-mapped structured array."""
+        if self._records is None:
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                return np.empty(0, dtype=RECORD_DTYPES[VERSION])
+            with open(self.path, "rb") as f:
+                dtype = self._read_header(f)
+            # A trailing partial record (interrupted append) is ignored.
+            n = (size - HEADER_SIZE) // dtype.itemsize
+            if n == 0:
+                return np.empty(0, dtype=dtype)
+            self._records = np.memmap(self.path, dtype=dtype, mode="r",
+                                      offset=HEADER_SIZE, shape=(n,))
+        return self._records
+
+    @property
+    def index(self):
+        """Maps (band, instrument) to record numbers, oldest first."""
+        if self._index is None:
+            records = self.records
+            index = {}
+            order = np.argsort(records["timestamp"], kind="stable")
+            bands = records["band"][order]
+            instruments = records["instrument"][order]
+            for i, band, instrument in zip(order, bands, instruments):
+                key = (band.decode(), instrument.decode())
+                index.setdefault(key, []).append(int(i))
+            self._index = index
+        return self._index
+
+    def append(self, band_name, trace, instrument="", timestamp=None):
+        """Appends a trace as the newest calibration of band_name."""
+        dtype = RECORD_DTYPES[VERSION]
+        n_points = len(trace.trace_mu)
+        if n_points != dtype["trace_mu"].shape[0]:
+            raise ValueError(f"Trace has {n_points} points, store holds "
+                             f"{dtype['trace_mu'].shape[0]}")
+        record = np.zeros(1, dtype=dtype)
+        record["band"] = _encode(dtype, "band", band_name)
+        record["instrument"] = _encode(dtype, "instrument", instrument)
+        record["timestamp"] = (datetime.datetime.now().timestamp()
+                               if timestamp is None else timestamp)
+        record["amplitude_units"] = _encode(dtype, "amplitude_units",
+                                            trace.amplitude_units)
+        record["reference_level"] = trace.reference_level
+        record["log_scale"] = trace.log_scale
+        record["n_points"] = n_points
+        record["start_frequency"] = trace.start_frequency
+        record["stop_frequency"] = trace.stop_frequency
+        record["trace_mu"] = trace.trace_mu
+
+        self._records = None
+        self._index = None
+        with open(self.path, "ab+") as f:
+            f.seek(0)
+            if f.read(1):
+                f.seek(0)
+                if self._read_header(f) != dtype:
+                    raise ValueError(f"{self.path}: written by a different "
+                                     "version")
+                # Drop a partial record left by an interrupted append.
+                size = f.seek(0, os.SEEK_END)
+                f.truncate(size - (size - HEADER_SIZE) % dtype.itemsize)
+            else:
+                f.write(_HEADER.pack(MAGIC, VERSION, dtype.itemsize)
+                        .ljust(HEADER_SIZE, b"\0"))
+            f.write(record.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def to_trace(record):
+        return traces.Trace(
+            amplitude_units=record["amplitude_units"].decode(),
+            reference_level=float(record["reference_level"]),
+            log_scale=int(record["log_scale"]),
+            trace_mu=record["trace_mu"],
+            start_frequency=float(record["start_frequency"]),
+            stop_frequency=float(record["stop_frequency"]))
+
+    def _find(self, band_name, instrument):
+        if instrument is not None:
+            return self.index.get((band_name, instrument), [])
+        found = [i for (band, _), indices in self.index.items()
+                 if band == band_name for i in indices]
+        return sorted(found, key=lambda i: self.records[i]["timestamp"])
+
+    def latest(self, band_name, instrument=None):
+        """Returns the newest calibration trace for a band, from the
+        given instrument or from any.  Raises KeyError if there is none.
+        """
+        found = self._find(band_name, instrument)
+        if not found:
+            raise KeyError(band_name if instrument is None
+                           else (band_name, instrument))
+        return self.to_trace(self.records[found[-1]])
+
+    def history(self, band_name, instrument=None):
+        """Returns [(datetime, trace)] for every calibration of a band,
+        oldest first.
+        """
+        return [(datetime.datetime.fromtimestamp(
+                    float(self.records[i]["timestamp"])),
+                 self.to_trace(self.records[i]))
+                for i in self._find(band_name, instrument)]
+
+    def band_names(self, instrument=None):
+        return sorted({band for (band, inst) in self.index
+                       if instrument is None or inst == instrument})
+
+    def calibrated_since(self, since, instrument=None):
+        """Returns the names of bands calibrated at or after since, a
+        datetime.
+        """
+        t = since.timestamp()
+        return {band for (band, inst), indices in self.index.items()
+                if (instrument is None or inst == instrument) and
+                self.records[indices[-1]]["timestamp"] >= t}
+
+
+def import_pickle(pickle_path, store, instrument):
+    """Copies the traces of an old thru_calibration.pkl into store,
+    filed under instrument, the resource the calibrations will be
+    looked up with, and stamped with the pickle's modification time.
+    """
+    if not instrument:
+        raise ValueError("Imported calibrations need an instrument")
+    with open(pickle_path, "rb") as f:
+        calibrations = pickle.load(f)
+    timestamp = os.path.getmtime(pickle_path)
+    for band_name, trace in calibrations.items():
+        store.append(band_name, trace, instrument=instrument,
+                     timestamp=timestamp)
+    return len(calibrations)
+
+
+def main(argv):
+    if len(argv) >= 3 and argv[1] == "list":
+        store = CalibrationStore(argv[2])
+        for (band, instrument), indices in sorted(store.index.items()):
+            for i in indices:
+                when = datetime.datetime.fromtimestamp(
+                    float(store.records[i]["timestamp"]))
+                print(f"{band:6s} {when:%Y-%m-%d %H:%M:%S} {instrument}")
+    elif len(argv) == 5 and argv[1] == "import":
+        n = import_pickle(argv[2], CalibrationStore(argv[3]), argv[4])
+        print(f"Imported {n} bands.")
+    else:
+        print(f"usage: {argv[0]} list STORE\n"
+              f"       {argv[0]} import PICKLE STORE INSTRUMENT",
+              file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
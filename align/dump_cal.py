@@ -1,25 +1,40 @@
 #!/usr/bin/env python3
 
-import pickle
 import sys
 
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
 
 import bands
+import calstore
 
 
 def main(argv):
+    args = [arg for arg in argv[1:] if not arg.startswith("--")]
+    history = "--history" in argv
+    store = calstore.CalibrationStore(args[0] if args
+                                      else calstore.DEFAULT_PATH)
+
+    if history:
+        # Every calibration of every band, to see drift.  No plots.
+        for band_name in store.band_names():
+            for when, trace in store.history(band_name):
+                amplitudes = trace.to_parameter_units()
+                print(f"band={band_name:10s} {when:%Y-%m-%d %H:%M} "
+                      f"mean={np.mean(amplitudes):6.3f} "
+                      f"sd={np.std(amplitudes):6.3f} {trace.amplitude_units}")
+        return 0
+
+    # Only plotting needs these, and they take longer to import than
+    # everything else.
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     sns.set_theme()
 
-    with open("thru_calibration.pkl", "rb") as f:
-        cal = pickle.load(f)
-
-    for k, trace in cal.items():
+    for band_name in store.band_names():
+        trace = store.latest(band_name)
         band = bands.which_band(trace.frequencies[0])
-        frequencies = np.array(trace.frequencies) / 1e6
-        amplitudes = np.array(list(trace.to_parameter_units()))
+        frequencies = trace.frequencies / 1e6
+        amplitudes = trace.to_parameter_units()
         mean = np.mean(amplitudes)
         std = np.std(amplitudes)
         
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Compare the aligned traces of many rigs, band by band.
+
+All of a band's traces are put on one frequency grid, as rows of a
+matrix: traces already on the grid are copied, the rest are linearly
+interpolated, a whole group of traces sharing a grid at a time.
+Points a trace does not cover are NaN.  Each rig's newest trace is
+then compared against a golden reference, by default the per-point
+median of the fleet:
+
+  worst   largest |delta| from the reference, and where it is
+  rms     root mean square delta
+  p5/p95  5th and 95th percentile of the delta
+  outlier largest robust z-score, |x - median| / (1.4826 * MAD), of
+          the trace against the fleet at each point
+
+Rigs are ranked by worst deviation.  Rigs with no point in common with
+the reference are listed last, unranked.  Traces come from the archive or
+from align_<band>_<yymmdd>.csv files, whose rig is their directory.
+"""
+
+import argparse
+import collections
+import pathlib
+import sys
+import warnings
+
+import numpy as np
+
+import archive
+import bands
+
+
+def load_archive(path, band_name=None):
+    """Returns {band name: [row]} of every trace in the archive."""
+    by_band = collections.defaultdict(list)
+    for row in archive.TraceArchive(path).traces(band=band_name):
+        by_band[row["band"]].append(row)
+    return by_band
+
+
+def load_csvs(paths, band_name=None):
+    """Returns {band name: [row]} of the CSVs, each rig named after its
+    file's directory.
+    """
+    by_band = collections.defaultdict(list)
+    for path in paths:
+        path = pathlib.Path(path)
+        row = archive.read_csv_trace(path)
+        if band_name is None or row["band"] == band_name:
+            row["rig"] = path.resolve().parent.name
+            by_band[row["band"]].append(row)
+    return by_band
+
+
+def to_grid(rows, grid):
+    """Returns the rows' amplitudes on grid as a (len(rows), len(grid))
+    matrix, NaN outside each trace's span.  Traces are uniform grids, so
+    interpolation is index arithmetic shared by each group of traces
+    with the same start, stop and point count.
+    """
+    matrix = np.full((len(rows), len(grid)), np.nan)
+    groups = collections.defaultdict(list)
+    for i, row in enumerate(rows):
+        frequencies = row["frequencies"]
+        groups[(frequencies[0], frequencies[-1], len(frequencies))].append(i)
+    for (start, stop, n), indices in groups.items():
+        amplitudes = np.stack([rows[i]["amplitudes"] for i in indices])
+        if n == len(grid) and start == grid[0] and stop == grid[-1]:
+            matrix[indices] = amplitudes
+            continue
+        position = (grid - start) / (stop - start) * (n - 1)
+        inside = (position >= 0) & (position <= n - 1)
+        lower = np.clip(np.floor(position).astype(int), 0, n - 2)
+        weight = position - lower
+        values = (amplitudes[:, lower] * (1 - weight) +
+                  amplitudes[:, lower + 1] * weight)
+        values[:, ~inside] = np.nan
+        matrix[indices] = values
+    return matrix
+
+
+def latest_per_rig(rows):
+    """Returns the index of each rig's newest row, by rig name."""
+    latest = {}
+    for i, row in enumerate(rows):
+        j = latest.get(row["rig"])
+        if j is None or row["date"] >= rows[j]["date"]:
+            latest[row["rig"]] = i
+    return [latest[rig] for rig in sorted(latest)]
+
+
+def compare(rows, band, points=None, golden=None):
+    """Compares each rig's newest trace for band with the reference, the
+    golden rig's newest trace if golden names one, else the fleet
+    median.  Returns (grid, ranking), ranking a list of dicts, worst
+    rig first.  Rigs with no point in common with the reference have
+    ranked false, NaN statistics, and come last.
+    """
+    if points is None:
+        points = max(len(row["frequencies"]) for row in rows)
+    grid = np.linspace(band.start_frequency, band.stop_frequency, points)
+    rows = [rows[i] for i in latest_per_rig(rows)]
+    matrix = to_grid(rows, grid)
+
+    # The nan* reductions are several times slower; only pay for them
+    # when some trace does not cover the grid.
+    if np.isnan(matrix).any():
+        median, percentile = np.nanmedian, np.nanpercentile
+    else:
+        median, percentile = np.median, np.percentile
+    fleet = median(matrix, axis=0)
+    mad = 1.4826 * median(np.abs(matrix - fleet), axis=0)
+    if golden is None:
+        reference = fleet
+    else:
+        rigs = [row["rig"] for row in rows]
+        if golden not in rigs:
+            raise KeyError(f"no {band.name} trace for golden rig {golden}")
+        reference = matrix[rigs.index(golden)]
+
+    delta = matrix - reference
+    magnitude = np.abs(delta)
+    ranked = ~np.isnan(magnitude).all(axis=1)
+    # Points without data are NaN; skip them in argmax.
+    worst_at = np.argmax(np.nan_to_num(magnitude, nan=-1.), axis=1)
+    worst = magnitude[np.arange(len(rows)), worst_at]
+    worst_frequency = np.where(ranked, grid[worst_at], np.nan)
+    with warnings.catch_warnings():
+        # Unranked rows are all NaN and give NaN, which is what we want.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        rms = np.sqrt(np.nanmean(delta * delta, axis=1))
+        p5, p95 = percentile(delta, [5, 95], axis=1)
+        mean = np.nanmean(matrix, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.abs(matrix - fleet) / mad
+    z[~np.isfinite(z)] = 0.
+    outlier = z.max(axis=1)
+
+    ranking = [{"rig": row["rig"], "date": row["date"],
+                "ranked": bool(ranked[i]),
+                "mean": float(mean[i]),
+                "worst": float(worst[i]),
+                "worst_frequency": float(worst_frequency[i]),
+                "rms": float(rms[i]), "p5": float(p5[i]),
+                "p95": float(p95[i]), "outlier": float(outlier[i])}
+               for i, row in enumerate(rows)]
+    ranking.sort(key=lambda r: (not r["ranked"],
+                                -r["worst"] if r["ranked"] else 0.))
+    return grid, ranking
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Rank rigs by deviation from the fleet, per band.")
+    parser.add_argument("csvs", nargs="*", help="align_*.csv files")
+    parser.add_argument("--archive", help="read traces from this archive")
+    parser.add_argument("--band", help="only this band")
+    parser.add_argument("--golden", metavar="RIG",
+                        help="compare against this rig, not the median")
+    parser.add_argument("--points", type=int,
+                        help="points in the shared grid "
+                        "(default: the most in any trace)")
+    args = parser.parse_args(argv[1:])
+    if bool(args.archive) == bool(args.csvs):
+        parser.error("give either --archive or CSV files")
+
+    if args.archive:
+        by_band = load_archive(args.archive, args.band)
+    else:
+        by_band = load_csvs(args.csvs, args.band)
+
+    for band_name in sorted(by_band, key=lambda b: -bands.BAND_INDEX[b]):
+        rows = by_band[band_name]
+        try:
+            _, ranking = compare(rows, bands.BAND_BY_NAME[band_name],
+                                 args.points, args.golden)
+        except KeyError as e:
+            print(f"{band_name}: {e.args[0]}")
+            continue
+        print(f"* {band_name} * {len(ranking)} rigs, {len(rows)} traces")
+        print(f"{'rig':16s} {'date':10s} {'mean':>7s} {'worst':>7s} "
+              f"{'at MHz':>9s} {'rms':>6s} {'p5':>7s} {'p95':>7s} "
+              f"{'outlier':>7s}")
+        for r in ranking:
+            if not r["ranked"]:
+                print(f"{r['rig']:16s} {str(r['date']):10s} "
+                      f"no data in common with the reference")
+                continue
+            print(f"{r['rig']:16s} {str(r['date']):10s} {r['mean']:7.2f} "
+                  f"{r['worst']:7.2f} {r['worst_frequency'] / 1e6:9.4f} "
+                  f"{r['rms']:6.2f} {r['p5']:7.2f} {r['p95']:7.2f} "
+                  f"{r['outlier']:7.1f}")
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
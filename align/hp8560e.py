@@ -1,11 +1,13 @@
-import dataclasses
+import contextlib
 import enum
+import hashlib
 import io
+import logging
+import re
 import struct
 import time
 
 import numpy as np
-import pandas as pd
 
 import pymeasure
 import pymeasure.instruments
@@ -13,43 +15,415 @@ import pymeasure.instruments.validators
 import pyvisa.errors
 
 import ablock
+import latency
+import tdf
+import traces
+
+
+log = logging.getLogger(__name__)
+
+_MNEMONIC = re.compile(r"[A-Z]+")
+
+
+class CommandError(Exception):
+    """The analyzer reported errors (ERR?) after a command, or after a
+    batch of commands if no single one could be blamed.
+    """
+
+    def __init__(self, command, errors):
+        super().__init__(f"{command!r} failed with errors {errors}")
+        self.command = command
+        self.errors = errors
+
+
+def _mnemonic(command):
+    match = _MNEMONIC.match(command.strip().upper())
+    return match.group(0) if match else ""
+
+
+class _StateControl:
+    """Wraps an Instrument.control so that, when the instrument's state
+    cache is enabled, reads are answered from the cache and writes
+    update it.  The cache key is the mnemonic of the get command, so
+    controls sharing a command share an entry.
+    """
+
+    def __init__(self, key, control):
+        self.key = key
+        self._control = control
+        self.__doc__ = control.__doc__
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if not obj.cache_state:
+            return self._control.__get__(obj, objtype)
+        if self.key not in obj._state:
+            obj._state[self.key] = self._control.__get__(obj, objtype)
+        return obj._state[self.key]
+
+    def __set__(self, obj, value):
+        self._control.__set__(obj, value)
+        if obj.cache_state:
+            obj._state[self.key] = value
+
+
+class _TrackedSetting(_StateControl):
+    """A _StateControl whose setting is never queried, because the
+    analyzer does not answer in the form the control expects (SRCPWR?
+    returns the source level, not ON or OFF).  Reads return the value
+    last written, or None if it is unknown: the cache is disabled, or a
+    command that could change it was sent since.
+    """
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if not obj.cache_state:
+            return None
+        return obj._state.get(self.key)
+
+
+def _state_control(get_command, set_command, docs, **kwargs):
+    return _StateControl(
+        _mnemonic(get_command),
+        pymeasure.instruments.Instrument.control(
+            get_command, set_command, docs, **kwargs))
+
+
+def _tracked_setting(get_command, set_command, docs, **kwargs):
+    return _TrackedSetting(
+        _mnemonic(get_command),
+        pymeasure.instruments.Instrument.control(
+            get_command, set_command, docs, **kwargs))
 
 
 class HP8560E(pymeasure.instruments.Instrument):
-    N_POINTS = 601
-    _A_BLOCK_SIZE = 4 + 2 * N_POINTS
+    N_POINTS = traces.N_POINTS
+    Trace = traces.Trace
     _BOOLS = {True: "ON", False: "OFF"}
     _SWEEP_COUPLING = {"SA", "SR"}
     _AMPLITUDE_UNITS = {"DBM", "DBMV", "DBUV", "V", "W", "AUTO", "MAN"}
 
-    def __init__(self, adapter, name="HP 8560E Spectrum Analyzer", **kwargs):
+    # Cached state each setting command can change.  LG only changes
+    # RL and AUNITS when it switches from linear to log; from log it
+    # just changes LG.
+    _FREQUENCY_STATE = ("FA", "FB", "CF", "SP")
+    _STATE_COUPLING = {
+        "FA": ("FA", "CF", "SP"),
+        "FB": ("FB", "CF", "SP"),
+        "CF": _FREQUENCY_STATE,
+        "SP": _FREQUENCY_STATE,
+        "RL": ("RL",),
+        "LG": ("LG", "RL", "AUNITS"),
+        "AUNITS": ("AUNITS", "RL"),
+        "NORMLIZE": ("NORMLIZE", "RL", "LG", "AUNITS"),
+    }
+    # The amplitude settings IP leaves, as the cache keeps them.
+    _PRESET_STATE = {"RL": 0., "LG": 10, "AUNITS": "DBM"}
+    # Commands that leave the cached state alone.  Anything that is
+    # neither here, a query nor in _STATE_COUPLING clears the whole
+    # cache, but for _PRESET_STATE after IP.
+    _STATE_NEUTRAL = {"TS", "DONE", "SNGLS", "CONTS", "TDF", "VIEW",
+                      "SRCTKPK", "STORETHRU", "SRCPWR", "SWPCPL",
+                      "RB", "VB", "ST", "RQS"}
+    # Commands that leave trace B's contents alone.  Any other command,
+    # including STORETHRU and IP, makes them unknown.
+    _TRACE_B_NEUTRAL = (_STATE_NEUTRAL - {"STORETHRU"}) | \
+        set(_STATE_COUPLING) | {"NORMLIZE", "BLANK", "ERR"}
+    # Setting commands that can be sent again with no effect beyond the
+    # first time, to find which of a batch failed.
+    _REPLAYABLE = set(_STATE_COUPLING) | {"SRCPWR", "SWPCPL", "RB", "VB",
+                                          "ST", "TDF"}
+    # Trace modes that have sweeps update the trace they are given.
+    _TRACE_B_SWEEPING = {"CLRW", "MXMH", "MINH"}
+
+    def __init__(self, adapter, name="HP 8560E Spectrum Analyzer",
+                 cache_state=False, stats=None, trace_format="A",
+                 **kwargs):
+        """If cache_state is true, the settings read_trace depends on
+        (frequencies, reference level, log scale and amplitude units)
+        are remembered as they are written, preset or first read,
+        instead of being queried every time.  Writes that could change them
+        invalidate the cache; resync_state() forces a fresh read.
+
+        stats, a latency.LatencyStats, times every command that reaches
+        the bus.
+
+        trace_format is the TDF read_trace uses.  "auto" has
+        select_trace_format() pick the fastest for the link on the
+        first read, or A if the formats read different traces.
+        """
+        if trace_format != "auto":
+            tdf.response_size(trace_format, self.N_POINTS)
+        self.cache_state = cache_state
+        self.trace_format = trace_format
+        self._trace_b_digest = None
+        self._trace_b_sweeping = False
+        self.stats = stats
+        # Bytes in the last trace read, terminator aside.
+        self.trace_bytes = 0
+        self._in_ask = False
+        self._last_label = ""
+        self._state = {}
+        self._batch = None
+        self._batch_sent = None
+        self._batch_binary = False
         super().__init__(adapter, name, includeSCPI=False, **kwargs)
 
-    start_frequency = pymeasure.instruments.Instrument.control(
+    def write(self, command, **kwargs):
+        if self.cache_state:
+            self._invalidate_state_for(command)
+        self._track_trace_b(command)
+        if self._batch is not None:
+            if not any(element.strip().endswith("?")
+                       for element in command.split(";")):
+                if not command.rstrip().endswith(";"):
+                    command += ";"
+                self._batch.append(command.encode("ascii"))
+                return
+            if self._batch:
+                self._flush_batch(query=command)
+                return
+        self._timed("write", command, super().write, command, **kwargs)
+
+    def write_bytes(self, content, **kwargs):
+        # write_trace_mu() records what it wrote to trace B afterwards.
+        self._trace_b_digest = None
+        if self._batch is not None:
+            self._batch.append(bytes(content))
+            self._batch_binary = True
+            return
+        self._timed("write_bytes", content, super().write_bytes, content,
+                    **kwargs)
+
+    def ask(self, command, query_delay=None):
+        if self.stats is None or self._in_ask:
+            return super().ask(command, query_delay)
+        self._in_ask = True
+        start = time.perf_counter()
+        try:
+            response = super().ask(command, query_delay)
+        finally:
+            self._in_ask = False
+        self.stats.record("ask", latency.label(command),
+                          time.perf_counter() - start,
+                          bytes_out=len(command), bytes_in=len(response))
+        return response
+
+    def read(self, **kwargs):
+        return self._timed("read", None, super().read, **kwargs)
+
+    def read_bytes(self, count, **kwargs):
+        return self._timed("read_bytes", None, super().read_bytes, count,
+                           **kwargs)
+
+    def _timed(self, operation, command, send, *args, **kwargs):
+        """Calls send, timing it into stats.  command is what is being
+        written; reads are filed under the last command written.
+        """
+        if command is not None:
+            self._last_label = latency.label(command)
+        if self.stats is None or self._in_ask:
+            return send(*args, **kwargs)
+        start = time.perf_counter()
+        result = send(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        if command is None:
+            self.stats.record(operation, self._last_label, seconds,
+                              bytes_in=len(result))
+        else:
+            self.stats.record(operation, self._last_label, seconds,
+                              bytes_out=len(command))
+        return result
+
+    def phase(self, name):
+        """Returns a context manager attributing the time inside it to
+        the phase name in stats, or doing nothing without stats.
+        """
+        if self.stats is None:
+            return contextlib.nullcontext()
+        return self.stats.phase(name)
+
+    def check_errors(self):
+        """Reads and clears the analyzer's error list.  Returns the
+        error codes, empty if there are none.
+        """
+        response = self.ask("ERR?;").strip()
+        return [code for code in map(int, response.split(",")) if code]
+
+    @contextlib.contextmanager
+    def batch(self, check_errors=False):
+        """Collects the commands written inside the with block and
+        sends them to the analyzer as one message on exit.
+
+        A query inside the block is sent in the same message as what has
+        been collected so far, so e.g. "TS;" followed by wait_for_done()
+        is one round trip.  If the block raises, whatever is still collected is
+        discarded.  Nested batches join the outer one.
+
+        If check_errors is true, the error list is read after the batch
+        and, if it is not empty, CommandError is raised.  To attribute
+        the errors, the batch's plain settings (_REPLAYABLE) are sent
+        again one at a time; the first to fail again is reported.
+        Presets, sweeps, trace uploads and the like are never resent,
+        so if none of the settings fails, the whole batch is reported.
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = []
+        self._batch_sent = []
+        try:
+            yield
+            self._flush_batch()
+        except BaseException:
+            # What reached the analyzer is unknown.
+            self._trace_b_digest = None
+            raise
+        finally:
+            sent = self._batch_sent
+            self._batch = None
+            self._batch_sent = None
+        if not check_errors:
+            return
+        errors = self.check_errors()
+        if not errors:
+            return
+        for command in filter(self._replayable, sent):
+            self._timed("write_bytes", command, super().write_bytes,
+                        command)
+            if self.check_errors():
+                raise CommandError(command, errors)
+        raise CommandError(b"".join(sent), errors)
+
+    def _replayable(self, command):
+        """Whether a batched command is only settings in _REPLAYABLE."""
+        try:
+            text = command.decode("ascii")
+        except UnicodeDecodeError:
+            return False
+        elements = [element.strip() for element in text.split(";")]
+        return all(_mnemonic(element) in self._REPLAYABLE
+                   for element in elements if element)
+
+    def _flush_batch(self, query=None):
+        commands, self._batch = self._batch, []
+        binary, self._batch_binary = self._batch_binary, False
+        if not commands:
+            return
+        self._batch_sent += commands
+        message = b"".join(commands)
+        if query is not None:
+            message += query.encode("ascii")
+        if binary:
+            self._timed("write_bytes", message, super().write_bytes, message)
+        else:
+            self._timed("write", message, super().write,
+                        message.decode("ascii"))
+
+    def _invalidate_state_for(self, command):
+        for element in command.split(";"):
+            element = element.strip()
+            if not element or element.endswith("?"):
+                continue
+            mnemonic = _mnemonic(element)
+            if mnemonic == "IP":
+                self._state.clear()
+                self._state.update(self._PRESET_STATE)
+            elif mnemonic == "LG" and self._state.get("LG"):
+                self._state.pop("LG")
+            elif mnemonic in self._STATE_COUPLING:
+                for key in self._STATE_COUPLING[mnemonic]:
+                    self._state.pop(key, None)
+            elif mnemonic not in self._STATE_NEUTRAL:
+                self._state.clear()
+                return
+
+    def _track_trace_b(self, command):
+        for element in command.split(";"):
+            element = element.strip()
+            if not element or element.endswith("?"):
+                continue
+            mnemonic = _mnemonic(element)
+            if mnemonic in self._TRACE_B_SWEEPING:
+                if "TRB" in element.upper():
+                    self._trace_b_sweeping = True
+                    self._trace_b_digest = None
+            elif mnemonic == "VIEW" or mnemonic == "BLANK":
+                if "TRB" in element.upper():
+                    self._trace_b_sweeping = False
+            elif mnemonic == "IP":
+                self._trace_b_sweeping = False
+                self._trace_b_digest = None
+            elif mnemonic not in self._TRACE_B_NEUTRAL:
+                self._trace_b_digest = None
+
+    @staticmethod
+    def digest(trace_mu):
+        """Returns a short hash of a trace's measurement units."""
+        data = np.asarray(trace_mu).astype(ablock.U16, copy=False)
+        return hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest()
+
+    def _remember_trace_b(self, trace_mu):
+        if not self._trace_b_sweeping:
+            self._trace_b_digest = self.digest(trace_mu)
+
+    def holds_trace(self, trace, which='B', read_back=True):
+        """Returns whether trace B already holds trace, with the same
+        amplitude scale set.  Trace B's contents are remembered from the
+        last write or read of it, or, if unknown and read_back is true,
+        read back.
+        """
+        if which != 'B':
+            raise ValueError("Only trace B's contents are tracked")
+        if self._trace_b_digest is None and read_back:
+            self.read_trace_mu(which='B', scale=(
+                self.amplitude_units, self.reference_level, self.log_scale))
+        return (self._trace_b_digest == self.digest(trace.trace_mu) and
+                self.amplitude_units == trace.amplitude_units and
+                self.reference_level == trace.reference_level and
+                self.log_scale == trace.log_scale)
+
+    def invalidate_state(self):
+        """Forgets all cached state."""
+        self._state.clear()
+
+    def resync_state(self):
+        """Discards the cached state and reads it back from the
+        instrument.
+        """
+        self._state.clear()
+        if self.cache_state:
+            for name, attribute in vars(type(self)).items():
+                if isinstance(attribute, _StateControl):
+                    getattr(self, name)
+
+    start_frequency = _state_control(
         "FA?;", "FA %e;",
         """A floating point property that represents the start frequency
         in Hz. This property can be set.
         """
     )
-    stop_frequency = pymeasure.instruments.Instrument.control(
+    stop_frequency = _state_control(
         "FB?;", "FB %e;",
         """A floating point property that represents the stop frequency
         in Hz. This property can be set.
         """
     )        
-    center_frequency = pymeasure.instruments.Instrument.control(
+    center_frequency = _state_control(
         "CF?;", "CF %e;",
         """A floating point property that represents the center frequency
         in Hz. This property can be set.
         """
     )
-    span = pymeasure.instruments.Instrument.control(
+    span = _state_control(
         "SP?;", "SP %e;",
         """A floating point property that represents the span in Hz.
         This property can be set.
         """
     )
-    reference_level = pymeasure.instruments.Instrument.control(
+    reference_level = _state_control(
         "RL?;", "RL %e dB;",
         """A floating point property that represents the reference level
         in the dB.  This property can be set.
@@ -79,19 +453,21 @@ class HP8560E(pymeasure.instruments.Instrument):
         scale.  This property can be set.
         """
     )
-    source_power = pymeasure.instruments.Instrument.control(
+    source_power = _tracked_setting(
         "SRCPWR?;", "SRCPWR %s;",
         """A boolean property that enables or disables the
-        tracking generator.  This property can be set.
+        tracking generator.  Reads return the value last set, or None
+        if unknown; see _TrackedSetting.
         """,
         validator=pymeasure.instruments.validators.strict_discrete_set,
         values=_BOOLS,
         map_values=True
     )
-    normalize = pymeasure.instruments.Instrument.control(
+    normalize = _tracked_setting(
         "NORMLIZE?;", "NORMLIZE %s;",
-        """A boolean property that enables or disables the
-        tracking generator.  This property can be set.
+        """A boolean property that enables or disables
+        normalization.  Reads return the value last set, or None if
+        unknown; see _TrackedSetting.
         """,
         validator=pymeasure.instruments.validators.strict_discrete_set,
         values=_BOOLS,
@@ -104,24 +480,24 @@ class HP8560E(pymeasure.instruments.Instrument):
         validator=pymeasure.instruments.validators.strict_discrete_set,
         values=_SWEEP_COUPLING,
     )
-    amplitude_units = pymeasure.instruments.Instrument.control(
+    amplitude_units = _state_control(
         "AUNITS?", "AUNITS %s",
         """A property that sets the amplitude units.  This property can be set.
         """,
         validator=pymeasure.instruments.validators.strict_discrete_set,
         values=_AMPLITUDE_UNITS
     )
-    trace_a = pymeasure.instruments.Instrument.measurement(
-        "TDF P;TRA?",
-        """A property for the data points of trace A in parameter units.
-        """
-        )
-    trace_b = pymeasure.instruments.Instrument.measurement(
-        "TDF P;TRB?",
-        """A property for the data points of trace B in parameter units."
-        """
-        )
-    log_scale = pymeasure.instruments.Instrument.control(
+    @property
+    def trace_a(self):
+        """The data points of trace A in parameter units."""
+        return self.read_trace('A').to_parameter_units()
+
+    @property
+    def trace_b(self):
+        """The data points of trace B in parameter units."""
+        return self.read_trace('B').to_parameter_units()
+
+    log_scale = _state_control(
         "LG?", "LG %d DB",
         """
         Control the logarithmic amplitude scale. When in linear
@@ -143,7 +519,7 @@ class HP8560E(pymeasure.instruments.Instrument):
         validator=pymeasure.instruments.validators.strict_discrete_set,
         values=[0, 1, 2, 5, 10]
     )
-    logarithmic_scale = pymeasure.instruments.Instrument.control(
+    logarithmic_scale = _state_control(
         "LG?", "LG %d DB",
         """
         Control the logarithmic amplitude scale. When in linear
@@ -215,45 +591,102 @@ class HP8560E(pymeasure.instruments.Instrument):
         self.ask("DONE?;")
 
     def read_trace(self, which='A'):
+        """Reads trace A or B.  The Trace owns its measurement units, so
+        it stays as read whatever later sweeps do; read_trace_mu() can
+        fill a reusable buffer instead.
+        """
         amplitude_units = self.amplitude_units
         reference_level = self.reference_level
         log_scale = self.log_scale
-        frequencies = self.frequencies
-        self.write(f"TDF A;TR{which}?;")
-        trace_data = self.read_bytes(self._A_BLOCK_SIZE)
-        trace_mu = ablock.from_ablock_u16(trace_data)
+        start_frequency = self.start_frequency
+        stop_frequency = self.stop_frequency
+        trace_mu = self.read_trace_mu(
+            which, scale=(amplitude_units, reference_level, log_scale))
         return self.Trace(amplitude_units=amplitude_units,
                           reference_level=reference_level,
                           log_scale=log_scale,
-                          frequencies=frequencies,
-                          trace_mu=trace_mu)
+                          trace_mu=trace_mu,
+                          start_frequency=start_frequency,
+                          stop_frequency=stop_frequency)
+
+    def read_trace_mu(self, which='A', out=None, trace_format=None,
+                      scale=None):
+        """Reads just the measurement units of trace A or B, without
+        the amplitude and frequency settings read_trace adds, in
+        trace_format or else self.trace_format.  TDF P is converted
+        back to measurement units using scale, (amplitude units,
+        reference level, log scale), which is read if not given.
+
+        If out, a uint16 array of N_POINTS, is given, the decoded trace
+        is copied into it and out is returned, so the caller can keep
+        one buffer across sweeps.  Otherwise a new array is returned.
+        """
+        if trace_format is None:
+            if self.trace_format == "auto":
+                try:
+                    self.select_trace_format()
+                except ValueError as e:
+                    log.warning("%s; reading traces in TDF A", e)
+                    self.trace_format = "A"
+            trace_format = self.trace_format
+        if trace_format == "P" and scale is None:
+            scale = (self.amplitude_units, self.reference_level,
+                     self.log_scale)
+        size = tdf.response_size(trace_format, self.N_POINTS)
+        self.write(f"TDF {trace_format};TR{which}?;")
+        if size is None:
+            trace_data = self.read()
+        else:
+            trace_data = self.read_bytes(size)
+        self.trace_bytes = len(trace_data)
+        trace_mu = tdf.decode(trace_format, trace_data, self.N_POINTS, scale)
+        if which == 'B':
+            self._remember_trace_b(trace_mu)
+        if out is None:
+            return trace_mu
+        out[:] = trace_mu
+        return out
+
+    def select_trace_format(self, formats=tdf.FORMATS, repeats=5,
+                            which='B'):
+        """Times reading a trace in each of formats, checks that they
+        all decode to the same trace, and sets trace_format to the
+        fastest.  Returns {format: best seconds}.
+
+        The trace read must not change meanwhile: trace B is stored or
+        blanked unless it has been set to clear-write.
+        """
+        scale = (self.amplitude_units, self.reference_level,
+                 self.log_scale)
+        timings = {}
+        reference = None
+        for trace_format in formats:
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                trace_mu = self.read_trace_mu(which, trace_format=trace_format,
+                                              scale=scale)
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            if reference is None:
+                reference = trace_mu
+            elif not np.array_equal(trace_mu, reference):
+                raise ValueError(f"TDF {trace_format} read a different "
+                                 f"trace from TDF {formats[0]}")
+            timings[trace_format] = best
+        self.trace_format = min(timings, key=timings.get)
+        return timings
 
     def write_trace(self, trace, which='A'):
         self.amplitude_units = trace.amplitude_units
         self.reference_level = trace.reference_level
         self.log_scale = trace.log_scale
+        self.write_trace_mu(trace.trace_mu, which)
+
+    def write_trace_mu(self, trace_mu, which='A'):
         self.write("TDF A;")
-        trace_data = ablock.to_ablock_u16(trace.trace_mu)
+        trace_data = ablock.to_ablock_u16(trace_mu)
         self.write_bytes(b'TR' + bytes(which, "ascii") +
                          trace_data)
-
-
-    @dataclasses.dataclass
-    class Trace:
-        amplitude_units: str
-        reference_level: float
-        log_scale: int
-        frequencies: [float]
-        trace_mu: [int]
-
-        def to_parameter_units(self):
-            if self.amplitude_units.startswith("DB"):
-                return map(lambda x: self.reference_level + self.log_scale * (x / 60. - 10.),
-                           self.trace_mu)
-            else:
-                return map(lambda x: self.reference_level * (x / 600.),
-                           self.trace_mu)
-
-        def to_dataframe(self):
-            return pd.DataFrame({'frequencies': self.frequencies,
-                                 'amplitudes': self.to_parameter_units()})
+        if which == 'B':
+            self._remember_trace_b(trace_mu)
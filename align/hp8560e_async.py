@@ -0,0 +1,250 @@
+"""asyncio front end for the HP 8560E driver.
+
+pyvisa only blocks, so every transfer runs on a worker thread while
+the event loop is free to read other instruments, analyze traces or
+write files.  A per-instrument lock keeps commands in order.  The
+blocking HP8560E in hp8560e.py remains the driver for the scripts;
+this wraps one:
+
+    sa = hp8560e_async.AsyncHP8560E(hp8560e.HP8560E(adapter))
+    await sa.configure(start_frequency=1.8e6, stop_frequency=2e6)
+    await sa.take_sweep(timeout=10)
+    trace = await sa.read_trace()
+
+Instruments behind one gateway share its bus.  Give them the same
+SharedLink and their transfers take turns, round robin.
+"""
+
+import asyncio
+import collections
+import contextlib
+import time
+
+import pyvisa.constants
+import pyvisa.errors
+
+
+class SharedLink:
+    """A link several instruments share, e.g. an E5810A's GPIB bus.
+
+    One transfer holds it at a time.  Waiting instruments are served
+    round robin, so one instrument's trace transfers or sweep polls
+    cannot starve the others.  held and transfers record, per owner,
+    the seconds it held the link and how many times.
+    """
+
+    def __init__(self):
+        self._busy = False
+        # Owner -> its waiting futures; the next owner served is first.
+        self._waiting = collections.OrderedDict()
+        self.held = collections.Counter()
+        self.transfers = collections.Counter()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, owner):
+        if self._busy or self._waiting:
+            future = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(owner, collections.deque()).append(
+                future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as we were cancelled: pass it on.
+                    self._release()
+                raise
+        else:
+            self._busy = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.held[owner] += time.perf_counter() - start
+            self.transfers[owner] += 1
+            self._release()
+
+    def _release(self):
+        while self._waiting:
+            owner, waiting = next(iter(self._waiting.items()))
+            future = waiting.popleft()
+            # Move the owner to the back of the line.
+            del self._waiting[owner]
+            if waiting:
+                self._waiting[owner] = waiting
+            if not future.done():
+                future.set_result(None)
+                return
+        self._busy = False
+
+
+class AsyncHP8560E:
+    # Status byte bits (serial poll), per the 8560E programming manual.
+    STB_END_OF_SWEEP = 0x04
+    STB_RQS = 0x40
+
+    def __init__(self, sa, poll_interval=0.050, link=None, name=None):
+        """link is a SharedLink to take turns on with other instruments;
+        name is what this instrument is called in its statistics.
+        """
+        self.sa = sa
+        self.poll_interval = poll_interval
+        self.link = link
+        self.name = name
+        self._lock = asyncio.Lock()
+
+    async def _transfer(self, fn, *args, **kwargs):
+        """Runs a blocking call on a worker thread, holding the shared
+        link if there is one.
+        """
+        if self.link is None:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        async with self.link.slot(self.name or self):
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def _run(self, fn, *args, **kwargs):
+        async with self._lock:
+            return await self._transfer(fn, *args, **kwargs)
+
+    async def call(self, fn, *args, **kwargs):
+        """Runs fn(sa, *args, **kwargs) with the wrapped HP8560E, for
+        blocking helpers written against the synchronous driver.
+        """
+        return await self._run(fn, self.sa, *args, **kwargs)
+
+    async def write(self, command):
+        await self._run(self.sa.write, command)
+
+    async def ask(self, command):
+        return await self._run(self.sa.ask, command)
+
+    async def get(self, name):
+        """Reads a property of the wrapped HP8560E."""
+        return await self._run(getattr, self.sa, name)
+
+    async def set(self, name, value):
+        """Sets a property of the wrapped HP8560E."""
+        await self._run(setattr, self.sa, name, value)
+
+    async def configure(self, preset=False, single_sweep=True, commands=(),
+                        check_errors=False, **settings):
+        """Applies property settings, followed by any raw commands, in
+        one batched message, checked as HP8560E.batch() does.
+        """
+        def configure():
+            with self.sa.batch(check_errors):
+                if preset:
+                    self.sa.preset()
+                if single_sweep:
+                    self.sa.set_single_sweep_mode()
+                for name, value in settings.items():
+                    setattr(self.sa, name, value)
+                for command in commands:
+                    self.sa.write(command)
+        await self._run(configure)
+
+    async def preset(self):
+        await self._run(self.sa.preset)
+
+    async def set_single_sweep_mode(self):
+        await self._run(self.sa.set_single_sweep_mode)
+
+    async def set_continuous_sweep_mode(self):
+        await self._run(self.sa.set_continuous_sweep_mode)
+
+    async def take_sweep(self, timeout=None, method="poll"):
+        await self._wait("TS;", timeout, method)
+
+    async def wait_for_done(self, timeout=None, method="poll"):
+        """Waits for the analyzer to finish the commands sent so far,
+        typically a sweep, without blocking the event loop.
+
+        method is one of:
+          "poll"  send DONE? and poll for the reply with short reads;
+          "srq"   enable the end-of-sweep service request and serial
+                  poll the status byte, which does not tie up the bus
+                  with a pending read.
+
+        Raises TimeoutError after timeout seconds.  The outstanding
+        DONE? reply is read and discarded first, which waits for the
+        sweep to end, so the instrument is usable afterwards.
+        """
+        await self._wait("", timeout, method)
+
+    async def _wait(self, command, timeout, method):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        async with self._lock:
+            if method == "poll":
+                await self._wait_poll(command, deadline)
+            elif method == "srq":
+                await self._wait_srq(command, deadline)
+            else:
+                raise ValueError(f"Unknown wait method {method!r}")
+
+    def _timed_out(self, deadline):
+        return deadline is not None and time.monotonic() >= deadline
+
+    async def _wait_poll(self, command, deadline):
+        connection = self.sa.adapter.connection
+        await self._transfer(self.sa.write, command + "DONE?;")
+        try:
+            while True:
+                try:
+                    await self._transfer(
+                        self._read_with_timeout, connection,
+                        self.poll_interval)
+                    return
+                except pyvisa.errors.VisaIOError as e:
+                    if (e.error_code !=
+                            pyvisa.constants.StatusCode.error_timeout):
+                        raise
+                if self._timed_out(deadline):
+                    raise TimeoutError("HP8560E sweep did not complete")
+        except BaseException:
+            # The DONE? reply is still to come.  Read it here so the
+            # next query does not take it as its own answer.
+            await self._transfer(self._resync, connection)
+            raise
+
+    def _resync(self, connection):
+        """Discards an outstanding DONE? reply.  A device clear drops it
+        on GPIB but does nothing on a SOCKET resource, so ID? is sent as
+        a sentinel and replies are read up to its answer, which is never
+        DONE?'s "1".
+        """
+        connection.clear()
+        self.sa.write("ID?;")
+        while self.sa.read().strip() == "1":
+            pass
+
+    def _read_with_timeout(self, connection, timeout):
+        saved = connection.timeout
+        connection.timeout = max(1, int(timeout * 1000))
+        try:
+            return self.sa.read()
+        finally:
+            connection.timeout = saved
+
+    async def _wait_srq(self, command, deadline):
+        connection = self.sa.adapter.connection
+        # Serial poll once to clear a stale request, then arm before
+        # starting the sweep so its end cannot be missed.
+        await self._transfer(connection.read_stb)
+        await self._transfer(
+            self.sa.write, f"RQS {self.STB_END_OF_SWEEP};" + command)
+        try:
+            while True:
+                stb = await self._transfer(connection.read_stb)
+                if stb & (self.STB_END_OF_SWEEP | self.STB_RQS):
+                    return
+                if self._timed_out(deadline):
+                    raise TimeoutError("HP8560E sweep did not complete")
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            with contextlib.suppress(pyvisa.errors.VisaIOError):
+                await self._transfer(self.sa.write, "RQS 0;")
+
+    async def read_trace(self, which='A'):
+        return await self._run(self.sa.read_trace, which)
+
+    async def write_trace(self, trace, which='A'):
+        await self._run(self.sa.write_trace, trace, which)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""A local stand-in for the HP 8560E, for testing and benchmarking the
+driver without tying up the analyzer.
+
+It speaks the subset of the command language HP8560E uses over a raw
+TCP socket (pyvisa resource "TCPIP::host::port::SOCKET" with "\\n"
+termination): FA, FB, CF, SP, RL, LG, AUNITS, RB, VB, ST, SRCPWR,
+SWPCPL, NORMLIZE, IP, SNGLS, CONTS, TS, DONE?, SRCTKPK, STORETHRU, TDF,
+TRA?/TRB?, trace writes, ERR? and ID?.  Commands it does not know are
+accepted and reported by ERR? as error 112, as the analyzer would.
+
+The tracking generator sees a filter with a little ripple; without
+source power the trace is the noise floor.  Each query reply is delayed
+by a configurable latency and TS takes the sweep time, so timing
+behaves roughly like the real thing behind the E5810A.
+"""
+
+import argparse
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import numpy as np
+
+import ablock
+
+N_POINTS = 601
+ERROR_UNKNOWN_COMMAND = 112
+
+_TRACE_WRITE = re.compile(rb"TR([AB])\s*#A")
+_COMMAND = re.compile(r"([A-Z]+)(\?)?\s*(.*)$", re.DOTALL)
+_NUMBER = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+_FREQUENCY_UNITS = {"HZ": 1., "KHZ": 1e3, "MZ": 1e6, "MHZ": 1e6,
+                    "GZ": 1e9, "GHZ": 1e9}
+
+
+def _number(arg):
+    match = _NUMBER.match(arg.strip())
+    if not match:
+        raise ValueError(arg)
+    return float(match.group(0)), arg.strip()[match.end():].strip().upper()
+
+
+def _frequency(arg):
+    value, units = _number(arg)
+    return value * _FREQUENCY_UNITS.get(units, 1.)
+
+
+class HP8560EEmulator:
+    def __init__(self, latency=0., sweep_time=0.050, seed=0):
+        self.latency = latency
+        self.default_sweep_time = sweep_time
+        self._rng = np.random.default_rng(seed)
+        self._buffer = b""
+        self.commands = 0
+        self.queries = 0
+        self.preset()
+
+    def preset(self):
+        self.start_frequency = 0.
+        self.stop_frequency = 2.9e9
+        self.reference_level = 0.
+        self.log_scale = 10
+        self.amplitude_units = "DBM"
+        self.resolution_bandwidth = 1e6
+        self.video_bandwidth = 1e6
+        self.sweep_time = self.default_sweep_time
+        self.source_power = False
+        self.normalize = False
+        self.sweep_coupling = "SA"
+        self.trace_format = "P"
+        self.continuous = True
+        self.sweep_end = 0.
+        self.errors = []
+        self.trace_a = self._measure()
+        self.trace_b = np.zeros(N_POINTS, dtype=np.uint16)
+
+    # Signal model.
+
+    def _frequencies(self):
+        return np.linspace(self.start_frequency, self.stop_frequency,
+                           N_POINTS)
+
+    def _measure(self):
+        """Returns one sweep of trace A in measurement units."""
+        f = self._frequencies()
+        if self.source_power:
+            span = max(self.stop_frequency - self.start_frequency, 1.)
+            phase = 2 * np.pi * (f - self.start_frequency) / span
+            db = -5. + 0.2 * np.sin(3 * phase) + \
+                self._rng.normal(0., 0.03, N_POINTS)
+        else:
+            db = -90. + self._rng.normal(0., 2., N_POINTS)
+        if self.log_scale:
+            mu = 60. * ((db - self.reference_level) / self.log_scale + 10.)
+        else:
+            volts = np.sqrt(50. * 1e-3 * 10. ** (db / 10.))
+            mu = 600. * volts / max(self.reference_level, 1e-9)
+        if self.normalize:
+            mu = mu - self.trace_b + 600.
+        return np.clip(np.rint(mu), 0, 610).astype(np.uint16)
+
+    def _to_parameter_units(self, mu):
+        if self.log_scale:
+            return self.reference_level + self.log_scale * (mu / 60. - 10.)
+        return self.reference_level * (mu / 600.)
+
+    def _from_parameter_units(self, values):
+        if self.log_scale:
+            mu = 60. * ((values - self.reference_level) /
+                        self.log_scale + 10.)
+        else:
+            mu = 600. * values / max(self.reference_level, 1e-9)
+        return np.clip(np.rint(mu), 0, 610).astype(np.uint16)
+
+    def _sweep(self):
+        self.sweep_end = time.monotonic() + self.sweep_time
+        self.trace_a = self._measure()
+
+    # Protocol.
+
+    def feed(self, data):
+        """Consumes bytes from the controller and returns the reply
+        bytes.  Incomplete commands are held until more data arrives.
+        """
+        self._buffer += data
+        out = bytearray()
+        while True:
+            command = self._next_command()
+            if command is None:
+                return bytes(out)
+            reply = self._execute(*command)
+            if reply is not None:
+                if self.latency:
+                    time.sleep(self.latency)
+                out += reply
+
+    def _next_command(self):
+        self._buffer = self._buffer.lstrip(b" ;\r\n\t")
+        if not self._buffer:
+            return None
+        match = _TRACE_WRITE.match(self._buffer[:8].upper())
+        if match:
+            # An A-block: '#A', a 16-bit length, then that many bytes.
+            start = match.end() - 2
+            if len(self._buffer) < start + ablock.HEADER_SIZE:
+                return None
+            end = start + ablock.HEADER_SIZE + int.from_bytes(
+                self._buffer[start + 2:start + 4], "big")
+            if len(self._buffer) < end:
+                return None
+            block = self._buffer[start:end]
+            self._buffer = self._buffer[end:]
+            return ("TRACE", match.group(1).decode(), block)
+        end = min((i for i in (self._buffer.find(b";"),
+                               self._buffer.find(b"\n")) if i >= 0),
+                  default=-1)
+        if end < 0:
+            return None
+        text = self._buffer[:end].decode("ascii", "replace").strip()
+        self._buffer = self._buffer[end + 1:]
+        return ("TEXT", text, None)
+
+    def _execute(self, kind, text, block):
+        self.commands += 1
+        if kind == "TRACE":
+            self._set_trace(text, ablock.from_ablock_u16(block))
+            return None
+        match = _COMMAND.match(text.upper())
+        if not match:
+            self.errors.append(ERROR_UNKNOWN_COMMAND)
+            return None
+        mnemonic, query, arg = match.groups()
+        try:
+            if query:
+                self.queries += 1
+                reply = self._query(mnemonic)
+                if isinstance(reply, str):
+                    reply = (reply + "\n").encode("ascii")
+                return reply
+            self._command(mnemonic, arg)
+        except (KeyError, ValueError):
+            self.errors.append(ERROR_UNKNOWN_COMMAND)
+        return None
+
+    def _set_trace(self, which, mu):
+        mu = np.asarray(mu, dtype=np.uint16)
+        if which == "A":
+            self.trace_a = mu
+        else:
+            self.trace_b = mu
+
+    def _set_span(self, center, span):
+        self.start_frequency = center - span / 2.
+        self.stop_frequency = center + span / 2.
+
+    def _command(self, mnemonic, arg):
+        center = (self.start_frequency + self.stop_frequency) / 2.
+        span = self.stop_frequency - self.start_frequency
+        if mnemonic == "FA":
+            self.start_frequency = _frequency(arg)
+        elif mnemonic == "FB":
+            self.stop_frequency = _frequency(arg)
+        elif mnemonic == "CF":
+            self._set_span(_frequency(arg), span)
+        elif mnemonic == "SP":
+            self._set_span(center, _frequency(arg))
+        elif mnemonic == "RL":
+            self.reference_level = _number(arg)[0]
+        elif mnemonic == "LG":
+            self.log_scale = int(_number(arg)[0])
+        elif mnemonic == "AUNITS":
+            self.amplitude_units = arg.strip()
+        elif mnemonic == "RB":
+            self.resolution_bandwidth = _frequency(arg)
+        elif mnemonic == "VB":
+            self.video_bandwidth = _frequency(arg)
+        elif mnemonic == "ST":
+            self.sweep_time = _number(arg)[0]
+        elif mnemonic == "SRCPWR":
+            self.source_power = arg.strip() in ("ON", "1")
+        elif mnemonic == "NORMLIZE":
+            self.normalize = arg.strip() in ("ON", "1")
+        elif mnemonic == "SWPCPL":
+            self.sweep_coupling = arg.strip()
+        elif mnemonic == "TDF":
+            if arg.strip() not in ("P", "M", "A", "I", "B"):
+                raise ValueError(arg)
+            self.trace_format = arg.strip()
+        elif mnemonic == "IP":
+            self.preset()
+        elif mnemonic == "SNGLS":
+            self.continuous = False
+        elif mnemonic == "CONTS":
+            self.continuous = True
+        elif mnemonic in ("TS", "SRCTKPK"):
+            self._sweep()
+        elif mnemonic == "STORETHRU":
+            self.trace_b = self.trace_a.copy()
+        elif mnemonic == "TRA" or mnemonic == "TRB":
+            values = np.array([float(v) for v in arg.split(",")])
+            self._set_trace(mnemonic[2], self._from_parameter_units(values))
+        elif mnemonic in ("VIEW", "BLANK", "CLRW", "RQS", "DONE"):
+            pass
+        else:
+            raise KeyError(mnemonic)
+
+    def _query(self, mnemonic):
+        if mnemonic == "DONE":
+            remaining = self.sweep_end - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            return "1"
+        if mnemonic in ("TRA", "TRB"):
+            if mnemonic == "TRA" and self.continuous:
+                self._sweep()
+            mu = self.trace_a if mnemonic == "TRA" else self.trace_b
+            if self.trace_format == "A":
+                return ablock.to_ablock_u16(mu)
+            if self.trace_format == "I":
+                return b"#I" + mu.astype(ablock.U16).tobytes()
+            if self.trace_format == "B":
+                return mu.astype(ablock.U16).tobytes()
+            if self.trace_format == "M":
+                return ",".join(str(v) for v in mu)
+            # dB to 0.01 dB like the analyzer, linear units to 4 digits.
+            spec = ".2f" if self.log_scale else ".3e"
+            return ",".join(f"{v:{spec}}"
+                            for v in self._to_parameter_units(mu))
+        if mnemonic == "ERR":
+            errors, self.errors = self.errors, []
+            return ",".join(str(e) for e in errors) or "0"
+        values = {
+            "FA": lambda: self.start_frequency,
+            "FB": lambda: self.stop_frequency,
+            "CF": lambda: (self.start_frequency + self.stop_frequency) / 2.,
+            "SP": lambda: self.stop_frequency - self.start_frequency,
+            "RL": lambda: self.reference_level,
+            "RB": lambda: self.resolution_bandwidth,
+            "VB": lambda: self.video_bandwidth,
+            "ST": lambda: self.sweep_time,
+        }
+        if mnemonic in values:
+            return f"{values[mnemonic]():.9E}"
+        if mnemonic == "LG":
+            return str(self.log_scale)
+        if mnemonic == "AUNITS":
+            return self.amplitude_units
+        if mnemonic == "SRCPWR":
+            return "ON" if self.source_power else "OFF"
+        if mnemonic == "NORMLIZE":
+            return "ON" if self.normalize else "OFF"
+        if mnemonic == "SWPCPL":
+            return self.sweep_coupling
+        if mnemonic == "TDF":
+            return self.trace_format
+        if mnemonic == "ID":
+            return "HP8560E"
+        raise KeyError(mnemonic)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        emulator = self.server.emulator_factory()
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            if hasattr(socket, "TCP_QUICKACK"):
+                # pyvisa-py leaves Nagle on, so back-to-back writes
+                # would otherwise wait ~40 ms on our delayed ACK.
+                self.request.setsockopt(socket.IPPROTO_TCP,
+                                        socket.TCP_QUICKACK, 1)
+            reply = emulator.feed(data)
+            if reply:
+                self.request.sendall(reply)
+
+
+class EmulatorServer(socketserver.ThreadingTCPServer):
+    """Serves one emulated analyzer per connection."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.,
+                 sweep_time=0.050):
+        super().__init__(address, _Handler)
+        self.emulator_factory = lambda: HP8560EEmulator(
+            latency=latency, sweep_time=sweep_time)
+
+    @property
+    def resource(self):
+        host, port = self.server_address[:2]
+        return f"TCPIP::{host}::{port}::SOCKET"
+
+    def start(self):
+        """Serves from a daemon thread and returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="HP 8560E emulator.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5025)
+    parser.add_argument("--latency", type=float, default=0.,
+                        help="seconds added to every query reply")
+    parser.add_argument("--sweep-time", type=float, default=0.050)
+    args = parser.parse_args(argv[1:])
+
+    server = EmulatorServer((args.host, args.port), latency=args.latency,
+                            sweep_time=args.sweep_time)
+    print(f"Serving {server.resource}")
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Checks each align.py subcommand's import time against a budget.
+
+For every subcommand, imports it in a fresh interpreter under
+python -X importtime and adds up the time of everything it imports,
+taking the fastest of a few runs.  Fails if a subcommand is over its
+budget or imports a module it should not: nothing may import the
+plotting modules or pandas up front, and the offline subcommands may
+not import VISA at all.
+
+    importtime.py [--repeat N] [--scale F] [SUBCOMMAND...]
+
+--scale multiplies the budgets, for slow machines.  Run from anywhere;
+the subcommands are imported from this directory.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+import align
+
+# Milliseconds, on a desktop with warm caches.  numpy is about 100 ms
+# of each; pymeasure and pyvisa another 150.
+BUDGET_MS = {"cal-thru": 400, "band": 400, "precal": 400, "stations": 450,
+             "dump-cal": 200, "plot": 200, "fleet": 200, "trace-test": 400}
+
+_NEVER = {"matplotlib", "seaborn", "pandas"}
+_VISA = {"pyvisa", "pymeasure"}
+FORBIDDEN = {name: _NEVER | (_VISA if name in ("dump-cal", "plot", "fleet")
+                             else set())
+             for name in align.SUBCOMMANDS}
+
+
+def measure(name):
+    """Imports subcommand name in a new interpreter.  Returns (seconds,
+    set of top-level module names it imported).
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         f"import align; align.load({name!r})"],
+        cwd=directory, capture_output=True, text=True, check=True)
+    # Lines are "import time: self | cumulative | name", written as
+    # each import finishes, nested imports indented and before their
+    # parent.  Everything at the top level after align itself was
+    # imported by load().
+    seconds = 0.
+    modules = set()
+    after_align = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        modules.add(module.strip().split(".")[0])
+        top_level = not module.startswith("  ")
+        if top_level and after_align:
+            seconds += int(cumulative) * 1e-6
+        if top_level and module.strip() == "align":
+            after_align = True
+    return seconds, modules
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Check the subcommands' import times.")
+    parser.add_argument("subcommands", nargs="*", metavar="SUBCOMMAND",
+                        help="default: all of them")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.)
+    args = parser.parse_args(argv[1:])
+    unknown = set(args.subcommands) - set(align.SUBCOMMANDS)
+    if unknown:
+        parser.error(f"unknown subcommands: {', '.join(sorted(unknown))}")
+
+    failed = False
+    for name in args.subcommands or align.SUBCOMMANDS:
+        runs = [measure(name) for _ in range(args.repeat)]
+        seconds = min(seconds for seconds, _ in runs)
+        forbidden = sorted(set.union(*(modules for _, modules in runs)) &
+                           FORBIDDEN[name])
+        budget = BUDGET_MS[name] * args.scale
+        over = 1e3 * seconds > budget
+        failed |= over or bool(forbidden)
+        print(f"{name:12s} {1e3 * seconds:6.0f} ms (budget {budget:4.0f})"
+              f"{'  OVER' if over else ''}"
+              f"{'  imports ' + ', '.join(forbidden) if forbidden else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
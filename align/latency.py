@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Per-command latency statistics for HP8560E.
+
+Pass a LatencyStats to HP8560E(stats=...) and every write, ask, read,
+read_bytes and write_bytes that reaches the bus is timed.  Commands are
+grouped by their mnemonics, so "FA 14000000HZ;" and "FA 7000000HZ;" are
+one entry.  Each entry keeps a count, total and max time, bytes each
+way and a histogram with power-of-two buckets from 100 us.
+
+phase() attributes time to a named phase of the caller's work.  Phases
+nest ("20m/configure") and follow asyncio tasks and to_thread(), so
+overlapping phases in cal_thru.py are kept apart.  A phase's
+other_seconds is its time not spent in commands: Python processing,
+file I/O and so on.  DONE? waits, i.e. sweeps, count as bus time.
+
+Run as a script, prints the tables for a saved JSON file.
+"""
+
+import atexit
+import bisect
+import contextlib
+import contextvars
+import json
+import re
+import sys
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in seconds; the last bucket
+# is everything slower.
+BUCKETS = [1e-4 * 2 ** k for k in range(18)]
+
+# The names of the enclosing phases, innermost last.
+_phase = contextvars.ContextVar("latency_phase", default=())
+_MNEMONIC = re.compile(rb"\s*([A-Za-z]+)[^;?#]*(\??)")
+
+
+def label(command):
+    """Returns command's mnemonics, e.g. "TDF;TRA?" for "TDF A;TRA?;"."""
+    if isinstance(command, str):
+        command = command.encode("ascii", "replace")
+    # Binary trace data follows "#A"; only the text before it matters.
+    command = command.split(b"#", 1)[0]
+    mnemonics = []
+    for element in command.split(b";"):
+        match = _MNEMONIC.match(element)
+        if match:
+            mnemonics.append((match.group(1).upper() +
+                              match.group(2)).decode())
+    return ";".join(mnemonics)
+
+
+class LatencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands = {}
+        self.phases = {}
+
+    def record(self, operation, command_label, seconds, bytes_out=0,
+               bytes_in=0):
+        key = f"{operation} {command_label}"
+        with self._lock:
+            entry = self.commands.get(key)
+            if entry is None:
+                entry = self.commands[key] = {
+                    "count": 0, "seconds": 0., "max_seconds": 0.,
+                    "bytes_out": 0, "bytes_in": 0,
+                    "histogram": [0] * (len(BUCKETS) + 1)}
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["bytes_out"] += bytes_out
+            entry["bytes_in"] += bytes_in
+            entry["histogram"][bisect.bisect_left(BUCKETS, seconds)] += 1
+            for phase in _phase.get():
+                entry = self._phase_entry(phase)
+                entry["bus_seconds"] += seconds
+                entry["commands"] += 1
+
+    def _phase_entry(self, name):
+        return self.phases.setdefault(name, {
+            "count": 0, "seconds": 0., "bus_seconds": 0., "commands": 0})
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        outer = _phase.get()
+        if outer:
+            name = f"{outer[-1]}/{name}"
+        token = _phase.set(outer + (name,))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _phase.reset(token)
+            with self._lock:
+                entry = self._phase_entry(name)
+                entry["count"] += 1
+                entry["seconds"] += elapsed
+
+    def to_dict(self):
+        with self._lock:
+            phases = {name: dict(entry, other_seconds=max(
+                entry["seconds"] - entry["bus_seconds"], 0.))
+                      for name, entry in self.phases.items()}
+            return {"buckets": BUCKETS,
+                    "commands": {key: dict(entry, histogram=list(
+                        entry["histogram"]))
+                                 for key, entry in self.commands.items()},
+                    "phases": phases}
+
+    def dump(self, path=None):
+        """Writes the statistics as JSON to path, or stdout if None."""
+        text = json.dumps(self.to_dict(), indent=1)
+        if path is None:
+            print(text)
+        else:
+            with open(path, "w") as f:
+                f.write(text + "\n")
+
+    def dump_at_exit(self, path=None):
+        atexit.register(self.dump, path)
+
+    def report(self, stream=sys.stdout):
+        report(self.to_dict(), stream)
+
+
+def report(data, stream=sys.stdout):
+    """Prints the slowest commands and the phases of to_dict()'s or a
+    dump's data as tables.
+    """
+    width = max(map(len, [*data["commands"], *data["phases"], "phase"]))
+    print(f"{'command':{width}s} {'count':>7s} {'total s':>9s} "
+          f"{'mean ms':>9s} {'max ms':>9s} {'kB in':>8s}", file=stream)
+    for key, entry in sorted(data["commands"].items(),
+                             key=lambda item: -item[1]["seconds"]):
+        print(f"{key:{width}s} {entry['count']:7d} "
+              f"{entry['seconds']:9.3f} "
+              f"{1e3 * entry['seconds'] / entry['count']:9.2f} "
+              f"{1e3 * entry['max_seconds']:9.2f} "
+              f"{entry['bytes_in'] / 1e3:8.1f}", file=stream)
+    if data["phases"]:
+        print(f"\n{'phase':{width}s} {'count':>7s} {'total s':>9s} "
+              f"{'bus s':>9s} {'other s':>9s}", file=stream)
+        for name, entry in data["phases"].items():
+            print(f"{name:{width}s} {entry['count']:7d} "
+                  f"{entry['seconds']:9.3f} {entry['bus_seconds']:9.3f} "
+                  f"{entry['other_seconds']:9.3f}", file=stream)
+
+
+def main(argv):
+    if len(argv) != 2:
+        print(f"usage: {argv[0]} STATS_JSON", file=sys.stderr)
+        return 2
+    with open(argv[1]) as f:
+        report(json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
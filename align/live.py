@@ -0,0 +1,130 @@
+"""Live alignment readout.
+
+Sweeps the analyzer back to back and keeps per-point statistics over
+the most recent sweeps, so the effect of each adjustment shows up on
+the terminal within a sweep or two.  The statistics are windowed
+Welford updates over a ring buffer: each new sweep replaces the oldest
+one in O(points), however deep the window.
+"""
+
+import dataclasses
+import sys
+import time
+
+import numpy as np
+
+
+class SweepStatistics:
+    """Per-point mean, std, min and max over the last depth sweeps."""
+
+    def __init__(self, n_points, depth=8):
+        self.depth = depth
+        self.sweeps = np.zeros((depth, n_points))
+        self.count = 0
+        self.total = 0
+        self.mean = np.zeros(n_points)
+        self._m2 = np.zeros(n_points)
+
+    def add(self, values):
+        slot = self.total % self.depth
+        self.total += 1
+        if self.count < self.depth:
+            self.count += 1
+            delta = values - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (values - self.mean)
+        else:
+            # Replace the oldest sweep: remove and add in one step.
+            oldest = self.sweeps[slot]
+            old_mean = self.mean.copy()
+            self.mean += (values - oldest) / self.count
+            self._m2 += (values - oldest) * (values - self.mean +
+                                             oldest - old_mean)
+        self.sweeps[slot] = values
+
+    @property
+    def latest(self):
+        return self.sweeps[(self.total - 1) % self.depth]
+
+    @property
+    def std(self):
+        """Population std of each point over the window."""
+        return np.sqrt(np.maximum(self._m2, 0.) / max(self.count, 1))
+
+    @property
+    def min(self):
+        return self.sweeps[:self.count].min(axis=0)
+
+    @property
+    def max(self):
+        return self.sweeps[:self.count].max(axis=0)
+
+
+class BusMeter:
+    """Splits the loop's wall time into sweeping and transferring."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sweep_seconds = 0.
+        self.transfer_seconds = 0.
+        self.bytes = 0
+        self.sweeps = 0
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (f"{self.sweeps / elapsed:5.1f} sweeps/s, "
+                f"bus {100 * self.transfer_seconds / elapsed:3.0f}% "
+                f"({self.bytes / elapsed / 1e3:6.1f} kB/s), "
+                f"sweeping {100 * self.sweep_seconds / elapsed:3.0f}%")
+
+
+def readout(stats):
+    """Returns the one-line summary of the band: the latest sweep's mean
+    and std as align_band.py reports them, the ripple (peak to peak) of
+    the windowed mean, and the worst per-point sweep to sweep spread.
+    """
+    latest = stats.latest
+    ripple = np.ptp(stats.mean)
+    spread = np.max(stats.max - stats.min)
+    return (f"mean={latest.mean():7.3f} std={latest.std():6.3f} "
+            f"ripple={ripple:6.3f} noise={stats.std.mean():6.3f} "
+            f"spread={spread:6.3f} dB")
+
+
+def run(sa, depth=8, refresh=0.1, stream=sys.stdout):
+    """Sweeps and reads trace A until interrupted, redrawing the
+    readout at most every refresh seconds.  Returns the statistics,
+    None if interrupted before the first trace was read, with the
+    analyzer's output buffer cleared.
+    """
+    sa.set_single_sweep_mode()
+    stats = None
+    try:
+        trace = sa.read_trace()
+        stats = SweepStatistics(len(trace.trace_mu), depth)
+        meter = BusMeter()
+        buffer = np.empty(len(trace.trace_mu), dtype=np.uint16)
+        drawn = 0.
+        while True:
+            t0 = time.perf_counter()
+            sa.take_sweep()
+            t1 = time.perf_counter()
+            sa.read_trace_mu(out=buffer)
+            t2 = time.perf_counter()
+            meter.sweep_seconds += t1 - t0
+            meter.transfer_seconds += t2 - t1
+            meter.bytes += sa.trace_bytes
+            meter.sweeps += 1
+            stats.add(dataclasses.replace(
+                trace, trace_mu=buffer).to_parameter_units())
+            if t2 - drawn >= refresh:
+                drawn = t2
+                stream.write(f"\r{readout(stats)}  {meter.report()}")
+                stream.flush()
+    except KeyboardInterrupt:
+        # Ctrl-C can land between a query and its reply.  Clear the
+        # analyzer so the unread reply is not taken as the answer to
+        # the next query.
+        sa.adapter.connection.clear()
+        stream.write("\n")
+    return stats
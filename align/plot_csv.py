@@ -1,52 +1,185 @@
 #!/usr/bin/env python3
 
-import math
+import argparse
+import concurrent.futures
+import hashlib
 import json
+import math
+import os
 import pathlib
 import sys
-
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
-import seaborn as sns
+import time
 
 import bands
 
+CACHE_NAME = "plot_cache.json"
+# Bump when the plot changes so cached PNGs are redrawn.
+RENDER_VERSION = 1
 
-def main(argv):
+_figure = None
+
+
+def _init_worker():
+    global _figure
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     sns.set_theme()
-    
-    summary_lines = []
-
-    for path in argv[1:]:
-        print(path)
-        with open(path, "r") as f:
-            df = pd.read_csv(path)
-            band = bands.which_band(df['frequencies'][0])
-            df['frequencies'] = df['frequencies'] / 1e6
-
-            mean = df['amplitudes'].mean()
-            std = df['amplitudes'].std()
-
-            title = (f"{band.name:6s} mean={mean:6.2f}, std={std:6.2f} dB")
-            ax = df.plot(x='frequencies', y='amplitudes',
-                         label=None)
-            ax.get_legend().remove()
-            ax.set(xlabel="MHz", ylabel="IL (dB)", title=title)
-            ax.minorticks_on()
-            y_max = 0 if df['amplitudes'].max() < 0. else 5.0
-            y_min = min(math.ceil(df['amplitudes'].min() / -10.) * -10., -10.)
-            ax.set_ybound(y_max, y_min)
-
-            plt.tight_layout()
-            
-            gif_path = pathlib.Path(path).with_suffix(".png")
-            plt.savefig(gif_path, dpi=300)
-
-            summary_lines += [title]
-
-    for line in sorted(summary_lines, key=lambda s: int(s[:s.find('m')])):
-        print(line)
+    _figure = plt.figure()
+
+
+def _summarize(df):
+    band = bands.which_band(df['frequencies'][0])
+    mean = df['amplitudes'].mean()
+    std = df['amplitudes'].std()
+    return band, f"{band.name:6s} mean={mean:6.2f}, std={std:6.2f} dB"
+
+
+def summarize(path):
+    """Returns (band name, summary title) without plotting."""
+    import pandas as pd
+
+    band, title = _summarize(pd.read_csv(path))
+    return band.name, title
+
+
+def render(path, png_path):
+    """Plots one CSV to png_path, reusing the worker's figure.  Returns
+    (band name, summary title, seconds).
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+    if _figure is None:
+        _init_worker()
+    df = pd.read_csv(path)
+    band, title = _summarize(df)
+    df['frequencies'] = df['frequencies'] / 1e6
+
+    _figure.clear()
+    ax = _figure.add_subplot()
+    df.plot(x='frequencies', y='amplitudes', ax=ax, legend=False)
+    ax.set(xlabel="MHz", ylabel="IL (dB)", title=title)
+    ax.minorticks_on()
+    y_max = 0 if df['amplitudes'].max() < 0. else 5.0
+    y_min = min(math.ceil(df['amplitudes'].min() / -10.) * -10., -10.)
+    ax.set_ybound(y_max, y_min)
+
+    _figure.tight_layout()
+    _figure.savefig(png_path, dpi=300)
+    return band.name, title, time.perf_counter() - start
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_cache(directory):
+    """Returns the directory's cache, {} if it has none.  A cache from
+    another RENDER_VERSION comes back with only its version, so that
+    its PNGs are redrawn.
+    """
+    try:
+        with open(directory / CACHE_NAME) as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if cache.get("version") == RENDER_VERSION:
+        return cache
+    return {"version": cache.get("version")}
+
+
+def save_cache(directory, cache):
+    cache["version"] = RENDER_VERSION
+    tmp_path = directory / (CACHE_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp_path, directory / CACHE_NAME)
+
+
+def cached_result(path, png_path, entry, current=True):
+    """Returns (band name, title) if the PNG for path is up to date,
+    either by time or by the CSV's content hash, else None.  Without a
+    cache entry only the time counts, and the title is read from the
+    CSV; current is whether the PNG could be from this RENDER_VERSION.
+    """
+    if not png_path.exists():
+        return None
+    newer = png_path.stat().st_mtime >= path.stat().st_mtime
+    if not entry:
+        return summarize(path) if current and newer else None
+    if newer:
+        return entry["band"], entry["title"]
+    if entry["sha256"] == file_hash(path):
+        return entry["band"], entry["title"]
+    return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Plot align_band.py CSVs and summarize them.")
+    parser.add_argument("paths", nargs="+", type=pathlib.Path)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="worker processes (1 renders in-process)")
+    parser.add_argument("--force", action="store_true",
+                        help="redraw even if the PNG is up to date")
+    args = parser.parse_args(argv[1:])
+
+    caches = {}
+    results = {}
+    todo = []
+    for path in args.paths:
+        directory = path.parent
+        if directory not in caches:
+            caches[directory] = load_cache(directory)
+        cache = caches[directory]
+        entry = cache.get(path.name)
+        png_path = path.with_suffix(".png")
+        current = cache.get("version", RENDER_VERSION) == RENDER_VERSION
+        cached = None if args.force else cached_result(path, png_path,
+                                                       entry, current)
+        if cached:
+            results[path] = cached
+            if not entry:
+                band_name, title = cached
+                cache[path.name] = {"sha256": file_hash(path),
+                                    "band": band_name, "title": title}
+            print(f"{path}: up to date")
+        else:
+            todo.append((path, png_path))
+
+    def finished(i, path, result):
+        band_name, title, seconds = result
+        results[path] = (band_name, title)
+        caches[path.parent][path.name] = {
+            "sha256": file_hash(path), "band": band_name, "title": title}
+        print(f"[{i}/{len(todo)}] {path}: {seconds:.2f} s")
+
+    start = time.perf_counter()
+    if args.jobs == 1 or len(todo) <= 1:
+        for i, (path, png_path) in enumerate(todo, 1):
+            finished(i, path, render(path, png_path))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=args.jobs, initializer=_init_worker) as pool:
+            futures = {pool.submit(render, path, png_path): path
+                       for path, png_path in todo}
+            for i, future in enumerate(
+                    concurrent.futures.as_completed(futures), 1):
+                finished(i, futures[future], future.result())
+    if todo:
+        print(f"rendered {len(todo)} plots in "
+              f"{time.perf_counter() - start:.2f} s")
+
+    for directory, cache in caches.items():
+        save_cache(directory, cache)
+
+    # Band order, shortest wavelength first.
+    for band_name, title in sorted(
+            results.values(), key=lambda r: -bands.BAND_INDEX[r[0]]):
+        print(title)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
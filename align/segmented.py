@@ -0,0 +1,132 @@
+"""Segmented high-resolution sweeps.
+
+The analyzer's traces are always 601 points, so a wide band is coarse:
+10m is 2.8 kHz per point.  A segmented sweep splits the band into
+segments sub-spans, sweeps each and stitches the traces into one longer
+Trace.  The sub-spans are laid out on one uniform frequency grid, with
+adjacent segments sharing overlap + 1 points, so the stitched trace's
+frequencies are still linspace(start, stop, n) and it goes through
+to_dataframe(), the CSVs and the archive unchanged.  In each overlap the
+points nearest either segment's edge are dropped, half from each side.
+
+Each segment needs its own thru normalization, so store_thrus() reads
+back trace B for every segment and measure() uploads it again in the
+same message that retunes and sweeps.  With the query batched in, that
+is one round trip plus one trace transfer per segment.
+
+More segments mean finer resolution and proportionally more sweeps:
+resolution() gives the point spacing for a choice of segments.
+"""
+
+import numpy as np
+
+import hp8560e
+
+N_POINTS = hp8560e.HP8560E.N_POINTS
+DEFAULT_OVERLAP = 10
+
+
+def n_points(segments, overlap=DEFAULT_OVERLAP):
+    """Returns the number of points in a stitched trace."""
+    return segments * (N_POINTS - 1 - overlap) + overlap + 1
+
+
+def resolution(start_frequency, stop_frequency, segments,
+               overlap=DEFAULT_OVERLAP):
+    """Returns the stitched trace's point spacing in Hz."""
+    return ((stop_frequency - start_frequency) /
+            (n_points(segments, overlap) - 1))
+
+
+def plan(start_frequency, stop_frequency, segments, overlap=DEFAULT_OVERLAP):
+    """Returns the (start, stop) frequency of each segment."""
+    if segments < 1:
+        raise ValueError(f"segments must be at least 1, not {segments}")
+    if not 0 <= overlap < N_POINTS - 1:
+        raise ValueError(f"overlap must be in [0, {N_POINTS - 1}), "
+                         f"not {overlap}")
+    step = N_POINTS - 1 - overlap
+    spacing = resolution(start_frequency, stop_frequency, segments, overlap)
+    return [(start_frequency + k * step * spacing,
+             start_frequency + (k * step + N_POINTS - 1) * spacing)
+            for k in range(segments)]
+
+
+def stitch(traces, overlap=DEFAULT_OVERLAP):
+    """Stitches the traces of plan()'s segments, in order, into one
+    Trace.  All of them must have the same amplitude settings.
+    """
+    first = traces[0]
+    for trace in traces[1:]:
+        if (trace.amplitude_units, trace.reference_level,
+                trace.log_scale) != (first.amplitude_units,
+                                     first.reference_level, first.log_scale):
+            raise ValueError("segments have different amplitude settings")
+    half = overlap // 2
+    step = N_POINTS - 1 - overlap
+    parts = []
+    for k, trace in enumerate(traces):
+        lo = 0 if k == 0 else half + 1
+        hi = N_POINTS if k == len(traces) - 1 else step + half + 1
+        parts.append(trace.trace_mu[lo:hi])
+    return hp8560e.HP8560E.Trace(
+        amplitude_units=first.amplitude_units,
+        reference_level=first.reference_level,
+        log_scale=first.log_scale,
+        trace_mu=np.concatenate(parts),
+        start_frequency=first.start_frequency,
+        stop_frequency=traces[-1].stop_frequency)
+
+
+def _tune(sa, segment):
+    sa.start_frequency, sa.stop_frequency = segment
+
+
+def store_thrus(sa, segments):
+    """Stores the thru for each segment, as align_band.store_thru()
+    does for a whole band, and returns the segments' trace B
+    measurement units.  Leaves the analyzer on the whole band with its
+    own thru stored, for the operator to adjust against.
+    """
+    thrus = []
+    for segment in segments:
+        _store_thru(sa, segment)
+        thrus.append(sa.read_trace_mu(which='B'))
+    _store_thru(sa, (segments[0][0], segments[-1][1]))
+    return thrus
+
+
+def _store_thru(sa, segment):
+    with sa.batch():
+        sa.normalize = False
+        _tune(sa, segment)
+        sa.write("SRCTKPK;")
+        sa.wait_for_done()
+    with sa.batch():
+        sa.write("TS;STORETHRU;TS;")
+        sa.wait_for_done()
+
+
+def measure(sa, segments, thrus):
+    """Sweeps each segment normalized to its thru and returns the
+    traces, ready for stitch().
+    """
+    sa.set_single_sweep_mode()
+    amplitude_units = sa.amplitude_units
+    reference_level = sa.reference_level
+    log_scale = sa.log_scale
+    traces = []
+    for segment, thru in zip(segments, thrus):
+        with sa.batch():
+            _tune(sa, segment)
+            sa.write_trace_mu(thru, which='B')
+            sa.normalize = True
+            sa.take_sweep()
+        traces.append(hp8560e.HP8560E.Trace(
+            amplitude_units=amplitude_units,
+            reference_level=reference_level,
+            log_scale=log_scale,
+            trace_mu=sa.read_trace_mu(),
+            start_frequency=segment[0],
+            stop_frequency=segment[1]))
+    return traces
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Align bands on several analyzer stations at once.
+
+Each station is an HP 8560E with its thru calibrated by cal_thru.py,
+measuring one rig.  The stations are listed in an INI file:
+
+    [DEFAULT]
+    bands = 160m 80m 40m 20m
+
+    [bench1]
+    resource = tcpip::e5810a::gpib0,11
+    rig = k3-10123
+
+    [bench2]
+    resource = tcpip::e5810a::gpib0,12
+    rig = k3-10456
+    bands = 40m 20m
+    wait = srq
+
+A station's section may also set instrument, the name its calibrations
+are filed under (default: its resource), and wait, how to wait for
+sweeps (poll or srq; srq leaves the bus free while sweeping).
+
+Every station runs in its own asyncio worker, one band after another,
+loading each calibration as align_band_precal.py does.  Stations on
+the same gateway and GPIB interface share a SharedLink, so their
+transfers take turns.  Each station's CSVs go in a directory
+named after it, and its traces are archived under its rig.
+"""
+
+import argparse
+import asyncio
+import configparser
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+
+import pymeasure.adapters
+
+import align_band
+import align_band_precal
+import archive
+import bands
+import calstore
+import hp8560e
+import hp8560e_async
+
+
+class Station:
+    def __init__(self, name, resource, rig, band_names, instrument=None,
+                 wait="poll"):
+        self.name = name
+        self.resource = resource
+        self.rig = rig
+        self.bands = [bands.BAND_BY_NAME[band_name]
+                      for band_name in band_names]
+        self.instrument = instrument or resource
+        self.wait = wait
+        self.sa = None
+        self.set_up = False
+
+    @property
+    def link_name(self):
+        """Stations on the same gateway interface share a bus:
+        "tcpip::e5810a::gpib0,11" and ",12" are both "tcpip::e5810a::gpib0".
+        """
+        return self.resource.lower().rsplit(",", 1)[0]
+
+
+def read_config(path):
+    config = configparser.ConfigParser()
+    with open(path) as f:
+        config.read_file(f)
+    stations = []
+    for name in config.sections():
+        section = config[name]
+        stations.append(Station(
+            name, section["resource"], section.get("rig", name),
+            section.get("bands", "").split(),
+            instrument=section.get("instrument"),
+            wait=section.get("wait", "poll")))
+    return stations
+
+
+class StationPool:
+    """Opens a connection to every station, with one SharedLink per
+    gateway interface.
+    """
+
+    def __init__(self, stations):
+        self.stations = stations
+        self.links = {}
+
+    def open(self):
+        for station in self.stations:
+            link = self.links.setdefault(station.link_name,
+                                         hp8560e_async.SharedLink())
+            adapter = pymeasure.adapters.VISAAdapter(
+                station.resource, visa_library="@py", timeout=20 * 1000)
+            station.sa = hp8560e_async.AsyncHP8560E(
+                hp8560e.HP8560E(adapter, cache_state=True), link=link,
+                name=station.name)
+        return self
+
+    def close(self):
+        for station in self.stations:
+            if station.sa is not None:
+                station.sa.sa.adapter.close()
+                station.sa = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def measure_band(station, band, calibration):
+    sa = station.sa
+    # Only the first band needs a preset; after that a band change is
+    # the new span and calibration, unless they are already loaded.
+    await sa.call(align_band_precal.load_calibration, band, calibration,
+                  station.set_up)
+    station.set_up = True
+    await sa.take_sweep(method=station.wait)
+    return await sa.read_trace()
+
+
+def save(station, band, trace, directory, trace_archive):
+    data = trace.to_parameter_units()
+    now = datetime.datetime.now()
+    path = os.path.join(directory, station.name,
+                        f"align_{band.name}_{now.strftime('%y%m%d')}.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        trace.to_dataframe().to_csv(f, index=False)
+    trace_archive.append([{
+        "rig": station.rig, "band": band.name, "date": now.date(),
+        "frequencies": trace.frequencies, "amplitudes": data}])
+    return float(np.mean(data)), float(np.std(data))
+
+
+async def run_station(station, store, directory, trace_archive,
+                      archive_lock):
+    """Aligns the station's bands in order.  Returns a list of
+    (band name, mean, std, seconds), with None for mean and std where
+    the band had no calibration.
+    """
+    results = []
+    for band in station.bands:
+        start = time.perf_counter()
+        try:
+            calibration = store.latest(band.name, station.instrument)
+        except KeyError:
+            print(f"[{station.name}] {band.name}: no thru calibration for "
+                  f"{station.instrument}")
+            results.append((band.name, None, None, 0.))
+            continue
+        trace = await measure_band(station, band, calibration)
+        # TraceArchive appends are not safe to run concurrently.
+        async with archive_lock:
+            mean, std = await asyncio.to_thread(
+                save, station, band, trace, directory, trace_archive)
+        seconds = time.perf_counter() - start
+        print(f"[{station.name}] band={band.name} mean={mean:.3f} "
+              f"sd={std:.3f} dB ({seconds:.1f} s)")
+        results.append((band.name, mean, std, seconds))
+    return results
+
+
+async def run_all(stations, store, directory, trace_archive):
+    archive_lock = asyncio.Lock()
+    results = await asyncio.gather(
+        *(run_station(station, store, directory, trace_archive,
+                      archive_lock) for station in stations),
+        return_exceptions=True)
+    return dict(zip((station.name for station in stations), results))
+
+
+def report(stations, results, links, elapsed):
+    for station in stations:
+        result = results[station.name]
+        if isinstance(result, BaseException):
+            print(f"{station.name:12s} failed: {result!r}")
+            continue
+        for band_name, mean, std, seconds in result:
+            if mean is None:
+                print(f"{station.name:12s} {band_name:6s} not calibrated")
+            else:
+                print(f"{station.name:12s} {band_name:6s} "
+                      f"mean={mean:6.2f}, std={std:6.2f} dB "
+                      f"{seconds:6.1f} s")
+    for link_name, link in links.items():
+        for owner, held in link.held.items():
+            print(f"{link_name}: {owner} held the bus {held:.2f} s "
+                  f"({100 * held / elapsed:.0f}%) in "
+                  f"{link.transfers[owner]} transfers")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Align bands on several stations concurrently.")
+    parser.add_argument("config", help="INI file listing the stations")
+    parser.add_argument("--calibrations", default=calstore.DEFAULT_PATH)
+    parser.add_argument("--output", default=".",
+                        help="directory for the per-station CSVs")
+    parser.add_argument("--archive", default=align_band.ARCHIVE_PATH)
+    args = parser.parse_args(argv[1:])
+
+    stations = read_config(args.config)
+    store = calstore.CalibrationStore(args.calibrations)
+    trace_archive = archive.TraceArchive(args.archive)
+
+    start = time.perf_counter()
+    with StationPool(stations) as pool:
+        results = asyncio.run(run_all(stations, store, args.output,
+                                      trace_archive))
+    elapsed = time.perf_counter() - start
+    report(stations, results, pool.links, elapsed)
+    failed = any(isinstance(result, BaseException)
+                 for result in results.values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
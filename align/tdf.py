@@ -0,0 +1,91 @@
+"""Decoders for the HP 8560E trace data formats (TDF).
+
+  P  parameter units (dBm, V, ...) as comma-separated ASCII
+  M  measurement units (0..610) as comma-separated ASCII
+  A  A-block: b"#A", a 16-bit byte count, then 16-bit binary values
+  I  I-block: b"#I", then 16-bit binary values, ended by EOI
+  B  16-bit binary values alone, ended by EOI
+
+The binary formats assume the default measurement data size, MDS W.
+
+Every decoder returns measurement units as uint16, so a trace read in
+any format is the same.  P is converted back from parameter units,
+which is exact as long as the analyzer prints them to better than half
+a measurement unit: 0.01 dB against 1/60 dB at 1 dB/div, for example.
+"""
+
+import numpy as np
+
+import ablock
+
+FORMATS = ("P", "M", "A", "I", "B")
+BINARY_FORMATS = ("A", "I", "B")
+_I_HEADER = b"#I"
+
+
+def response_size(trace_format, n):
+    """Returns the byte count of an n point binary trace, or None for
+    the ASCII formats, which are read to their terminator.
+    """
+    if trace_format == "A":
+        return ablock.ablock_size(n)
+    if trace_format == "I":
+        return len(_I_HEADER) + n * ablock.U16.itemsize
+    if trace_format == "B":
+        return n * ablock.U16.itemsize
+    if trace_format in FORMATS:
+        return None
+    raise ValueError(f"Unknown trace data format {trace_format!r}")
+
+
+def to_parameter_units(trace_mu, amplitude_units, reference_level,
+                       log_scale):
+    if amplitude_units.startswith("DB"):
+        return reference_level + log_scale * (trace_mu / 60. - 10.)
+    return reference_level * (trace_mu / 600.)
+
+
+def from_parameter_units(values, amplitude_units, reference_level,
+                         log_scale):
+    """Inverts to_parameter_units, rounding to whole measurement units."""
+    if amplitude_units.startswith("DB"):
+        mu = 60. * ((values - reference_level) / log_scale + 10.)
+    else:
+        mu = 600. * values / reference_level
+    return np.clip(np.rint(mu), 0, 0xffff).astype(np.uint16)
+
+
+def _binary(data, offset, n):
+    if len(data) - offset != n * ablock.U16.itemsize:
+        raise ValueError(f"Expected {n} 16-bit values, got "
+                         f"{len(data) - offset} bytes")
+    return np.frombuffer(data, dtype=ablock.U16, count=n, offset=offset)
+
+
+def decode(trace_format, data, n, scale=None):
+    """Decodes an n point trace in trace_format into measurement
+    units.  data is bytes for the binary formats and str for the ASCII
+    ones.  P needs scale, (amplitude units, reference level, log
+    scale).  Binary formats decode to a read-only view onto data.
+    """
+    if trace_format == "A":
+        return ablock.from_ablock_u16(data)
+    if trace_format == "I":
+        if data[:2] != _I_HEADER:
+            raise ValueError(f"Not an I-block (header {bytes(data[:2])!r})")
+        return _binary(data, len(_I_HEADER), n)
+    if trace_format == "B":
+        return _binary(data, 0, n)
+    if trace_format == "M":
+        values = np.fromstring(data, dtype=np.int64, sep=",")
+    elif trace_format == "P":
+        values = np.fromstring(data, dtype=np.float64, sep=",")
+    else:
+        raise ValueError(f"Unknown trace data format {trace_format!r}")
+    if len(values) != n:
+        raise ValueError(f"Expected {n} values, got {len(values)}")
+    if trace_format == "M":
+        return values.astype(np.uint16)
+    if scale is None:
+        raise ValueError("TDF P needs the amplitude scale to decode")
+    return from_parameter_units(values, *scale)
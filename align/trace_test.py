@@ -27,7 +27,7 @@ def main(argv):
 
     trace = sa.read_trace(which='A')
     print(trace)
-    print(list(trace.to_parameter_units()))
+    print(trace.to_parameter_units())
 
     trace2 = sa.Trace(
         amplitude_units='DBM', reference_level=0.0, log_scale=10,
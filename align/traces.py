@@ -0,0 +1,81 @@
+"""An HP 8560E trace, kept apart from the driver so that reading
+stored traces does not load pymeasure and VISA.
+"""
+
+import dataclasses
+
+import numpy as np
+
+import tdf
+
+N_POINTS = 601
+
+
+@dataclasses.dataclass(frozen=True, slots=True, eq=False)
+class Trace:
+    """A trace in measurement units (0..610 per the HP 8560E manual),
+    with the state needed to convert it to parameter units.
+    trace_mu is stored as a uint16 array; frequencies and
+    parameter units are computed on first use and cached.
+    """
+    amplitude_units: str
+    reference_level: float
+    log_scale: int
+    trace_mu: np.ndarray
+    start_frequency: float = None
+    stop_frequency: float = None
+    _frequencies: np.ndarray = dataclasses.field(
+        default=None, init=False, repr=False)
+    _parameter_units: np.ndarray = dataclasses.field(
+        default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        trace_mu = np.asarray(self.trace_mu, dtype=np.uint16)
+        object.__setattr__(self, "trace_mu", trace_mu)
+
+    @property
+    def frequencies(self):
+        if self._frequencies is None:
+            frequencies = np.linspace(self.start_frequency,
+                                      self.stop_frequency,
+                                      len(self.trace_mu),
+                                      dtype=np.float64)
+            frequencies.flags.writeable = False
+            object.__setattr__(self, "_frequencies", frequencies)
+        return self._frequencies
+
+    def to_parameter_units(self):
+        if self._parameter_units is None:
+            units = tdf.to_parameter_units(
+                self.trace_mu, self.amplitude_units,
+                self.reference_level, self.log_scale)
+            units.flags.writeable = False
+            object.__setattr__(self, "_parameter_units", units)
+        return self._parameter_units
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame({'frequencies': self.frequencies,
+                             'amplitudes': self.to_parameter_units()},
+                            copy=False)
+
+    def __getstate__(self):
+        return {'amplitude_units': self.amplitude_units,
+                'reference_level': self.reference_level,
+                'log_scale': self.log_scale,
+                'trace_mu': self.trace_mu,
+                'start_frequency': self.start_frequency,
+                'stop_frequency': self.stop_frequency}
+
+    def __setstate__(self, state):
+        # Traces pickled before the switch to arrays carry a list
+        # of frequencies rather than start and stop.
+        state = dict(state)
+        frequencies = state.pop('frequencies', None)
+        if frequencies is not None:
+            state['start_frequency'] = frequencies[0]
+            state['stop_frequency'] = frequencies[-1]
+        for name in self.__dataclass_fields__:
+            object.__setattr__(self, name, state.get(name))
+        self.__post_init__()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""HF and 6m amateur band plan for the United States.
+
+BandPlan indexes a list of bands as sorted, non-overlapping frequency
+intervals.  A continuous band is one interval; a channelized band such
+as 60m is one interval per channel, so a frequency between the 60m
+channels is not in any band.  find() is a bisect over the interval
+starts, classify() does the same for a whole NumPy array with one
+searchsorted, and names are looked up in a dict.  NumPy is only
+imported by classify(), so `c-header` needs nothing but the standard
+library.
+
+align/, kat500/ and random_wire/ use this module through symlinks;
+random_wire/avoid.c gets its band table from `bandplan.py c-header`.
+"""
+
+import bisect
+import dataclasses
+import sys
+
+# US 60m channels are 2.8 kHz wide, given by their center frequency.
+CHANNEL_WIDTH_60M = 2.8e3
+
+
+@dataclasses.dataclass(frozen=True)
+class Band:
+    name: str
+    start_frequency: float
+    stop_frequency: float
+    # Center frequencies of a channelized allocation, in Hz.  start and
+    # stop frequency are then the outer edges of the channels.
+    channels: tuple = ()
+    channel_width: float = 0.
+
+    @classmethod
+    def channelized(cls, name, channels, channel_width):
+        channels = tuple(sorted(channels))
+        return cls(name, channels[0] - channel_width / 2,
+                   channels[-1] + channel_width / 2, channels, channel_width)
+
+    @property
+    def wavelength_meter(self):
+        return int(self.name.rstrip("m"))
+
+    @property
+    def is_channelized(self):
+        return bool(self.channels)
+
+    def intervals(self):
+        """Returns the band's (low, high) frequency ranges, inclusive."""
+        if not self.channels:
+            return [(self.start_frequency, self.stop_frequency)]
+        half = self.channel_width / 2
+        return [(center - half, center + half) for center in self.channels]
+
+
+class BandPlan:
+    def __init__(self, bands):
+        self.bands = list(bands)
+        self._by_name = {band.name: band for band in self.bands}
+        self.index = {band.name: i for i, band in enumerate(self.bands)}
+        intervals = sorted((low, high, i)
+                           for i, band in enumerate(self.bands)
+                           for low, high in band.intervals())
+        for (_, high, i), (low, _, j) in zip(intervals, intervals[1:]):
+            if low <= high:
+                raise ValueError(f"{self.bands[i].name} and "
+                                 f"{self.bands[j].name} overlap")
+        self._lows = [low for low, _, _ in intervals]
+        self._highs = [high for _, high, _ in intervals]
+        self._owners = [i for _, _, i in intervals]
+        self._arrays = None
+
+    def __iter__(self):
+        return iter(self.bands)
+
+    def __len__(self):
+        return len(self.bands)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def __getitem__(self, name):
+        """Returns the band called name; raises KeyError if none is."""
+        return self._by_name[name]
+
+    def find(self, frequency):
+        """Returns the band containing frequency, or None."""
+        i = bisect.bisect_right(self._lows, frequency) - 1
+        if i >= 0 and frequency <= self._highs[i]:
+            return self.bands[self._owners[i]]
+        return None
+
+    def classify(self, frequencies):
+        """Returns the index into bands of the band containing each of
+        frequencies, -1 where none does.
+        """
+        import numpy as np
+
+        if self._arrays is None:
+            self._arrays = (np.array(self._lows), np.array(self._highs),
+                            np.array(self._owners))
+        lows, highs, owners = self._arrays
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        i = np.searchsorted(lows, frequencies, side="right") - 1
+        clipped = np.maximum(i, 0)
+        inside = (i >= 0) & (frequencies <= highs[clipped])
+        return np.where(inside, owners[clipped], -1)
+
+
+BANDS = [
+    Band("160m", 1.800e6, 2.000e6),
+    Band("80m", 3.500e6, 4.000e6),
+    Band.channelized("60m", [5.332e6, 5.348e6, 5.3585e6, 5.373e6, 5.405e6],
+                     CHANNEL_WIDTH_60M),
+    Band("40m", 7.000e6, 7.300e6),
+    Band("30m", 10.100e6, 10.150e6),
+    Band("20m", 14.000e6, 14.350e6),
+    Band("17m", 18.068e6, 18.168e6),
+    Band("15m", 21.000e6, 21.450e6),
+    Band("12m", 24.890e6, 24.990e6),
+    Band("10m", 28.000e6, 29.700e6),
+    Band("6m", 50.000e6, 54.000e6),
+]
+
+PLAN = BandPlan(BANDS)
+
+
+def c_header(plan=PLAN):
+    """Returns a C header with the plan's bands, as kHz edges."""
+    lines = ["/* Generated by bandplan.py c-header; do not edit. */",
+             "struct band { const char *name; double lo_kHz, hi_kHz; };",
+             "static const struct band bands[] = {"]
+    for band in plan:
+        lines.append(f'  {{"{band.name}", {band.start_frequency / 1e3:.1f}, '
+                     f'{band.stop_frequency / 1e3:.1f}}},')
+    lines.append("};")
+    lines.append("#define N_BANDS (sizeof(bands) / sizeof(bands[0]))")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv):
+    if len(argv) == 2 and argv[1] == "c-header":
+        sys.stdout.write(c_header())
+    elif len(argv) == 1:
+        for band in PLAN:
+            print(f"{band.name:5s} {band.start_frequency / 1e3:9.1f} "
+                  f"{band.stop_frequency / 1e3:9.1f} kHz"
+                  + (f"  {len(band.channels)} channels"
+                     if band.channels else ""))
+    else:
+        print(f"usage: {argv[0]} [c-header]", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
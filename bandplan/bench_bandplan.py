@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+
+import numpy as np
+
+import bandplan
+
+
+def legacy_find(frequency):
+    for band in bandplan.BANDS:
+        for low, high in band.intervals():
+            if low <= frequency <= high:
+                return band
+    return None
+
+
+def bench(label, fn, n):
+    start = time.perf_counter()
+    fn()
+    t = time.perf_counter() - start
+    print(f"{label:28s} {t:8.3f} s {n / t / 1e6:8.2f} M lookups/s")
+    return t
+
+
+def main(argv):
+    n = int(argv[1]) if len(argv) >= 2 else 2_000_000
+    rng = np.random.default_rng(0)
+    # Mostly in band, as when classifying sweeps, plus misses.
+    edges = np.array([(b.start_frequency, b.stop_frequency)
+                      for b in bandplan.BANDS])
+    picks = rng.integers(0, len(edges), n)
+    frequencies = rng.uniform(edges[picks, 0], edges[picks, 1])
+    frequencies[::4] = rng.uniform(1e6, 60e6, len(frequencies[::4]))
+    scalars = frequencies.tolist()
+
+    plan = bandplan.PLAN
+    expected = [legacy_find(f) for f in scalars[:10000]]
+    assert [plan.find(f) for f in scalars[:10000]] == expected
+    assert [plan.bands[i] if i >= 0 else None
+            for i in plan.classify(frequencies[:10000])] == expected
+
+    old = bench("linear scan", lambda: [legacy_find(f) for f in scalars], n)
+    new = bench("bisect", lambda: [plan.find(f) for f in scalars], n)
+    print(f"scalar speedup {old / new:.1f}x")
+    vec = bench("classify (vectorized)", lambda: plan.classify(frequencies),
+                n)
+    print(f"vectorized speedup {old / vec:.1f}x")
+    bench("name lookup", lambda: [plan[name] for name in
+                                  ["40m", "60m", "6m", "160m"] * (n // 4)],
+          n // 4 * 4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1 @@
+../bandplan/bandplan.py
\ No newline at end of file
@@ -1,70 +1,303 @@
 # Elecraft transceiver control.   Rest is TBD.
 
-import band_plan
+import collections
+import re
+import time
 
 _DEBUG=False
 
+_MNEMONIC = re.compile(r"([A-Z]*)(.?)")
+
+
+class Framer(object):
+    """Splits what comes from a serial port into ;-terminated frames.
+
+    Each read takes everything in_waiting has, at least one byte, and
+    splits it on ";" in one go.  Reads, writes and in_waiting polls are
+    counted as syscalls.  last_heard is the time.monotonic() anything was
+    last read, or None.  Bytes that are not ASCII, such as line noise
+    from a tuner waking up, decode as U+FFFD; the reply form checks
+    then reject the frame.
+    """
+
+    def __init__(self, serial):
+        self._serial = serial
+        self._buffer = b""
+        self._frames = collections.deque()
+        self.syscalls = 0
+        self.last_heard = None
+
+    def Write(self, data):
+        if _DEBUG: print("Write: %r" % data)
+        self._serial.write(data)
+        self._serial.flush()
+        self.syscalls += 1
+
+    def _Fill(self):
+        """Reads what is waiting, or blocks for up to the port's
+        timeout for one byte.  Returns False on a timeout.
+        """
+        waiting = self._serial.in_waiting
+        data = self._serial.read(max(waiting, 1))
+        self.syscalls += 2
+        if _DEBUG: print("Read: %r" % data)
+        if not data:
+            return False
+        self.last_heard = time.monotonic()
+        *frames, self._buffer = (self._buffer + data).split(b";")
+        self._frames.extend(frame.decode("ascii", errors="replace")
+                            for frame in frames)
+        return True
+
+    def ReadFrame(self):
+        """Returns the next frame without its ";", or None if the port
+        timed out first.
+        """
+        while not self._frames:
+            if not self._Fill():
+                return None
+        return self._frames.popleft()
+
+    def Drain(self):
+        """Returns the frames received but not yet read, without waiting
+        for more.  A partial frame stays buffered.
+        """
+        waiting = self._serial.in_waiting
+        self.syscalls += 1
+        if waiting:
+            self._Fill()
+        frames = list(self._frames)
+        self._frames.clear()
+        return frames
+
+
 class _Device(object):
-    def __init__(self, serial, wakeup_required=False):
+    # Query tag: compiled pattern for what follows it in the reply.  A
+    # frame only answers a tag if the rest of it has that form.
+    _REPLY_FORMS = {}
+
+    def __init__(self, serial, sleep_timeout=None, reply_timeout=None):
+        """sleep_timeout is how long the device can go unheard from
+        before it may be asleep and must be woken up before a query;
+        None if it never sleeps, 0 to wake it up before every query.
+        Commands without a reply always wake a device that sleeps: if
+        it ate their first character nothing would tell.  reply_timeout
+        bounds the wait for each reply, raising TimeoutError; None
+        waits for ever.
+        """
         self._serial = serial
-        self._wakeup_required = wakeup_required
+        self._framer = Framer(serial)
+        self._sleep_timeout = sleep_timeout
+        self.reply_timeout = reply_timeout
+        self._pending = None
         serial.timeout = 0.250
+        # Per command mnemonic: how often it was sent and the syscalls
+        # it took, wake-ups and replies included.
+        self.commands = collections.Counter()
+        self.syscalls = collections.Counter()
+        # Wake-ups done and the time they took, wake-ups skipped because
+        # the device was heard from recently, and queries resent after
+        # it turned out to be asleep anyway.
+        self.wakeups = 0
+        self.wakeup_seconds = 0.
+        self.wakeups_skipped = 0
+        self.resends = 0
+
+    def SyscallsPerCommand(self):
+        return dict((mnemonic, self.syscalls[mnemonic] / float(count))
+                    for mnemonic, count in self.commands.items())
+
+    def _Count(self, command, syscalls_before):
+        # "FA00014000000" and "FA00007000000" are both "FA#"; a burst
+        # of queries is counted as itself, "L;C;SIDE".
+        letters, digit = _MNEMONIC.match(command).groups()
+        if digit == ";":
+            mnemonic = command
+        else:
+            mnemonic = letters + "#" if digit else letters
+        self.commands[mnemonic] += 1
+        self.syscalls[mnemonic] += self._framer.syscalls - syscalls_before
+
+    def WakeUpStats(self):
+        return {"wakeups": self.wakeups,
+                "wakeup_seconds": self.wakeup_seconds,
+                "wakeups_skipped": self.wakeups_skipped,
+                "resends": self.resends}
 
     def _WakeUp(self):
-        if _DEBUG: print "_WakeUp"
+        if _DEBUG: print("_WakeUp")
+        start = time.monotonic()
         i = 0
         while i < 2:
-            self._serial.write(";")
-            self._serial.flush()
-            c = self._serial.read()
-            if (c and c[0] == ';'):
+            self._framer.Write(b";")
+            if self._framer.ReadFrame() == "":
                 i += 1
-        if _DEBUG: print "_WakeUp done"
+            elif (self.reply_timeout is not None and
+                  time.monotonic() - start >= self.reply_timeout):
+                raise TimeoutError("The %s does not wake up"
+                                   % type(self).__name__)
+        self.wakeups += 1
+        self.wakeup_seconds += time.monotonic() - start
+        if _DEBUG: print("_WakeUp done")
+
+    def _MayBeAsleep(self):
+        if self._sleep_timeout is None:
+            return False
+        last_heard = self._framer.last_heard
+        return (last_heard is None or
+                time.monotonic() - last_heard >= self._sleep_timeout)
 
     def _ReadUntilSemi(self):
-        result = bytes()
+        deadline = None
+        if self.reply_timeout is not None:
+            deadline = time.monotonic() + self.reply_timeout
         while True:
-            c = self._serial.read()
-            if _DEBUG: print "Read: \"%s\"" % c
-            if (c and c[0] == ';'):
-                return result
-            result += c
-            
-    def _SendCommandNoResponse(self, command):
-        if self._wakeup_required:
+            response = self._framer.ReadFrame()
+            if response is not None:
+                # The device is awake and answering; a slow reply later
+                # in a burst is no reason to resend it.
+                self._pending = None
+                return response
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("No reply from the %s"
+                                   % type(self).__name__)
+            if self._pending:
+                # The device was asleep after all and ate the query's
+                # first character.  Queries have no side effects, so
+                # they can be sent again.
+                if _DEBUG: print("Resend %r" % self._pending)
+                self.resends += 1
+                self._WakeUp()
+                self._framer.Write(self._pending)
+                self._pending = None
+
+    def _Write(self, command, query=False):
+        """Writes command, waking a device that sleeps up first unless
+        command is only queries and the device cannot be asleep yet.  A
+        query sent without a wake-up is resent once if its reply times
+        out.
+        """
+        data = command.encode("ascii") + b";"
+        self._pending = None
+        if self._sleep_timeout is None:
+            pass
+        elif not query or self._MayBeAsleep():
             self._WakeUp()
-        command += ";"
-        if _DEBUG: print "_SendCommand \"%s\"" % command
-        self._serial.write(command)
-        self._serial.flush()
+        else:
+            self.wakeups_skipped += 1
+            self._pending = data
+        if _DEBUG: print("_SendCommand \"%s;\"" % command)
+        self._framer.Write(data)
+
+    def _Drain(self):
+        """Discards replies left over from earlier commands, such as
+        duplicates of a resent burst, before a query.
+        """
+        for response in self._framer.Drain():
+            self._Discard(response)
+
+    def _SendCommandNoResponse(self, command):
+        before = self._framer.syscalls
+        self._Write(command)
+        self._Count(command, before)
+
+    def _SendCommandsNoResponse(self, commands):
+        """Sends commands without replies in one write, with at most one
+        wake-up.
+        """
+        self._SendSequence(commands, [], ";".join(commands))
 
     def _SendCommand(self, command):
-        self._SendCommandNoResponse(command)
+        before = self._framer.syscalls
+        self._Write(command)
         while True:
             response = self._ReadUntilSemi()
-            if _DEBUG: print "response=\"%s\"" % response
+            if _DEBUG: print("response=\"%s\"" % response)
             if response == command:
-                return
+                break
+        self._Count(command, before)
 
     def _SendQuery(self, command):
-        self._SendCommandNoResponse(command)
+        before = self._framer.syscalls
+        self._Drain()
+        self._Write(command, query=True)
         response = self._ReadUntilSemi()
-        if _DEBUG: print "response=\"%s\"" % response
+        if _DEBUG: print("response=\"%s\"" % response)
+        self._Count(command, before)
         return response
 
-    def _SendTaggedQuery(self, command):
-        self._SendCommandNoResponse(command)
-        while True:
+    def _Answers(self, response, tag):
+        """Whether response is a reply to the query tag."""
+        if not response.startswith(tag):
+            return False
+        form = self._REPLY_FORMS.get(tag)
+        return form is None or form.fullmatch(response[len(tag):]) is not None
+
+    def _Discard(self, response):
+        """Called with each frame that answers none of the tags read."""
+        if _DEBUG: print("Discard %r" % response)
+
+    def _ReadTagged(self, tags):
+        """Reads frames until there is a response to each of tags,
+        discarding anything else.  A frame goes to the longest tag it
+        answers.  Returns {tag: response without the tag}.
+        """
+        by_length = sorted(tags, key=len, reverse=True)
+        responses = {}
+        while len(responses) < len(tags):
             response = self._ReadUntilSemi()
-            if _DEBUG: print "response=\"%s\"" % response
-            if response.startswith(command):
-                return response[len(command):]
+            if _DEBUG: print("response=\"%s\"" % response)
+            for tag in by_length:
+                if tag not in responses and self._Answers(response, tag):
+                    responses[tag] = response[len(tag):]
+                    break
+            else:
+                self._Discard(response)
+        return responses
+
+    def _SendTaggedQuery(self, command):
+        return self._SendTaggedQueries([command])[command]
+
+    def _SendTaggedQueries(self, commands):
+        """Sends the queries in one write and returns {command: response
+        without the tag}, in one round trip.
+        """
+        before = self._framer.syscalls
+        self._Drain()
+        burst = ";".join(commands)
+        self._Write(burst, query=True)
+        responses = self._ReadTagged(commands)
+        self._Count(burst, before)
+        return responses
+
+    def _SendSequence(self, commands, tags, label):
+        """Sends commands, settings and queries mixed, in one write and
+        returns the responses to the queries, in order and without their
+        tags.  A burst with settings in it cannot be resent, so a device
+        that sleeps is always woken up first.  Counted as label.
+        """
+        before = self._framer.syscalls
+        if tags:
+            self._Drain()
+        self._Write(";".join(commands))
+        responses = []
+        for tag in tags:
+            while True:
+                response = self._ReadUntilSemi()
+                if _DEBUG: print("response=\"%s\"" % response)
+                if self._Answers(response, tag):
+                    responses.append(response[len(tag):])
+                    break
+                self._Discard(response)
+        self.commands[label] += 1
+        self.syscalls[label] += self._framer.syscalls - before
+        return responses
 
-            
 
 class Transceiver(_Device):
-    def __init__(self, serial):
-        super(Transceiver, self).__init__(serial)
+    def __init__(self, serial, reply_timeout=None):
+        super(Transceiver, self).__init__(serial,
+                                          reply_timeout=reply_timeout)
 
     @classmethod
     def _SetFrequencyCommand(cls, vfo, frequency):
@@ -78,18 +311,88 @@ class Transceiver(_Device):
         self._SendCommandNoResponse("SWH16") # no response generated
 
 
+# A snapshot of the tuner, as read by Tuner.ReadStatus().  L in [H], C
+# in [F], side "T" or "A", frequency in [Hz]; None where not read.
+TunerStatus = collections.namedtuple(
+    "TunerStatus", ["inductance", "capacitance", "side", "vswr", "bypassed",
+                    "fault", "frequency", "tuning"])
+
+# One stored tuner memory: the setting recalled at frequency [Hz], as
+# relay bitmaps and side, or bypassed.
+Memory = collections.namedtuple(
+    "Memory", ["frequency", "l_bits", "c_bits", "side", "bypassed"])
+
+
 class Tuner(_Device):
-    def __init__(self, serial):
-        super(Tuner, self).__init__(serial, wakeup_required=True)
+    # Seconds the KAT500 is assumed to stay awake after it last sent
+    # something, before a query.  It is a guess: if the tuner does fall
+    # asleep sooner, a query costs a timeout and a resend.  Commands
+    # without a reply do not depend on it, they always wake it up.
+    SLEEP_TIMEOUT = 0.5
+
+    _REPLY_FORMS = dict((tag, re.compile(form)) for (tag, form) in [
+        ("L", "[0-9A-F]{2}"), ("C", "[0-9A-F]{2}"), ("SIDE", "[TA]"),
+        ("VSWR", r"\d+(\.\d*)?"), ("BYP", "[BN]"), ("FLT", r"\d"),
+        ("F", r"\d+"), ("TP", "[01]"), ("AN", "[123]")])
+
+    def __init__(self, serial, sleep_timeout=SLEEP_TIMEOUT,
+                 reply_timeout=None):
+        super(Tuner, self).__init__(serial, sleep_timeout=sleep_timeout,
+                                    reply_timeout=reply_timeout)
+        # Whether a tune started by StartFullTune() has yet to echo FT.
+        self.tune_echo_pending = False
+
+    def _Discard(self, response):
+        super(Tuner, self)._Discard(response)
+        if response == "FT":
+            self.tune_echo_pending = False
 
     def Verify(self):
         response = self._SendQuery("I")
         assert response.lower() == "kat500"
 
+    # Status query: TunerStatus field.
+    _STATUS_FIELDS = [("L", "inductance"), ("C", "capacitance"),
+                      ("SIDE", "side"), ("VSWR", "vswr"), ("BYP", "bypassed"),
+                      ("FLT", "fault"), ("F", "frequency"), ("TP", "tuning")]
+    STATUS_QUERIES = [query for (query, _) in _STATUS_FIELDS]
+
+    @classmethod
+    def _ParseStatus(cls, query, response):
+        if query == "L":
+            return cls._ComputeLC(int(response, 16), cls._Ls)
+        if query == "C":
+            return cls._ComputeLC(int(response, 16), cls._Cs)
+        if query == "SIDE":
+            assert response == "T" or response == "A"
+            return response
+        if query == "VSWR":
+            return float(response)
+        if query == "BYP":
+            assert response == "N" or response == "B"
+            return response == "B"
+        if query == "FLT":
+            return int(response)
+        if query == "F":
+            return int(response) * 1000.
+        if query == "TP":
+            result = int(response)
+            assert result in [0, 1]
+            return bool(result)
+        assert False, "Not a status query: %s" % query
+
+    def ReadStatus(self, queries=STATUS_QUERIES):
+        """Reads the status queries, by default all of them, in one
+        burst such as "L;C;SIDE;VSWR;BYP;".  Returns a TunerStatus.
+        """
+        responses = self._SendTaggedQueries(queries)
+        return TunerStatus(**dict(
+            (field, self._ParseStatus(query, responses[query])
+             if query in responses else None)
+            for (query, field) in self._STATUS_FIELDS))
+
     def ReadBypass(self):
-        response = self._SendTaggedQuery("BYP")
-        assert response == "N" or response == "B"
-        return response == "B"
+        return self.ReadStatus(["BYP"]).bypassed
 
     def SetBypass(self, bypassed):
         command = "BYPB" if bypassed else "BYPN"
@@ -102,65 +405,129 @@ class Tuner(_Device):
     @staticmethod
     def _ComputeLC(bitmap, mapping):
         total = 0.
-        for bit in xrange(0, 8):
+        for bit in range(0, 8):
             if bitmap & (1<<bit):
                 total += mapping[bit]
         return total
-        
+
     def ReadCapacitance(self):
-        bits = int(self._SendTaggedQuery("C"), 16);
-        return self._ComputeLC(bits, self._Cs)
+        return self.ReadStatus(["C"]).capacitance
 
     def ReadInductance(self):
-        bits = int(self._SendTaggedQuery("L"), 16);
-        return self._ComputeLC(bits, self._Ls)
-    
+        return self.ReadStatus(["L"]).inductance
+
     def ReadCapacitorSide(self):
-        response = self._SendTaggedQuery("SIDE")
-        assert response == "T" or response == "A"
-        return response
+        return self.ReadStatus(["SIDE"]).side
 
     def ClearMatch(self):
-        self._SendCommandNoResponse("C00")
-        self._SendCommandNoResponse("L00")
+        self._SendCommandsNoResponse(["C00", "L00"])
 
     def ReadMatch(self):
         """Returns match (L, C, side) with L in [H] and C in [F] and side
         being either "T" or "A" or None if in bypass."""
-        l = self.ReadInductance()
-        c = self.ReadCapacitance()
-        side = self.ReadCapacitorSide()
-        return (l, c, side)
+        status = self.ReadStatus(["L", "C", "SIDE"])
+        return (status.inductance, status.capacitance, status.side)
+
+    def ReadMatchBits(self):
+        """Returns the match as the relay bitmaps, (L bits, C bits,
+        side), to be restored with SetMatchBits()."""
+        responses = self._SendTaggedQueries(["L", "C", "SIDE"])
+        return (int(responses["L"], 16), int(responses["C"], 16),
+                self._ParseStatus("SIDE", responses["SIDE"]))
+
+    def SetMatchBits(self, l_bits, c_bits, side):
+        """Sets the relays and takes the tuner out of bypass."""
+        assert side == "T" or side == "A"
+        self._SendCommandsNoResponse(["L%02X" % l_bits, "C%02X" % c_bits,
+                                      "SIDE%s" % side, "BYPN"])
 
     def ReadFrequency(self):
-        return int(self._SendTaggedQuery("F")) * 1000.
+        return self.ReadStatus(["F"]).frequency
 
     def ReadVSWR(self):
-        return float(self._SendTaggedQuery("VSWR"))
+        return self.ReadStatus(["VSWR"]).vswr
 
     def ReadVSWRInBypass(self):
-        return float(self._SendTaggedQuery("VSWR"))
-    
+        return self.ReadStatus(["VSWR"]).vswr
+
     def ClearFault(self):
         self._SendCommandNoResponse("FLTC")
 
     def GetFaultCode(self):
-        return int(self._SendTaggedQuery("FLT"))
+        return self.ReadStatus(["FLT"]).fault
 
     def FullTune(self):
         return self._SendCommand("FT")
 
+    def StartFullTune(self):
+        """Starts a full tune without waiting for it; ReadTunePoll()
+        says when it is done.  The FT echo at the end is skipped by the
+        reads that come across it, which clear tune_echo_pending.
+        """
+        self.tune_echo_pending = True
+        self._SendCommandNoResponse("FT")
+
     def CancelTune(self):
         return self._SendCommandNoResponse("CT")
 
     def ReadTunePoll(self):
-        result = int(self._SendTaggedQuery("TP"))
-        assert result in [0, 1]
-        return bool(result)
-        
+        return self.ReadStatus(["TP"]).tuning
+
     def SaveMemory(self, frequency=0):
         self._SendCommandNoResponse("SM%d" % frequency)
 
+    # Memories per burst, so as not to overrun the KAT500's input buffer.
+    MEMORY_BURST = 8
+
+    @staticmethod
+    def _MemoryBursts(items, size):
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def ReadMemories(self, antenna, frequencies):
+        """Reads antenna's memories for frequencies [Hz], by setting the
+        tuner to each frequency, which recalls its memory, and reading
+        BYP, L, C and SIDE.  MEMORY_BURST memories take one round trip.
+        Returns [Memory] and leaves the tuner on its original antenna.
+        """
+        original = self.ReadAntenna()
+        memories = []
+        for burst in self._MemoryBursts(frequencies, self.MEMORY_BURST):
+            commands = ["AN%d" % antenna]
+            for frequency in burst:
+                commands += ["F%d" % (frequency / 1e3), "BYP", "L", "C",
+                             "SIDE"]
+            responses = self._SendSequence(
+                commands, ["BYP", "L", "C", "SIDE"] * len(burst),
+                "read memories")
+            for i, frequency in enumerate(burst):
+                bypassed, l_bits, c_bits, side = responses[4 * i:4 * i + 4]
+                memories.append(Memory(
+                    frequency, int(l_bits, 16), int(c_bits, 16),
+                    self._ParseStatus("SIDE", side),
+                    self._ParseStatus("BYP", bypassed)))
+        self.SetAntenna(original)
+        return memories
+
+    def WriteMemories(self, antenna, memories):
+        """Stores memories for antenna: sets the tuner to each one's
+        frequency and relays and saves it, MEMORY_BURST memories per
+        write with one handshake, an AN query, at its end.  Leaves the
+        tuner on its original antenna.
+        """
+        original = self.ReadAntenna()
+        for burst in self._MemoryBursts(memories, self.MEMORY_BURST):
+            commands = ["AN%d" % antenna]
+            for memory in burst:
+                assert memory.side == "T" or memory.side == "A"
+                commands += ["F%d" % (memory.frequency / 1e3),
+                             "L%02X" % memory.l_bits,
+                             "C%02X" % memory.c_bits,
+                             "SIDE%s" % memory.side,
+                             "BYPB" if memory.bypassed else "BYPN",
+                             "SM0"]
+            self._SendSequence(commands + ["AN"], ["AN"], "write memories")
+        self.SetAntenna(original)
+
     def ReadAntenna(self):
         return int(self._SendTaggedQuery("AN"))
 
@@ -174,10 +541,13 @@ class Tuner(_Device):
     _BAND_NUMBER_TO_METER=dict(_BANDMAP)
     _BAND_METER_TO_NUMBER=dict(reversed(item) for item in _BANDMAP)
 
-    def EraseMemory(self, antenna, band):
-        band_num = self._BAND_METER_TO_NUMBER[band.wavelength_meter]
+    def _EraseMemory(self, antenna, band_num):
         self._SendCommandNoResponse("EM%02d%d" % (band_num, antenna))
 
+    def EraseMemory(self, antenna, band):
+        self._EraseMemory(antenna,
+                          self._BAND_METER_TO_NUMBER[band.wavelength_meter])
+
     def EraseMemoryAllBands(self, antenna):
         for (band_num, _) in self._BANDMAP:
             self._EraseMemory(antenna, band_num)
@@ -0,0 +1,173 @@
+"""asyncio front end for the Elecraft drivers.
+
+pyserial only blocks, so each transaction runs on a worker thread.  The
+rig and the tuner are on separate ports and work at the same time: the
+tuner is set up while the rig changes frequency and read while the rig
+transmits.  A per-device lock keeps each port's commands in order.
+
+Instead of sleeping for fixed times, waits poll the tuner's status, TP,
+FLT, VSWR and F in one burst, until it says it is done, up to a
+timeout:
+
+    rig = elecraft_async.AsyncTransceiver(elecraft.Transceiver(port))
+    tuner = elecraft_async.AsyncTuner(elecraft.Tuner(port))
+    async with rig.KeyDown():
+        await tuner.StartFullTune()
+        done, status = await tuner.WaitForTune()
+"""
+
+import asyncio
+import contextlib
+import time
+
+
+class _AsyncDevice(object):
+    def __init__(self, device):
+        self.device = device
+        self._lock = asyncio.Lock()
+
+    async def _Run(self, fn, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+
+class AsyncTransceiver(_AsyncDevice):
+    """key_down_seconds adds up the time spent transmitting."""
+
+    def __init__(self, rig):
+        super(AsyncTransceiver, self).__init__(rig)
+        self.key_down_seconds = 0.
+
+    async def SetVfoA(self, frequency):
+        await self._Run(self.device.SetVfoA, frequency)
+
+    async def TuneToggle(self):
+        await self._Run(self.device.TuneToggle)
+
+    @contextlib.asynccontextmanager
+    async def KeyDown(self):
+        """Transmits (TUNE) for the duration of the block; the key-up is
+        sent even if the block fails or is cancelled.
+        """
+        await self.TuneToggle()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            await self.TuneToggle()
+            self.key_down_seconds += time.monotonic() - start
+
+
+class AsyncTuner(_AsyncDevice):
+    # Whether a measured frequency is the one asked for, given the
+    # KAT500 reports whole kHz.
+    FREQUENCY_TOLERANCE = 2e3
+
+    def __init__(self, tuner, poll_interval=0.020):
+        super(AsyncTuner, self).__init__(tuner)
+        self.poll_interval = poll_interval
+        self.polls = 0
+        self._last_measurement = None
+
+    async def Verify(self):
+        await self._Run(self.device.Verify)
+
+    async def ReadStatus(self, queries=None):
+        if queries is None:
+            return await self._Run(self.device.ReadStatus)
+        return await self._Run(self.device.ReadStatus, queries)
+
+    async def ClearFault(self):
+        await self._Run(self.device.ClearFault)
+
+    async def CancelTune(self):
+        await self._Run(self.device.CancelTune)
+
+    async def ClearMatch(self):
+        await self._Run(self.device.ClearMatch)
+
+    async def SetBypass(self, bypassed):
+        await self._Run(self.device.SetBypass, bypassed)
+
+    async def ReadMatchBits(self):
+        return await self._Run(self.device.ReadMatchBits)
+
+    async def SetMatchBits(self, l_bits, c_bits, side):
+        await self._Run(self.device.SetMatchBits, l_bits, c_bits, side)
+
+    async def StartFullTune(self):
+        await self._Run(self.device.StartFullTune)
+
+    async def SaveMemory(self, frequency=0):
+        await self._Run(self.device.SaveMemory, frequency)
+
+    async def ReadAntenna(self):
+        return await self._Run(self.device.ReadAntenna)
+
+    async def EraseMemory(self, antenna, band):
+        await self._Run(self.device.EraseMemory, antenna, band)
+
+    async def WaitFor(self, queries, done, timeout):
+        """Reads queries until done(status) or timeout seconds have
+        passed.  Replies that time out, while the tuner is busy, are
+        retried.  Returns (whether it got done, the last status or None).
+        """
+        deadline = time.monotonic() + timeout
+        status = None
+        while True:
+            try:
+                status = await self.ReadStatus(queries)
+                self.polls += 1
+                if done(status):
+                    return True, status
+            except TimeoutError:
+                pass
+            if time.monotonic() >= deadline:
+                return False, status
+            await asyncio.sleep(self.poll_interval)
+
+    async def ForceBypass(self, timeout=1.):
+        """Sets bypass until the tuner says it is bypassed."""
+        deadline = time.monotonic() + timeout
+        while True:
+            await self.SetBypass(True)
+            status = await self.ReadStatus(["BYP"])
+            if status.bypassed:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval)
+
+    async def Measure(self, frequency, timeout=1.):
+        """While the rig transmits on frequency, waits for the tuner to
+        have measured it: for its frequency counter to read frequency,
+        or a high SWR fault.  A reading identical to the last one
+        measured could be stale and is only taken on timeout.  Returns
+        WaitFor()'s (done, status).
+        """
+        def measured(status):
+            if status.fault == 4:
+                return True
+            reading = (status.frequency, status.vswr)
+            return (status.vswr > 0 and
+                    abs(status.frequency - frequency)
+                    <= self.FREQUENCY_TOLERANCE and
+                    reading != self._last_measurement)
+        done, status = await self.WaitFor(["FLT", "VSWR", "F"], measured,
+                                          timeout)
+        if status is not None:
+            self._last_measurement = (status.frequency, status.vswr)
+        return done, status
+
+    async def WaitForTune(self, timeout=10.):
+        """Waits for a full tune to finish: for TP to drop and for its
+        FT echo to have been read, so it cannot turn up later.
+        """
+        return await self.WaitFor(
+            ["TP", "FLT"],
+            lambda status: (not status.tuning and
+                            not self.device.tune_echo_pending), timeout)
+
+    async def WaitUntilReady(self, timeout=5.):
+        """Waits for the tuner to answer again, e.g. after EraseMemory."""
+        return await self.WaitFor(["TP"], lambda status: True, timeout)
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""A simulated K3 and KAT500 on a pair of pseudo-terminals, for trying
+the training scripts without keying a transmitter.
+
+    elecraft_simulator.py [--seed N]
+
+prints the rig and tuner device paths and serves them until Ctrl-C:
+
+    train_kat500.py /dev/pts/5 /dev/pts/6 30m
+
+The K3 understands FA (set and query, echoed), SWH16 (TUNE on/off) and
+TQ.  The KAT500 understands I, AN, BYP, L, C, SIDE, VSWR, F, FLT, FLTC,
+TP, FT, CT, SM and EM.  F with a frequency in kHz, while the rig is not
+transmitting, recalls the memory for it.  The antenna's bypass SWR and its best L/C
+setting vary smoothly with frequency.  An L/C setting other than the
+best one raises the SWR in proportion to how far off it is.
+
+Timing roughly follows the real tuner:
+- SWR and frequency readings need RF for a while.
+- A full tune takes one to two seconds of RF, and FT is echoed when it
+  is done.
+- EM keeps the tuner busy, and deaf, for two seconds.
+- After a second without serial activity the tuner sleeps, and the
+  character that wakes it is lost.
+"""
+
+import argparse
+import math
+import os
+import select
+import sys
+import threading
+import time
+import tty
+
+import bandplan
+
+CHARACTER_SECONDS = 10 / 38400.
+SETTLE_SECONDS = 0.050
+ERASE_SECONDS = 2.
+SLEEP_SECONDS = 1.
+FAULT_NO_MATCH = 1
+FAULT_HIGH_SWR = 4
+HIGH_SWR = 10.
+# Extra SWR per unit of L or C code away from the best setting.
+SWR_PER_CODE = 0.02
+
+
+def MemorySegment(frequency):
+    """The KAT500 memory segment holding frequency, as (width, index)."""
+    if frequency < 3e6:
+        width = 10e3
+    elif frequency < 26e6:
+        width = 20e3
+    elif frequency < 38e6:
+        width = 100e3
+    else:
+        width = 200e3
+    return width, int(frequency // width)
+
+
+class Antenna(object):
+    """A load whose bypass SWR and best L, C and side depend smoothly
+    on frequency.
+    """
+
+    def __init__(self, seed=0):
+        self._phase = 0.7 * seed
+
+    def BypassSWR(self, frequency):
+        x = frequency / 1.7e6 + self._phase
+        return 1.05 + 6. * (0.5 + 0.5 * math.sin(2 * math.pi * x)) ** 2
+
+    def BestMatch(self, frequency):
+        x = frequency / 1.3e6 + self._phase
+        l = int(round(128 + 100 * math.sin(x)))
+        c = int(round(128 + 100 * math.cos(1.3 * x)))
+        side = "T" if math.sin(0.5 * x) >= 0 else "A"
+        return l, c, side
+
+    def SWR(self, frequency, l, c, side, bypassed):
+        bypass_swr = self.BypassSWR(frequency)
+        if bypassed or (l == 0 and c == 0):
+            return bypass_swr
+        best_l, best_c, best_side = self.BestMatch(frequency)
+        swr = 1.02 + SWR_PER_CODE * (abs(l - best_l) + abs(c - best_c))
+        if side != best_side:
+            swr += 2.
+        return min(swr, 99.)
+
+
+class Bench(object):
+    """What the rig and tuner share: the frequency and whether the rig
+    is transmitting.
+    """
+
+    def __init__(self):
+        self.frequency = 14e6
+        self.keyed_since = None
+
+    def RFSeconds(self, now):
+        return 0. if self.keyed_since is None else now - self.keyed_since
+
+
+class _Device(object):
+    def __init__(self, bench):
+        self.bench = bench
+        self._buffer = b""
+        self._replies = []
+
+    def Feed(self, data, now):
+        """Takes bytes from the host; returns nothing, replies are
+        collected by Due().
+        """
+        self._buffer += data
+        while b";" in self._buffer:
+            command, self._buffer = self._buffer.split(b";", 1)
+            self.Execute(command.decode("ascii", "replace"), now)
+
+    def Reply(self, text, now, delay=0.):
+        data = (text + ";").encode("ascii")
+        self._replies.append((now + delay + len(data) * CHARACTER_SECONDS,
+                              data))
+
+    def Tick(self, now):
+        pass
+
+    def Due(self, now):
+        due = [data for (when, data) in self._replies if when <= now]
+        self._replies = [(when, data) for (when, data) in self._replies
+                         if when > now]
+        return b"".join(due)
+
+
+class SimulatedK3(_Device):
+    def Execute(self, command, now):
+        if command.startswith("FA"):
+            if len(command) > 2:
+                self.bench.frequency = float(int(command[2:]))
+            self.Reply("FA%011d" % self.bench.frequency, now)
+        elif command == "SWH16":
+            self.bench.keyed_since = (
+                now if self.bench.keyed_since is None else None)
+        elif command == "TQ":
+            self.Reply("TQ%d" % (self.bench.keyed_since is not None), now)
+
+
+class SimulatedKAT500(_Device):
+    def __init__(self, bench, antenna=None):
+        super(SimulatedKAT500, self).__init__(bench)
+        self.antennas = {1: antenna or Antenna(), 2: Antenna(1),
+                         3: Antenna(2)}
+        self.antenna = 1
+        self.bypassed = True
+        self.l = 0
+        self.c = 0
+        self.side = "T"
+        self.fault = 0
+        self.vswr = 0.
+        self.frequency = 0.
+        self.tune_done_at = None
+        self.busy_until = 0.
+        self.last_activity = 0.
+        self.asleep = False
+        # (antenna, band number): {segment index: (l, c, side, bypassed)}
+        self.memories = {}
+        self.cycles = 0
+        self.tune_seconds = 0.
+
+    def Feed(self, data, now):
+        if now < self.busy_until:
+            return
+        if self.asleep:
+            self.asleep = False
+            data = data[1:]
+        self.last_activity = now
+        super(SimulatedKAT500, self).Feed(data, now)
+
+    def _Load(self):
+        return self.antennas[self.antenna]
+
+    def _Measure(self, now):
+        if self.bench.RFSeconds(now) < SETTLE_SECONDS:
+            return
+        self.frequency = self.bench.frequency
+        self.vswr = self._Load().SWR(self.frequency, self.l, self.c,
+                                     self.side, self.bypassed)
+        if self.bypassed and self.vswr > HIGH_SWR:
+            self.fault = FAULT_HIGH_SWR
+
+    def _TuneSeconds(self):
+        x = self.bench.frequency / 0.37e6
+        return 1. + 0.5 * (1 + math.sin(x))
+
+    def Tick(self, now):
+        self._Measure(now)
+        if self.tune_done_at is not None:
+            if self.bench.keyed_since is None:
+                self._FinishTune(now, FAULT_NO_MATCH)
+            elif now >= self.tune_done_at:
+                self._FinishTune(now, 0)
+        busy = (self.tune_done_at is not None or now < self.busy_until or
+                self.bench.keyed_since is not None)
+        if busy:
+            self.last_activity = now
+        elif now - self.last_activity > SLEEP_SECONDS:
+            self.asleep = True
+
+    def _FinishTune(self, now, fault):
+        self.tune_seconds += now - (self.tune_done_at - self._TuneSeconds())
+        self.tune_done_at = None
+        self.fault = fault
+        if fault == 0:
+            if self._Load().BypassSWR(self.bench.frequency) > HIGH_SWR:
+                self.fault = FAULT_NO_MATCH
+            else:
+                self.l, self.c, self.side = self._Load().BestMatch(
+                    self.bench.frequency)
+                self.bypassed = False
+        self.Reply("FT", now)
+
+    def _Band(self, frequency):
+        band = bandplan.PLAN.find(frequency)
+        meters = [160, 80, 60, 40, 30, 20, 17, 15, 12, 10, 6]
+        return meters.index(band.wavelength_meter) if band else None
+
+    def _Recall(self, frequency):
+        """Sets the relays from the memory for frequency, or bypasses."""
+        memory = self.memories.get((self.antenna, self._Band(frequency)),
+                                   {}).get(MemorySegment(frequency)[1])
+        if memory is None:
+            self.l, self.c, self.bypassed = 0, 0, True
+        else:
+            self.l, self.c, self.side, self.bypassed = memory
+
+    def Execute(self, command, now):
+        if command == "":
+            self.Reply("", now)
+        elif command == "I":
+            self.Reply("KAT500", now)
+        elif command == "AN":
+            self.Reply("AN%d" % self.antenna, now)
+        elif command.startswith("AN"):
+            self.antenna = int(command[2:])
+        elif command == "BYP":
+            self.Reply("BYP%s" % ("B" if self.bypassed else "N"), now)
+        elif command in ("BYPB", "BYPN"):
+            self.bypassed = command == "BYPB"
+        elif command == "SIDE":
+            self.Reply("SIDE%s" % self.side, now)
+        elif command in ("SIDET", "SIDEA"):
+            self.side = command[-1]
+        elif command in ("L", "C"):
+            self.Reply("%s%02X" % (command, getattr(self, command.lower())),
+                       now)
+        elif command[:1] in ("L", "C") and len(command) == 3:
+            setattr(self, command[0].lower(), int(command[1:], 16))
+        elif command == "VSWR":
+            self.Reply("VSWR%.2f" % self.vswr, now)
+        elif command == "F":
+            self.Reply("F%d" % (self.frequency / 1e3), now)
+        elif command[1:].isdigit() and command[0] == "F":
+            if self.bench.keyed_since is None:
+                self.frequency = int(command[1:]) * 1e3
+                self._Recall(self.frequency)
+        elif command == "FLT":
+            self.Reply("FLT%d" % self.fault, now)
+        elif command == "FLTC":
+            self.fault = 0
+        elif command == "TP":
+            self.Reply("TP%d" % (self.tune_done_at is not None), now)
+        elif command == "FT":
+            if self.bench.keyed_since is None:
+                self.fault = FAULT_NO_MATCH
+                self.Reply("FT", now)
+            else:
+                self.cycles += 1
+                self.tune_done_at = now + self._TuneSeconds()
+        elif command == "CT":
+            if self.tune_done_at is not None:
+                self._FinishTune(now, FAULT_NO_MATCH)
+        elif command.startswith("SM"):
+            frequency = float(command[2:] or 0) or self.frequency
+            band = self._Band(frequency)
+            if band is not None:
+                self.memories.setdefault((self.antenna, band), {})[
+                    MemorySegment(frequency)[1]] = (
+                        self.l, self.c, self.side, self.bypassed)
+        elif command.startswith("EM") and len(command) == 5:
+            self.memories.pop((int(command[4]), int(command[2:4])), None)
+            self.busy_until = now + ERASE_SECONDS
+
+
+class Simulator(object):
+    """Serves a SimulatedK3 and a SimulatedKAT500 on two pseudo-terminals
+    from a background thread.
+    """
+
+    def __init__(self, seed=0):
+        self.bench = Bench()
+        self.rig = SimulatedK3(self.bench)
+        self.tuner = SimulatedKAT500(self.bench, Antenna(seed))
+        self._ptys = {}
+        self.paths = []
+        for device in (self.rig, self.tuner):
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            self._ptys[master] = (device, slave)
+            self.paths.append(os.ttyname(slave))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _Serve(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select(list(self._ptys), [], [], 0.002)
+            now = time.monotonic()
+            for master, (device, _) in self._ptys.items():
+                if master in readable:
+                    device.Feed(os.read(master, 4096), now)
+                device.Tick(now)
+                data = device.Due(now)
+                if data:
+                    os.write(master, data)
+
+    def Start(self):
+        self._thread = threading.Thread(target=self._Serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def Stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for master, (_, slave) in self._ptys.items():
+            os.close(master)
+            os.close(slave)
+
+    def __enter__(self):
+        return self.Start()
+
+    def __exit__(self, *exc_info):
+        self.Stop()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Serve a simulated K3 and KAT500 on pseudo-terminals.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="picks the antenna")
+    args = parser.parse_args(argv[1:])
+    with Simulator(args.seed) as simulator:
+        print("rig %s tuner %s" % tuple(simulator.paths))
+        sys.stdout.flush()
+        try:
+            while True:
+                time.sleep(1.)
+        except KeyboardInterrupt:
+            pass
+        print("%d tune cycles, %.1f s tuning" % (simulator.tuner.cycles,
+                                                 simulator.tuner.tune_seconds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Snapshots and restores the KAT500's memories, to copy a trained
+antenna installation to other tuners without transmitting.
+
+    kat500_memory.py snapshot TUNER_PORT FILE [BAND...] [--antennas N...]
+    kat500_memory.py diff TUNER_PORT FILE
+    kat500_memory.py restore TUNER_PORT FILE [--all]
+
+snapshot reads the memory of every segment train_kat500.py trains, for
+the bands given or all of them, by setting the tuner to each segment's
+frequency and reading back what it recalls.  FILE is CSV if it ends in
+.csv, otherwise a compact binary file of fixed-size records.
+
+diff prints, per antenna and band, the memories in FILE that the tuner
+holds differently.  restore prints the same diff, writes only those
+memories, in bursts with one handshake each, and reads them back to
+verify; it exits with 1 if any did not take.  An empty memory reads
+the same as one saved bypassed, so --all writes every memory in FILE.
+"""
+
+import argparse
+import collections
+import csv
+import struct
+import sys
+import time
+
+import serial
+
+import bandplan
+import elecraft
+import train_kat500
+
+# Binary snapshot: MAGIC, then per memory antenna, frequency [Hz], L
+# bits, C bits, side and bypassed.
+MAGIC = b"KAT500M\x01"
+_RECORD = struct.Struct("<BIBBc?")
+_CSV_FIELDS = ["antenna", "band", "frequency", "l_bits", "c_bits", "side",
+               "bypassed"]
+
+# A memory of one antenna.
+Entry = collections.namedtuple("Entry", ["antenna", "memory"])
+
+
+def Save(path, entries):
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(_CSV_FIELDS)
+            for antenna, memory in entries:
+                writer.writerow([
+                    antenna, bandplan.PLAN.find(memory.frequency).name,
+                    "%d" % memory.frequency, "%02X" % memory.l_bits,
+                    "%02X" % memory.c_bits, memory.side,
+                    int(memory.bypassed)])
+    else:
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            for antenna, memory in entries:
+                f.write(_RECORD.pack(antenna, int(memory.frequency),
+                                     memory.l_bits, memory.c_bits,
+                                     memory.side.encode("ascii"),
+                                     memory.bypassed))
+
+
+def Load(path):
+    """Returns the [Entry] saved in path."""
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            return [Entry(int(row["antenna"]), elecraft.Memory(
+                        float(row["frequency"]), int(row["l_bits"], 16),
+                        int(row["c_bits"], 16), row["side"],
+                        bool(int(row["bypassed"]))))
+                    for row in csv.DictReader(f)]
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError("%s is not a KAT500 memory snapshot" % path)
+    return [Entry(antenna, elecraft.Memory(float(frequency), l_bits, c_bits,
+                                           side.decode("ascii"), bypassed))
+            for (antenna, frequency, l_bits, c_bits, side, bypassed)
+            in _RECORD.iter_unpack(data[len(MAGIC):])]
+
+
+def ByBand(entries):
+    """Groups entries as {(antenna, band name): [Memory]}, in order."""
+    groups = collections.OrderedDict()
+    for antenna, memory in entries:
+        band = bandplan.PLAN.find(memory.frequency).name
+        groups.setdefault((antenna, band), []).append(memory)
+    return groups
+
+
+def Same(a, b):
+    """Whether memories a and b tune the same.  L, C and side do not
+    matter when bypassed.
+    """
+    if a.bypassed or b.bypassed:
+        return a.bypassed == b.bypassed
+    return (a.l_bits, a.c_bits, a.side) == (b.l_bits, b.c_bits, b.side)
+
+
+def _Describe(memory):
+    if memory.bypassed:
+        return "bypassed"
+    return "L%02X C%02X %s" % (memory.l_bits, memory.c_bits, memory.side)
+
+
+def Diff(tuner, entries):
+    """Reads the tuner's memories for entries and prints, per antenna
+    and band, those that differ.  Returns the [Entry] that differ.
+    """
+    differ = []
+    for (antenna, band), wanted in ByBand(entries).items():
+        held = tuner.ReadMemories(antenna, [m.frequency for m in wanted])
+        changes = [(w, h) for (w, h) in zip(wanted, held) if not Same(w, h)]
+        print("antenna %d %-4s %3d memories, %3d differ"
+              % (antenna, band, len(wanted), len(changes)))
+        for w, h in changes:
+            print("  %10.1f kHz  file %-12s tuner %s"
+                  % (w.frequency / 1e3, _Describe(w), _Describe(h)))
+        differ.extend(Entry(antenna, w) for (w, _) in changes)
+    return differ
+
+
+def Snapshot(tuner, antennas, bands):
+    return [Entry(antenna, memory)
+            for antenna in antennas
+            for band in bands
+            for memory in tuner.ReadMemories(
+                antenna, train_kat500.TrainingFrequencies(band))]
+
+
+def Restore(tuner, entries, everything=False):
+    """Writes the memories in entries that the tuner holds differently,
+    or all of them with everything, and verifies them.  Returns the
+    number that did not verify.
+    """
+    differ = Diff(tuner, entries)
+    if everything:
+        differ = entries
+    if not differ:
+        return 0
+    start = time.monotonic()
+    for (antenna, _), memories in ByBand(differ).items():
+        tuner.WriteMemories(antenna, memories)
+    print("wrote %d memories in %.1f s" % (len(differ),
+                                           time.monotonic() - start))
+    print("verifying")
+    failed = Diff(tuner, differ)
+    return len(failed)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Snapshot, diff and restore KAT500 memories.")
+    parser.add_argument("action", choices=["snapshot", "diff", "restore"])
+    parser.add_argument("port")
+    parser.add_argument("file")
+    parser.add_argument("bands", nargs="*",
+                        help="bands to snapshot, by default all")
+    parser.add_argument("--antennas", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--all", action="store_true",
+                        help="restore every memory, not just those that "
+                        "differ")
+    args = parser.parse_args(argv[1:])
+    bands = ([bandplan.PLAN[name] for name in args.bands] or
+             list(bandplan.PLAN))
+
+    with serial.Serial(args.port, 38400) as tuner_port:
+        tuner = elecraft.Tuner(tuner_port)
+        tuner.Verify()
+        start = time.monotonic()
+        if args.action == "snapshot":
+            entries = Snapshot(tuner, args.antennas, bands)
+            Save(args.file, entries)
+            print("%d memories in %.1f s" % (len(entries),
+                                             time.monotonic() - start))
+            return 0
+        entries = Load(args.file)
+        if args.action == "diff":
+            Diff(tuner, entries)
+            return 0
+        failed = Restore(tuner, entries, args.all)
+        print("%.1f s, %d memories did not verify"
+              % (time.monotonic() - start, failed))
+        return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,11 +1,11 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 import math
 import time
 import serial
 import sys
 
-import band_plan
+import bandplan
 import elecraft
 
 ONE_KHZ = 1e3
@@ -33,7 +33,7 @@ def ToggleTune(rig, on_time):
 
 def ForceBypass(tuner):
     # For some reason we need this loop ...
-    for n in xrange(10):
+    for n in range(10):
         tuner.SetBypass(True)
         if tuner.ReadBypass():
             return
@@ -51,14 +51,15 @@ def TuneRigAt(rig, tuner, frequency):
     time.sleep(0.100)
     ToggleTune(rig, 1.)
 
-    fault = tuner.GetFaultCode()
+    status = tuner.ReadStatus(["FLT", "VSWR", "F"])
+    fault = status.fault
     assert fault in [0, 4], "Unexpected fault code %d" % fault
-    bypassed_vswr = tuner.ReadVSWRInBypass() if fault == 0 else 99.99
+    bypassed_vswr = status.vswr if fault == 0 else 99.99
     tuner.ClearFault()
-        
-    frequency2 = tuner.ReadFrequency()
+
+    frequency2 = status.frequency
     if (math.fabs(frequency - frequency2) / frequency) > 0.05:
-        print "Huh?", frequency, frequency2
+        print("Huh?", frequency, frequency2)
 
     if bypassed_vswr > OK_SWR:
         xmit_on = False
@@ -69,66 +70,89 @@ def TuneRigAt(rig, tuner, frequency):
         finally:
             if xmit_on:
                 rig.TuneToggle()
-        tuning = tuner.ReadTunePoll()
-        if tuning:
-            print "Oops ... still tuning?"
+        status = tuner.ReadStatus()
+        if status.tuning:
+            print("Oops ... still tuning?")
             tuner.CancelTune()
-        fault = tuner.GetFaultCode()
+            status = tuner.ReadStatus()
+        fault = status.fault
         assert fault in [0, 1, 4], "Unexpected fault code %d" % fault
         if fault == 0:
-            bypassed = tuner.ReadBypass()
-            match = tuner.ReadMatch()
-            vswr = tuner.ReadVSWR()
-            print "%10.0f %5.2f  %-10s %5.2f %6.0f %6.0f %s" % (
-                frequency / 1e3, bypassed_vswr,
-                ("matched" if not bypassed else "nomatch"), vswr,
-                match[0] * 1e9, match[1] * 1e12, match[2])
+            PrintMatch(frequency, bypassed_vswr, status)
         else:
             tuner.ClearMatch()
             tuner.SetBypass(True)
-            print "%10.0f %5.2f  %-10s" % (
-                frequency / 1e3, bypassed_vswr, "failed (%d)" % fault_code)
+            PrintNoMatch(frequency, bypassed_vswr, "failed (%d)" % fault)
     else:
         assert fault == 0, "Unexpected fault code %d" % fault
         tuner.ClearMatch()
         tuner.SetBypass(True)
-        print "%10.0f %5.2f  %-10s" % (
-            frequency / 1e3, bypassed_vswr, "bypassed")
+        PrintNoMatch(frequency, bypassed_vswr, "bypassed")
     tuner.SaveMemory()
 
+def PrintMatch(frequency, bypassed_vswr, status):
+    print("%10.0f %5.2f  %-10s %5.2f %6.0f %6.0f %s" % (
+        frequency / 1e3, bypassed_vswr,
+        ("matched" if not status.bypassed else "nomatch"),
+        status.vswr, status.inductance * 1e9,
+        status.capacitance * 1e12, status.side))
+
+def PrintNoMatch(frequency, bypassed_vswr, what):
+    print("%10.0f %5.2f  %-10s" % (frequency / 1e3, bypassed_vswr, what))
+
+def TrainingFrequencies(band):
+    """The frequencies to tune at: the channels of a channelized band,
+    otherwise the middle of each KAT500 memory segment."""
+    if band.is_channelized:
+        # Could skip frequencies that are within a step.
+        return list(band.channels)
+    frequencies = []
+    start_frequency = band.start_frequency
+    stop_frequency = band.stop_frequency - ONE_KHZ
+    step = KAT500MemorySegmentWidth(start_frequency)
+    frequency = start_frequency + int(step/2.)
+    while frequency <= stop_frequency:
+        frequencies.append(frequency)
+        frequency += step
+    return frequencies
+
+def PrintHeader(band):
+    print("* %s *" % band.name)
+    print("       kHz byswr  status       swr     nH     pF A/T")
+
 def TrainKAT500OnBand(rig, tuner, band):
-    print "* %s *" % band.name
-    print "       kHz byswr  status       swr     nH     pF A/T"
+    PrintHeader(band)
+    start = time.monotonic()
     antenna = tuner.ReadAntenna()
     tuner.EraseMemory(antenna, band)
     time.sleep(3.)               # a couple of seconds say the manual
-    if band.frequency_range.is_discrete:
-        # Could skip frequencies that are within a step.
-        for center in band.frequency_range.discrete_values:
-            TuneRigAt(rig, tuner, center)
-    else:
-        start_frequency = band.frequency_range.min_inclusive
-        stop_frequency = band.frequency_range.max_inclusive - ONE_KHZ
-        step = KAT500MemorySegmentWidth(start_frequency)
-        frequency = start_frequency + int(step/2.)
-        while frequency <= stop_frequency:
-            TuneRigAt(rig, tuner, frequency)
-            frequency += step
-    print
-    
+    for frequency in TrainingFrequencies(band):
+        TuneRigAt(rig, tuner, frequency)
+    seconds = time.monotonic() - start
+    print()
+    return seconds
 
 def TrainKAT500OnBands(rig, tuner, bands):
-    for band in bands:
-        TrainKAT500OnBand(rig, tuner, band)
+    """Returns [(band name, seconds)]."""
+    return [(band.name, TrainKAT500OnBand(rig, tuner, band))
+            for band in bands]
+
+def PrintTimes(times):
+    for (name, seconds) in times:
+        print("%-4s %6.1f s" % (name, seconds))
+    print("total %5.1f s" % sum(seconds for (_, seconds) in times))
 
 def main(argv):
-    bands = [band_plan.FindBandByName(name) for name in argv[3:]]
+    bands = [bandplan.PLAN[name] for name in argv[3:]]
     with serial.Serial(argv[1], 38400) as rig_port:
         rig = elecraft.Transceiver(rig_port)
         with serial.Serial(argv[2], 38400) as tuner_port:
             tuner = elecraft.Tuner(tuner_port)
             tuner.Verify()
-            TrainKAT500OnBands(rig, tuner, bands)
+            PrintTimes(TrainKAT500OnBands(rig, tuner, bands))
+            print("tuner: %(wakeups)d wake-ups taking %(wakeup_seconds).1f s, "
+                  "%(wakeups_skipped)d skipped, %(resends)d resends"
+                  % tuner.WakeUpStats())
     
 if __name__ == "__main__":
     main(sys.argv)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Trains the KAT500 like train_kat500.py, keying the rig as little as
+possible.
+
+    train_kat500_adaptive.py RIG_PORT TUNER_PORT BAND...
+
+Each band is trained in two passes over the same segments:
+
+1. A survey measures every segment's SWR in bypass, with the rig keyed
+   only until the tuner has a reading.  Segments under OK_SWR are
+   saved as bypassed right away.  Segments that give no reading are
+   skipped.
+2. Each remaining segment first tries the L/C setting of the segment
+   before it, if that one was solved.  If that measures under OK_SWR
+   it is saved as it is.  Otherwise, or with no neighbour to try, the
+   segment gets a full tune.
+
+Prints the table of train_kat500.py with the action per segment.  Then
+it gives the full tunes and transmit time against train_kat500.py,
+which keys 1 s per segment plus a full tune wherever the bypass SWR is
+over OK_SWR.  Runs against elecraft_simulator.py like against the
+real thing.
+"""
+
+import asyncio
+import collections
+import sys
+import time
+
+import serial
+
+import bandplan
+import elecraft
+import elecraft_async
+import train_kat500
+import train_kat500_async
+
+OK_SWR = train_kat500.OK_SWR
+# How long train_kat500.py keys the rig to measure a segment in bypass.
+SURVEY_SECONDS = 1.
+
+# One trained segment.  action is "bypassed", "reused", "tuned",
+# "failed" or "skipped"; match the (L bits, C bits, side) saved, None
+# if bypassed.  bypass_vswr is None if skipped.
+Segment = collections.namedtuple(
+    "Segment", ["frequency", "bypass_vswr", "action", "vswr", "match"])
+
+
+async def Survey(rig, tuner, frequency):
+    """Measures frequency in bypass, saving it as bypassed if the SWR is
+    under OK_SWR.  Returns its bypass SWR, or None if the tuner gave no
+    reading.
+    """
+    await asyncio.gather(rig.SetVfoA(frequency),
+                         train_kat500_async.PrepareTuner(tuner))
+    measured, status = await train_kat500_async.KeyAndMeasure(
+        rig, tuner, frequency)
+    if status is None:
+        return None
+    fault = status.fault
+    assert fault in [0, 4], "Unexpected fault code %d" % fault
+    await tuner.ClearFault()
+    if not measured:
+        print("Huh?", frequency, status.frequency)
+    bypass_vswr = status.vswr if fault == 0 else 99.99
+    if bypass_vswr <= OK_SWR:
+        await tuner.SaveMemory()
+    return bypass_vswr
+
+
+async def TryMatch(rig, tuner, frequency, match):
+    """Sets match and measures it.  Returns the SWR, or None if the tuner
+    gave no reading.
+    """
+    await asyncio.gather(rig.SetVfoA(frequency), tuner.SetMatchBits(*match))
+    _, status = await train_kat500_async.KeyAndMeasure(rig, tuner, frequency)
+    await tuner.ClearFault()
+    if status is None:
+        return None
+    return status.vswr if status.fault == 0 else 99.99
+
+
+async def FullTune(rig, tuner, frequency):
+    """Full tune at frequency.  Returns (status, key-down seconds)."""
+    await asyncio.gather(rig.SetVfoA(frequency),
+                         train_kat500_async.PrepareTuner(tuner))
+    start = time.monotonic()
+    async with rig.KeyDown():
+        await tuner.StartFullTune()
+        done, status = await tuner.WaitForTune()
+    seconds = time.monotonic() - start
+    if not done:
+        print("Oops ... still tuning?")
+        await tuner.CancelTune()
+    return await tuner.ReadStatus(), seconds
+
+
+async def Solve(rig, tuner, frequency, bypass_vswr, neighbour):
+    """Saves a match for a segment that needs one: neighbour's if it is
+    good enough here, otherwise a full tune's.  Returns (Segment, full
+    tune key-down seconds or None).
+    """
+    if neighbour is not None:
+        vswr = await TryMatch(rig, tuner, frequency, neighbour)
+        if vswr is not None and vswr <= OK_SWR:
+            await tuner.SaveMemory()
+            return Segment(frequency, bypass_vswr, "reused", vswr,
+                           neighbour), None
+    status, seconds = await FullTune(rig, tuner, frequency)
+    assert status.fault in [0, 1, 4], \
+        "Unexpected fault code %d" % status.fault
+    if status.fault != 0:
+        await tuner.ClearMatch()
+        await tuner.SetBypass(True)
+        await tuner.SaveMemory()
+        return Segment(frequency, bypass_vswr, "failed", None, None), seconds
+    match = await tuner.ReadMatchBits()
+    await tuner.SaveMemory()
+    return Segment(frequency, bypass_vswr, "tuned", status.vswr,
+                   match), seconds
+
+
+def PrintSegment(segment):
+    if segment.bypass_vswr is None:
+        print("%10.0f %5s  %-10s" % (segment.frequency / 1e3, "",
+                                     segment.action))
+    elif segment.match is None:
+        print("%10.0f %5.2f  %-10s" % (segment.frequency / 1e3,
+                                       segment.bypass_vswr, segment.action))
+    else:
+        l_bits, c_bits, side = segment.match
+        print("%10.0f %5.2f  %-10s %5.2f %6.0f %6.0f %s" % (
+            segment.frequency / 1e3, segment.bypass_vswr, segment.action,
+            segment.vswr,
+            elecraft.Tuner._ComputeLC(l_bits, elecraft.Tuner._Ls) * 1e9,
+            elecraft.Tuner._ComputeLC(c_bits, elecraft.Tuner._Cs) * 1e12,
+            side))
+
+
+async def TrainKAT500OnBand(rig, tuner, band):
+    """Returns the band's report, a dict."""
+    train_kat500.PrintHeader(band)
+    start = time.monotonic()
+    key_down_start = rig.key_down_seconds
+    antenna = await tuner.ReadAntenna()
+    await tuner.EraseMemory(antenna, band)
+    ready, _ = await tuner.WaitUntilReady()
+    assert ready, "The tuner did not come back after erasing memory"
+
+    frequencies = train_kat500.TrainingFrequencies(band)
+    survey = [await Survey(rig, tuner, frequency)
+              for frequency in frequencies]
+
+    segments = []
+    tune_seconds = []
+    for frequency, bypass_vswr in zip(frequencies, survey):
+        if bypass_vswr is None:
+            segment = Segment(frequency, None, "skipped", None, None)
+        elif bypass_vswr <= OK_SWR:
+            segment = Segment(frequency, bypass_vswr, "bypassed", None, None)
+        else:
+            neighbour = segments[-1].match if segments else None
+            segment, seconds = await Solve(rig, tuner, frequency,
+                                           bypass_vswr, neighbour)
+            if seconds is not None:
+                tune_seconds.append(seconds)
+        PrintSegment(segment)
+        segments.append(segment)
+    print()
+
+    actions = collections.Counter(segment.action for segment in segments)
+    needed = sum(1 for vswr in survey if vswr is not None and vswr > OK_SWR)
+    return {"band": band.name, "segments": len(segments),
+            "actions": actions, "full_tunes": len(tune_seconds),
+            "baseline_full_tunes": needed,
+            "tune_seconds": tune_seconds,
+            "transmit_seconds": rig.key_down_seconds - key_down_start,
+            "seconds": time.monotonic() - start}
+
+
+def PrintReport(reports):
+    """Prints the full tunes and transmit time saved per band against
+    train_kat500.py.  Its full tunes are estimated to take as long as
+    the ones done here, or as the mean over all bands for a band where
+    none were.
+    """
+    all_tunes = [s for report in reports for s in report["tune_seconds"]]
+    mean_tune = sum(all_tunes) / len(all_tunes) if all_tunes else None
+    print("band segs bypass reused tuned failed skipped  full tunes   "
+          "transmit s  saved s  time s")
+    for report in reports:
+        actions = report["actions"]
+        tunes = report["tune_seconds"]
+        mean = sum(tunes) / len(tunes) if tunes else mean_tune
+        baseline = report["segments"] * SURVEY_SECONDS
+        if report["baseline_full_tunes"]:
+            baseline += report["baseline_full_tunes"] * (mean or 0.)
+        print("%-4s %4d %6d %6d %5d %6d %7d  %3d of %3d   %10.1f  %7.1f  "
+              "%6.1f"
+              % (report["band"], report["segments"], actions["bypassed"],
+                 actions["reused"], actions["tuned"], actions["failed"],
+                 actions["skipped"], report["full_tunes"], report["baseline_full_tunes"],
+                 report["transmit_seconds"],
+                 baseline - report["transmit_seconds"], report["seconds"]))
+
+
+async def TrainKAT500OnBands(rig, tuner, bands):
+    await tuner.Verify()
+    return [await TrainKAT500OnBand(rig, tuner, band) for band in bands]
+
+
+def main(argv):
+    bands = [bandplan.PLAN[name] for name in argv[3:]]
+    with serial.Serial(argv[1], 38400) as rig_port:
+        rig = elecraft_async.AsyncTransceiver(elecraft.Transceiver(
+            rig_port, reply_timeout=train_kat500_async.REPLY_TIMEOUT))
+        with serial.Serial(argv[2], 38400) as tuner_port:
+            tuner = elecraft_async.AsyncTuner(elecraft.Tuner(
+                tuner_port, reply_timeout=train_kat500_async.REPLY_TIMEOUT))
+            reports = asyncio.run(TrainKAT500OnBands(rig, tuner, bands))
+            PrintReport(reports)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""train_kat500.py with the rig and tuner driven concurrently.
+
+    train_kat500_async.py RIG_PORT TUNER_PORT BAND...
+
+Trains the same segments and prints the same table as train_kat500.py.
+The tuner is cleared and bypassed while the rig changes frequency.
+Instead of fixed sleeps it waits for the tuner's status: for its
+frequency counter to catch up during the bypass SWR measurement, for
+TP to drop after a full tune, and for it to answer again after
+erasing memory.  Prints the time per band, to compare with
+train_kat500.py.
+"""
+
+import asyncio
+import sys
+import time
+
+import serial
+
+import bandplan
+import elecraft
+import elecraft_async
+import train_kat500
+
+# Replies take milliseconds; anything slower means the tuner is busy.
+REPLY_TIMEOUT = 0.5
+# Times to key down for a bypass SWR reading before skipping a frequency.
+MEASURE_ATTEMPTS = 3
+
+
+async def PrepareTuner(tuner):
+    await tuner.ClearFault()
+    await tuner.CancelTune()
+    await tuner.ClearMatch()
+    assert await tuner.ForceBypass(), "Failed to set bypass"
+
+
+async def KeyAndMeasure(rig, tuner, frequency):
+    """Keys the rig until the tuner has measured frequency, up to
+    MEASURE_ATTEMPTS times.  Returns Measure()'s (done, status), with
+    status None if no reading came.
+    """
+    for _ in range(MEASURE_ATTEMPTS):
+        async with rig.KeyDown():
+            measured, status = await tuner.Measure(frequency)
+        if status is not None:
+            break
+    return measured, status
+
+
+async def TuneRigAt(rig, tuner, frequency):
+    await asyncio.gather(rig.SetVfoA(frequency), PrepareTuner(tuner))
+
+    measured, status = await KeyAndMeasure(rig, tuner, frequency)
+    if status is None:
+        # Every status read timed out; leave this segment's memory alone.
+        print("%10.0f %5s  %-10s" % (frequency / 1e3, "", "no reading"))
+        return
+    fault = status.fault
+    assert fault in [0, 4], "Unexpected fault code %d" % fault
+    bypassed_vswr = status.vswr if fault == 0 else 99.99
+    await tuner.ClearFault()
+    if not measured:
+        print("Huh?", frequency, status.frequency)
+
+    if bypassed_vswr > train_kat500.OK_SWR:
+        async with rig.KeyDown():
+            await tuner.StartFullTune()
+            done, status = await tuner.WaitForTune()
+        if not done:
+            print("Oops ... still tuning?")
+            await tuner.CancelTune()
+        status = await tuner.ReadStatus()
+        fault = status.fault
+        assert fault in [0, 1, 4], "Unexpected fault code %d" % fault
+        if fault == 0:
+            train_kat500.PrintMatch(frequency, bypassed_vswr, status)
+        else:
+            await tuner.ClearMatch()
+            await tuner.SetBypass(True)
+            train_kat500.PrintNoMatch(frequency, bypassed_vswr,
+                                      "failed (%d)" % fault)
+    else:
+        assert fault == 0, "Unexpected fault code %d" % fault
+        await tuner.ClearMatch()
+        await tuner.SetBypass(True)
+        train_kat500.PrintNoMatch(frequency, bypassed_vswr, "bypassed")
+    await tuner.SaveMemory()
+
+
+async def TrainKAT500OnBand(rig, tuner, band):
+    train_kat500.PrintHeader(band)
+    start = time.monotonic()
+    antenna = await tuner.ReadAntenna()
+    await tuner.EraseMemory(antenna, band)
+    ready, _ = await tuner.WaitUntilReady()
+    assert ready, "The tuner did not come back after erasing memory"
+    for frequency in train_kat500.TrainingFrequencies(band):
+        await TuneRigAt(rig, tuner, frequency)
+    seconds = time.monotonic() - start
+    print()
+    return seconds
+
+
+async def TrainKAT500OnBands(rig, tuner, bands):
+    """Returns [(band name, seconds)]."""
+    await tuner.Verify()
+    return [(band.name, await TrainKAT500OnBand(rig, tuner, band))
+            for band in bands]
+
+
+def main(argv):
+    bands = [bandplan.PLAN[name] for name in argv[3:]]
+    with serial.Serial(argv[1], 38400) as rig_port:
+        rig = elecraft_async.AsyncTransceiver(
+            elecraft.Transceiver(rig_port, reply_timeout=REPLY_TIMEOUT))
+        with serial.Serial(argv[2], 38400) as tuner_port:
+            tuner = elecraft_async.AsyncTuner(
+                elecraft.Tuner(tuner_port, reply_timeout=REPLY_TIMEOUT))
+            times = asyncio.run(TrainKAT500OnBands(rig, tuner, bands))
+            train_kat500.PrintTimes(times)
+            print("%.1f s transmitting, %d tuner polls"
+                  % (rig.key_down_seconds, tuner.polls))
+            print("tuner: %(wakeups)d wake-ups taking %(wakeup_seconds).1f s, "
+                  "%(wakeups_skipped)d skipped, %(resends)d resends"
+                  % tuner.device.WakeUpStats())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
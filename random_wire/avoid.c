@@ -7,6 +7,8 @@
 
 #include <stdio.h>
 
+#include "bands.h"
+
 /*
  * For a given frequency range, calculate the half wavelength range and print
  * it.  In addition, print up to 4th multiples of each range up to the length
@@ -48,18 +50,10 @@ void rw(double min_kHz, double max_kHz) {
  * Print ranges of half wavelengths for ecah ham band.
  */
 void printHalfwaves() {
+  unsigned int i;
 
-  rw(1800., 2000.);       /* 160m */
-  rw(3500., 4000.);       /* 80m */
-  rw(5330.5, 5405.);      /* 40m */
-  rw(7000., 7300.);       /* 40m */
-  rw(10100., 10150.);     /* 30m */
-  rw(14000., 14350.);     /* 20m */
-  rw(18068., 18168.);     /* 17m */
-  rw(21000., 21450.);     /* 15m */
-  rw(24890., 24990.);     /* 12m */
-  rw(28000., 29700.);     /* 10m */
-  rw(50000., 54000.);     /* 6m */
+  for (i = 0; i < N_BANDS; i++)
+    rw(bands[i].lo_kHz, bands[i].hi_kHz);
 }
 
 int main(int argc, char **argv) {